@@ -0,0 +1,262 @@
+"""
+JSON API (/api/v1) over the text_utils functions, for service-to-service callers.
+
+Every endpoint takes a JSON body {"text": ...} and returns compact JSON with
+character offsets. The spaCy endpoints also take "model" or "lang" to pick
+the pipeline (see models.select_model), and the NER endpoints take "ner_mode" to
+use the gazetteer (see gazetteer.py); /stats returns term statistics (see
+term_stats.py). displaCy/POS HTML is only rendered when the request opts in
+with "visualize": true (or ?visualize=1).
+"""
+import logging
+
+from flask import Blueprint, jsonify, request
+
+from entity_index import entity_index
+from gazetteer import resolve_ner_mode
+from models import pool_stats, select_model
+from serving import DeadlineExceeded, run_nlp
+from text_utils import (WORDCLOUD_FORMATS, compute_term_stats, compute_term_stats_many, extract_records, generate_wordcloud,
+                        index_texts, romanize_text)
+
+logger = logging.getLogger(__name__)
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def _payload():
+    return request.get_json(silent=True) or {}
+
+
+def _visualize(payload):
+    value = payload.get("visualize", request.args.get("visualize", False))
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+def _error(message, status):
+    return jsonify({"error": message}), status
+
+
+def request_model(text=None, payload=None):
+    """
+    Pick the spaCy pipeline for this request from its `model` / `lang`
+    parameters (JSON body, form or query string); see models.select_model.
+    Raises ValueError for an unknown model or language.
+    """
+    payload = _payload() if payload is None else payload
+
+    def param(name):
+        return payload.get(name) or request.form.get(name) or request.args.get(name)
+
+    return select_model(model=param("model"), lang=param("lang"), text=text)
+
+
+def request_ner_mode(payload=None):
+    """
+    The NER mode ('statistical', 'gazetteer' or 'hybrid') from the request's
+    `ner_mode` parameter; see gazetteer.py. Raises ValueError for an unknown mode.
+    """
+    payload = _payload() if payload is None else payload
+    return resolve_ner_mode(payload.get("ner_mode") or request.form.get("ner_mode") or request.args.get("ner_mode"))
+
+
+def _records_endpoint(task):
+    payload = _payload()
+    text = payload.get("text")
+    if not isinstance(text, str) or not text:
+        return _error("'text' must be a non-empty string.", 400)
+
+    try:
+        model = request_model(text, payload)
+        options = {'ner_mode': request_ner_mode(payload)} if task == 'ner' else {}
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    logger.debug("API %s request for text of length: %d (model %s)", task, len(text), model)
+    result = run_nlp(extract_records, text, task, visualize=_visualize(payload), model=model, **options)
+    if result is None:
+        return _error("Unable to process the text.", 500)
+    return jsonify(result)
+
+
+@api.route('/ner', methods=["POST"])
+def ner():
+    return _records_endpoint('ner')
+
+
+@api.route('/pos', methods=["POST"])
+def pos():
+    return _records_endpoint('pos')
+
+
+@api.route('/deps', methods=["POST"])
+def deps():
+    return _records_endpoint('deps')
+
+
+@api.route('/models')
+def models():
+    return jsonify(pool_stats())
+
+
+@api.route('/romanize', methods=["POST"])
+def romanize():
+    text = _payload().get("text")
+    if not isinstance(text, str) or not text:
+        return _error("'text' must be a non-empty string.", 400)
+
+    result = run_nlp(romanize_text, text)
+    return jsonify({
+        "romanized": result['romanized'],
+        "method": result['method'],
+        "detected_script": result['detected_script'],
+    })
+
+
+@api.route('/wordcloud', methods=["POST"])
+def wordcloud():
+    payload = _payload()
+    text = payload.get("text")
+    if not isinstance(text, str) or not text.strip():
+        return _error("'text' must be a non-empty string.", 400)
+
+    image_format = payload.get("format", "png")
+    if image_format not in WORDCLOUD_FORMATS:
+        return _error(f"'format' must be one of: {', '.join(WORDCLOUD_FORMATS)}.", 400)
+
+    try:
+        max_words = min(max(int(payload.get("max_words", 100)), 1), 1000)
+        width = min(max(int(payload.get("width", 800)), 100), 2000)
+        height = min(max(int(payload.get("height", 400)), 100), 2000)
+    except (TypeError, ValueError):
+        return _error("'max_words', 'width' and 'height' must be integers.", 400)
+
+    background_color = payload.get("background_color", "white")
+    try:
+        from PIL import ImageColor
+        ImageColor.getrgb(background_color)
+    except (AttributeError, TypeError, ValueError):
+        return _error("'background_color' must be a color name or #rrggbb value.", 400)
+
+    try:
+        model = request_model(text, payload)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    image = run_nlp(generate_wordcloud, text, max_words=max_words, background_color=background_color,
+                    width=width, height=height, image_format=image_format, model=model)
+    if image is None:
+        return _error("Error generating word cloud.", 500)
+
+    return jsonify({
+        "image": image,
+        "format": image_format,
+        "mime_type": WORDCLOUD_FORMATS[image_format][1],
+        "width": width,
+        "height": height,
+    })
+
+
+# {"text": ...} or {"texts": [...]} (counted as one corpus), optional "top" -> term statistics
+@api.route('/stats', methods=["POST"])
+def stats():
+    payload = _payload()
+    text = payload.get("text")
+    texts = payload.get("texts")
+    if texts is None:
+        if not isinstance(text, str) or not text.strip():
+            return _error("'text' must be a non-empty string (or 'texts' a list of them).", 400)
+    elif not isinstance(texts, list) or not texts or not all(isinstance(t, str) and t for t in texts):
+        return _error("'texts' must be a list of non-empty strings.", 400)
+
+    try:
+        top = min(max(int(payload.get("top", 20)), 1), 1000)
+    except (TypeError, ValueError):
+        return _error("'top' must be an integer.", 400)
+
+    try:
+        model = request_model(text if texts is None else texts[0], payload)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    if texts is None:
+        result = run_nlp(compute_term_stats, text, top=top, model=model)
+    else:
+        result = run_nlp(compute_term_stats_many, texts, top=top, model=model)
+    if result is None:
+        return _error("Unable to process the text.", 500)
+    return jsonify(result)
+
+
+# ============================================================================
+# ENTITY INDEX (entities of every document the NER path has processed)
+# ============================================================================
+
+def _int_arg(name, default, maximum):
+    try:
+        return max(1, min(int(request.args.get(name, default)), maximum))
+    except ValueError:
+        return default
+
+
+@api.route('/entities/top')
+def top_entities():
+    label = request.args.get("label") or None
+    return jsonify({"label": label, "entities": entity_index.top_entities(label=label, k=_int_arg("k", 10, 1000))})
+
+
+@api.route('/entities/search')
+def search_entities():
+    prefix = request.args.get("q", "")
+    if not prefix.strip():
+        return _error("'q' must be a non-empty prefix.", 400)
+    label = request.args.get("label") or None
+    return jsonify({"q": prefix, "entities": entity_index.search(prefix, label=label, limit=_int_arg("limit", 20, 1000))})
+
+
+@api.route('/entities/documents')
+def entity_documents():
+    source = request.args.get("source") or None
+    return jsonify({"documents": entity_index.documents(source=source, limit=_int_arg("limit", 100, 1000))})
+
+
+@api.route('/entities/documents/<int:doc_id>')
+def entity_document(doc_id):
+    document = entity_index.document(doc_id)
+    if document is None:
+        return _error("Unknown document id.", 404)
+    return jsonify(document)
+
+
+@api.route('/entities/stats')
+def entity_stats():
+    return jsonify(entity_index.stats())
+
+
+# {"texts": [...], "sources": [...]} -> document ids; already indexed texts aren't reprocessed
+@api.route('/entities/index', methods=["POST"])
+def index_entities():
+    payload = _payload()
+    texts = payload.get("texts")
+    sources = payload.get("sources")
+    if not isinstance(texts, list) or not all(isinstance(t, str) and t for t in texts):
+        return _error("'texts' must be a list of non-empty strings.", 400)
+    if sources is not None and (not isinstance(sources, list) or len(sources) != len(texts)):
+        return _error("'sources' must be a list aligned with 'texts'.", 400)
+
+    try:
+        model = request_model(texts[0] if texts else None, payload)
+        ner_mode = request_ner_mode(payload)
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    try:
+        ids = run_nlp(index_texts, texts, sources=sources, model=model, ner_mode=ner_mode)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error("Entity indexing failed: %s", e)
+        return _error("Unable to index the texts.", 500)
+    return jsonify({"count": len(ids), "document_ids": ids})
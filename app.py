@@ -1,23 +1,65 @@
 
-from flask import Flask, render_template, request
-from text_utils import extract_named_entities, generate_wordcloud, fetch_website_text, extract_pos_tags, extract_dependencies, romanize_text
+from flask import Blueprint, Flask, Response, g, render_template, request, jsonify, stream_with_context
+from text_utils import extract_named_entities, extract_named_entities_chunked, generate_wordcloud, fetch_website_text, extract_pos_tags, iter_pos_html, extract_dependencies, romanize_text, analyze_text, analyze_batch, record_entity_source, render_page, WORDCLOUD_FORMATS
+from cache import result_cache
+from doc_store import doc_store
+from fetcher import PageTooLarge
+import displacy_render
+from jobs import job_queue, QueueFullError
+from api import api, request_model, request_ner_mode
+from models import select_model
+from logconfig import configure_logging, preview
+import metrics
+import serving
+from serving import DeadlineExceeded, run_fetch, run_nlp
+import os
+import time
 import logging
 
-# Set up logging for the Flask app
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
-app = Flask(__name__)
+logger = logging.getLogger(__name__)
 
+# HTML pages and the JSON/utility routes. create_app() registers this and the /api/v1 blueprint.
+main = Blueprint('main', __name__)
 
+# Route timing and the optional per-request profile (see metrics.py). A profile
+# is taken when NLP_PROFILE_DIR is set and the request carries "X-NLP-Profile: 1".
+@main.before_app_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    metrics.start_trace()
+    g.profiler = None
+    if metrics.PROFILE_DIR and request.headers.get("X-NLP-Profile") == "1":
+        import cProfile
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
 
+@main.after_app_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    elapsed = time.perf_counter() - g.get("request_start", time.perf_counter())
+    stages = metrics.end_trace()
 
+    metrics.registry.inc('nlp_http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.registry.observe('nlp_http_request_seconds', elapsed, endpoint=endpoint)
+    if request.content_length:
+        metrics.registry.observe('nlp_http_request_bytes', request.content_length, endpoint=endpoint)
 
-app = Flask(__name__)
+    profiler = g.get("profiler")
+    if profiler is not None:
+        profiler.disable()
+        path = os.path.join(metrics.PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{endpoint.strip('/').replace('/', '_') or 'index'}.prof")
+        os.makedirs(metrics.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(path)
+        response.headers["X-NLP-Profile-Dump"] = path
+        response.headers["Server-Timing"] = metrics.server_timing(stages + [("total", elapsed)])
+        logger.info("Profile for %s %s written to %s", request.method, request.path, path)
+    return response
 
-@app.route("/", methods=["GET", "POST"])
+@main.route("/", methods=["GET", "POST"])
 def index():
     return render_template("index.html") # note: changing to home.html breaks the app
 
-@app.route('/ner' , methods=["GET", "POST"])
+@main.route('/ner' , methods=["GET", "POST"])
 def ner():
     named_entities = None
     displacy_html = None
@@ -26,8 +68,12 @@ def ner():
         input_text = request.form.get("user_input")
         
         if input_text:
-            logging.debug(f"Received input: {input_text}")
-            named_entities, displacy_html = extract_named_entities(input_text)
+            logger.debug("Received input for NER: %s", preview(input_text))
+            try:
+                named_entities, displacy_html = run_nlp(
+                    extract_named_entities, input_text, model=request_model(input_text), ner_mode=request_ner_mode())
+            except ValueError as e:
+                named_entities = [("Error", str(e))]
             if named_entities is None:
                 named_entities = [("Error", "Unable to process the text.")]
     
@@ -40,24 +86,37 @@ def ner():
 # (requires fetch_website_text function), performs named entity recognition (NER),
 # and renders the results in web.html. Shows an error message if processing fails.
 
-@app.route('/web', methods=["GET", 'POST'])
+@main.route('/web', methods=["GET", 'POST'])
 def web():
     url = request.form.get('url_input')
-    text = fetch_website_text(url) if url else None
+    try:
+        text = run_fetch(fetch_website_text, url) if url else None
+    except PageTooLarge as e:
+        return render_template('web.html', error_message=f"The page is too large to process: {e}")
     
     if text:
-        named_entities, displacy_html = extract_named_entities(text)
+        try:
+            model = request_model(text)
+            ner_mode = request_ner_mode()
+        except ValueError as e:
+            return render_template('web.html', error_message=str(e))
+
+        # Pages can be arbitrarily long, so NER runs chunk by chunk
+        named_entities, displacy_html = run_nlp(extract_named_entities_chunked, text, model=model, ner_mode=ner_mode)
+        if named_entities is not None:
+            record_entity_source(text, url)
         return render_template('web.html', named_entities=named_entities, displacy_html=displacy_html)
     else:
         error_message = "Error fetching or processing the URL. Please check the URL and try again."
         return render_template('web.html', error_message=error_message)
 
 
-@app.route('/wordcloud', methods=["GET", "POST"])
+@main.route('/wordcloud', methods=["GET", "POST"])
 def wordcloud():
     wordcloud_image = None
     word_count = None
     error_message = None
+    image_format = 'png'
     
     if request.method == "POST":
         input_text = request.form.get("user_input")
@@ -65,27 +124,41 @@ def wordcloud():
         max_words = request.form.get("max_words", 100)
         
         try:
-            max_words = int(max_words)
+            max_words = min(max(int(max_words), 1), 1000)
         except:
             max_words = 100
+
+        try:
+            width = min(max(int(request.form.get("width", 800)), 100), 2000)
+            height = min(max(int(request.form.get("height", 400)), 100), 2000)
+        except ValueError:
+            width, height = 800, 400
+
+        image_format = request.form.get("image_format", "png")
+        if image_format not in WORDCLOUD_FORMATS:
+            image_format = 'png'
         
         # Determine source: URL or text input
         text_to_process = None
         
         if url_input:
             # Fetch text from URL
-            logging.debug(f"Processing URL: {url_input}")
-            text_to_process = fetch_website_text(url_input)
-            if text_to_process is None:
-                error_message = "Error fetching content from URL. Please check the URL and try again."
+            logger.debug("Processing URL: %s", url_input)
+            try:
+                text_to_process = run_fetch(fetch_website_text, url_input)
+                if text_to_process is None:
+                    error_message = "Error fetching content from URL. Please check the URL and try again."
+            except PageTooLarge as e:
+                error_message = f"The page is too large to process: {e}"
         elif input_text:
             text_to_process = input_text
         
         if text_to_process:
-            logging.debug(f"Generating word cloud for text of length: {len(text_to_process)}")
+            logger.debug("Generating word cloud for text of length: %d", len(text_to_process))
             
             # Generate word cloud
-            wordcloud_image = generate_wordcloud(text_to_process, max_words=max_words)
+            wordcloud_image = run_nlp(generate_wordcloud, text_to_process, max_words=max_words,
+                                      width=width, height=height, image_format=image_format)
             
             # Count words for stats
             word_count = len(text_to_process.split())
@@ -95,6 +168,7 @@ def wordcloud():
     
     return render_template('wc.html', 
                          wordcloud_image=wordcloud_image, 
+                         image_mime=WORDCLOUD_FORMATS[image_format][1],
                          word_count=word_count,
                          error_message=error_message)
 
@@ -102,7 +176,7 @@ def wordcloud():
 
 
 
-@app.route('/pos', methods=["GET", "POST"])
+@main.route('/pos', methods=["GET", "POST"])
 def pos():
     pos_tags = None
     pos_html = None
@@ -113,14 +187,19 @@ def pos():
         input_text = request.form.get("user_input")
         
         if input_text:
-            logging.debug(f"Received input for POS tagging: {input_text}")
+            logger.debug("Received input for POS tagging: %s", preview(input_text))
             try:
                 # extract_pos_tags now returns (pos_tags_list, html, grouped_dict)
-                pos_tags, pos_html, grouped_tags = extract_pos_tags(input_text, visualize=True)
+                pos_tags, pos_html, grouped_tags = run_nlp(extract_pos_tags, input_text, visualize=True,
+                                                           model=request_model(input_text))
                 if pos_tags is None:
                     error_message = "Unable to process the text for POS tagging."
+            except ValueError as e:
+                error_message = str(e)
+            except DeadlineExceeded:
+                raise
             except Exception as e:
-                logging.exception("POS tagging failed")
+                logger.exception("POS tagging failed")
                 error_message = "Unable to process the text for POS tagging."
     
     return render_template("pos.html", 
@@ -129,7 +208,28 @@ def pos():
                          grouped_tags=grouped_tags,
                          error_message=error_message)
     
-@app.route('/semantic', methods=["GET", "POST"])
+# Streams the POS visualization of a long text chunk by chunk (chunked transfer encoding)
+@main.route('/pos/stream', methods=["POST"])
+def pos_stream():
+    payload = request.get_json(silent=True) or {}
+    input_text = payload.get("text") or request.form.get("user_input")
+    if not input_text:
+        return jsonify({"error": "No text provided."}), 400
+
+    logger.debug("Streaming POS visualization for text of length: %d", len(input_text))
+    try:
+        chunks = iter_pos_html(input_text, model=request_model(input_text, payload), run=run_nlp)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error("POS streaming failed: %s", e)
+        return jsonify({"error": "Unable to process the text for POS tagging."}), 500
+
+    # The request context (and with it the endpoint's concurrency slot and
+    # deadline) stays until the last chunk is sent, not just until this returns
+    return Response(stream_with_context(chunks), mimetype="text/html")
+
+@main.route('/semantic', methods=["GET", "POST"])
 def semantic():
     dependencies = None
     dep_html = None
@@ -139,18 +239,107 @@ def semantic():
         input_text = request.form.get("user_input")
         
         if input_text:
-            logging.debug(f"Received input for semantic parsing: {input_text}")
+            logger.debug("Received input for semantic parsing: %s", preview(input_text))
             try:
-                dependencies, dep_html = extract_dependencies(input_text)
+                dependencies, dep_html = run_nlp(extract_dependencies, input_text, model=request_model(input_text))
                 if dependencies is None:
                     error_message = "Unable to process the text for semantic parsing."
+            except ValueError as e:
+                error_message = str(e)
+            except DeadlineExceeded:
+                raise
             except Exception as e:
-                logging.exception("Semantic parsing failed")
+                logger.exception("Semantic parsing failed")
                 error_message = "Unable to process the text for semantic parsing."
     
     return render_template('semantic.html', dependencies=dependencies, dep_html=dep_html, error_message=error_message)
 
-@app.route('/romanize', methods=["GET", "POST"])
+# "Render more" continuation of the paged displaCy views (see displacy_render.py):
+# GET /render/ent|dep/<doc key>?page=N[&model=...] returns that page as an HTML fragment.
+
+@main.route('/render/<view>/<key>')
+def render_more(view, key):
+    if view not in displacy_render.VIEWS:
+        return jsonify({"error": f"Unknown view: {view}."}), 404
+    page = request.args.get("page", 1, type=int)
+    try:
+        model = request_model()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    html = run_nlp(render_page, key, view, page, model=model)
+    if html is None:
+        return jsonify({"error": "This visualization is no longer available; run the analysis again."}), 404
+    return Response(html, mimetype="text/html")
+
+# /analyze route: runs the spaCy pipeline once and returns entities, POS tags
+# and dependencies together as JSON. Accepts a JSON body {"text": ..., "visualize": bool}
+# or the same "user_input" form field the HTML pages post. Like every spaCy route,
+# it also takes "model" or "lang" ("auto" to detect it) to pick the pipeline.
+
+@main.route('/analyze', methods=["POST"])
+def analyze():
+    payload = request.get_json(silent=True) or {}
+    input_text = payload.get("text") or request.form.get("user_input")
+    visualize = bool(payload.get("visualize", request.form.get("visualize")))
+
+    if not input_text:
+        return jsonify({"error": "No text provided."}), 400
+
+    try:
+        model = request_model(input_text, payload)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.debug("Received input for combined analysis: %s", preview(input_text))
+    result = run_nlp(analyze_text, input_text, visualize=visualize, model=model)
+    if result is None:
+        return jsonify({"error": "Unable to process the text."}), 500
+
+    if not visualize:
+        for key in ("ent_html", "pos_html", "dep_html"):
+            result.pop(key)
+
+    return jsonify(result)
+
+# /batch route: bulk analysis of many texts in one nlp.pipe run. Accepts a JSON body
+# {"texts": [...], "tasks": ["ner", "pos", "deps"], "batch_size": 64, "n_process": 1}
+# and returns one result per text, in input order.
+
+@main.route('/batch', methods=["POST"])
+def batch():
+    payload = request.get_json(silent=True) or {}
+    texts = payload.get("texts")
+    tasks = payload.get("tasks") or ["ner", "pos", "deps"]
+
+    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+        return jsonify({"error": "'texts' must be a list of strings."}), 400
+    if not isinstance(tasks, list) or not all(isinstance(t, str) and t in ("ner", "pos", "deps") for t in tasks):
+        return jsonify({"error": "'tasks' must be a list drawn from 'ner', 'pos', 'deps'."}), 400
+
+    try:
+        batch_size = max(1, int(payload.get("batch_size", 64)))
+        n_process = max(1, min(int(payload.get("n_process", 1)), os.cpu_count() or 1))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'batch_size' and 'n_process' must be integers."}), 400
+    if serving.MODE == 'pooled':
+        # Already in an NLP process there, which doesn't fork processes of its own
+        n_process = 1
+
+    try:
+        # One pipeline per batch; detection (lang "auto") looks at the first text
+        model = request_model(texts[0] if texts else None, payload)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    logger.debug("Received batch of %d texts (tasks=%s, model=%s)", len(texts), tasks, model)
+    results = run_nlp(analyze_batch, texts, tasks=tasks, batch_size=batch_size, n_process=n_process, model=model)
+    if results is None:
+        return jsonify({"error": "Unable to process the batch."}), 500
+
+    return jsonify({"count": len(results), "tasks": tasks, "results": results})
+
+@main.route('/romanize', methods=["GET", "POST"])
 def romanize():
     romanization_result = None
     error_message = None
@@ -159,26 +348,104 @@ def romanize():
         input_text = request.form.get("user_input")
         
         if input_text:
-            logging.debug(f"Received input for romanization: {input_text[:100]}")
+            logger.debug("Received input for romanization: %s", preview(input_text))
             try:
-                romanization_result = romanize_text(input_text)
+                romanization_result = run_nlp(romanize_text, input_text)
                 if romanization_result is None:
                     error_message = "Unable to romanize the text."
+            except DeadlineExceeded:
+                raise
             except Exception as e:
-                logging.exception("Romanization failed")
+                logger.exception("Romanization failed")
                 error_message = "Unable to romanize the text."
     
     return render_template('romanize.html', result=romanization_result, error_message=error_message)
 
 
-@app.route('/about')
+# /jobs routes: run heavy analyses (semantic parse, word cloud, web NER) in the
+# background. POST a JSON body {"task": "semantic"|"wordcloud"|"web", "text": ..., "url": ...}
+# to get a job id, then poll /jobs/<id> for its status and result.
+
+@main.route('/jobs', methods=["POST"])
+def submit_job():
+    payload = request.get_json(silent=True) or {}
+    task = payload.get("task")
+
+    if task == "web":
+        params = {"url": payload.get("url")}
+    elif task == "wordcloud":
+        try:
+            max_words = min(max(int(payload.get("max_words", 100)), 1), 1000)
+        except (TypeError, ValueError):
+            max_words = 100
+        params = {"text": payload.get("text"), "max_words": max_words}
+    else:
+        params = {"text": payload.get("text")}
+
+    if not all(isinstance(value, (str, int)) and value != "" for value in params.values()):
+        return jsonify({"error": "Missing 'text' (or 'url' for the web task)."}), 400
+
+    # Pipeline routing for the spaCy tasks; the job resolves it (detection needs the fetched page)
+    if task in ("semantic", "web"):
+        params.update({name: payload[name] for name in ("model", "lang") if isinstance(payload.get(name), str)})
+
+    try:
+        if task in ("semantic", "web") and params.get("lang") != "auto":
+            select_model(params.get("model"), params.get("lang"))  # reject unknown names up front
+        job_id = job_queue.submit(task, **params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFullError as e:
+        logger.warning("Rejected job: %s", e)
+        return jsonify({"error": "Too many jobs in progress. Please retry shortly."}), 429, {"Retry-After": "5"}
+
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+@main.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id."}), 404
+    return jsonify(job)
+
+@main.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@main.route('/cache/docs')
+def doc_store_stats():
+    return jsonify(doc_store.stats())
+
+@main.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+@main.route('/about')
 def about():
     return render_template('about.html')
 
-@app.route('/help')
+@main.route('/help')
 def help():
     return render_template('help.html')
 
+def create_app(log_profile=None):
+    """
+    Build the Flask app. Logging is configured here (profile from log_profile
+    or NLP_LOG_PROFILE, see logconfig.py) rather than when modules are imported.
+    """
+    configure_logging(log_profile)
+
+    app = Flask(__name__)
+    app.json.compact = True
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    serving.init_app(app)
+    return app
+
+
+# Module-level instance for `gunicorn app:app` and the benchmarks
+app = create_app()
+
 if __name__ == "__main__":
-    logging.debug("Starting Flask app...")
+    logger.debug("Starting Flask app...")
     app.run(debug=True)
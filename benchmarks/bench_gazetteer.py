@@ -0,0 +1,167 @@
+"""
+Gazetteer NER vs. the statistical NER: startup, throughput and recall.
+
+Usage: python benchmarks/bench_gazetteer.py [--terms 100000] [--docs 200] [--repeat 3]
+
+Builds a synthetic term list (--terms PERSON/ORG/GPE names) and a corpus of
+documents that mention those names ("listed") and well-known names the term
+list doesn't contain ("unlisted"), with the gold character offsets of every
+mention. Then reports:
+  - gazetteer startup: compiling the term list (tokenize + cache write) vs.
+    loading the compiled cache
+  - per NER mode (statistical is the current path): throughput through
+    iter_entity_spans, and recall of the gold mentions (same offsets and label)
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from random import Random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYLLABLES = ("ka", "lo", "ven", "tri", "mar", "sel", "dor", "qui", "zan", "bel", "ros", "tek",
+             "ami", "nor", "vex", "li", "ga", "fen", "ost", "ru", "pa", "len", "dri", "cor")
+ORG_SUFFIXES = ("Holdings", "Labs", "Systems", "Group", "Partners", "Logistics", "Bank", "Energy")
+GPE_FORMS = ("{}", "Port {}", "{} City", "San {}")
+
+UNLISTED = {
+    'PERSON': ("Barack Obama", "Angela Merkel", "Elon Musk", "Taylor Swift"),
+    'ORG': ("Google", "Microsoft", "Amazon", "the United Nations"),
+    'GPE': ("London", "Paris", "Berlin", "Tokyo"),
+}
+
+TEMPLATES = (
+    "{PERSON} met with executives from {ORG} in {GPE} on Tuesday.",
+    "Shares of {ORG} rose after {PERSON} announced a partnership with {ORG}.",
+    "{PERSON} moved from {GPE} to {GPE} last year to lead the regional office.",
+    "Analysts at {ORG} expect demand in {GPE} to slow in the second half.",
+)
+
+
+def _word(rng, parts):
+    return "".join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+
+def make_terms(count, rng):
+    """count unique (label, term) pairs."""
+    terms = {}
+    makers = {
+        'PERSON': lambda: f"{_word(rng, rng.randint(2, 3))} {_word(rng, rng.randint(2, 4))}",
+        'ORG': lambda: f"{_word(rng, rng.randint(2, 3))} {rng.choice(ORG_SUFFIXES)}",
+        'GPE': lambda: rng.choice(GPE_FORMS).format(_word(rng, rng.randint(2, 4))),
+    }
+    labels = list(makers)
+    while len(terms) < count:
+        label = rng.choice(labels)
+        terms.setdefault(makers[label](), label)
+    return [(label, term) for term, label in terms.items()]
+
+
+def make_corpus(terms, docs, sentences, rng):
+    """docs texts of `sentences` sentences each, with gold (start, end, label, listed) mentions."""
+    by_label = {}
+    for label, term in terms:
+        by_label.setdefault(label, []).append(term)
+
+    corpus = []
+    for _ in range(docs):
+        text = ""
+        gold = []
+        for _ in range(sentences):
+            template = rng.choice(TEMPLATES)
+            pos = 0
+            while True:
+                open_at = template.find("{", pos)
+                if open_at < 0:
+                    text += template[pos:]
+                    break
+                close_at = template.index("}", open_at)
+                text += template[pos:open_at]
+                label = template[open_at + 1:close_at]
+                listed = rng.random() < 0.8
+                name = rng.choice(by_label[label]) if listed else rng.choice(UNLISTED[label])
+                gold.append((len(text), len(text) + len(name), label, listed))
+                text += name
+                pos = close_at + 1
+            text += " "
+        corpus.append((text, gold))
+    return corpus
+
+
+def best_of(func, repeat):
+    """Fastest of `repeat` timed calls (after one warm-up call), in seconds."""
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--terms", type=int, default=100_000, help="size of the synthetic term list")
+    parser.add_argument("--docs", type=int, default=200, help="documents in the corpus")
+    parser.add_argument("--sentences", type=int, default=20, help="sentences per document")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per mode (best is reported)")
+    parser.add_argument("--seed", type=int, default=13)
+    args = parser.parse_args()
+
+    rng = Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench-gazetteer-")
+    terms = make_terms(args.terms, rng)
+    path = os.path.join(workdir, "terms.tsv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(f"{label}\t{term}\n" for label, term in terms)
+    corpus = make_corpus(terms, args.docs, args.sentences, rng)
+
+    # gazetteer.py reads its configuration on import
+    os.environ["NLP_GAZETTEER"] = path
+    os.environ["NLP_GAZETTEER_CACHE"] = os.path.join(workdir, "cache")
+    os.environ["NLP_ENTITY_INDEX"] = "0"
+    import gazetteer
+    import text_utils
+
+    logging.getLogger().setLevel(logging.WARNING)
+    nlp = text_utils.nlp
+    if nlp is None:
+        sys.exit("spaCy model is not loaded.")
+
+    start = time.perf_counter()
+    gazetteer.Gazetteer(nlp, path, cache_dir=gazetteer.CACHE_DIR)
+    compile_s = time.perf_counter() - start
+    start = time.perf_counter()
+    gazetteer.Gazetteer(nlp, path, cache_dir=gazetteer.CACHE_DIR)
+    load_s = time.perf_counter() - start
+
+    chars = sum(len(text) for text, _ in corpus)
+    mentions = [mention for _, gold in corpus for mention in gold]
+    listed_total = sum(1 for mention in mentions if mention[3])
+    print(f"{len(terms):,} terms ({os.path.getsize(path) / 1e6:.1f} MB), {len(corpus)} docs, {chars:,} chars, "
+          f"{len(mentions):,} gold mentions ({listed_total:,} listed)")
+    print(f"gazetteer startup: compile {compile_s:.2f}s, cached {load_s:.2f}s ({compile_s / load_s:.1f}x)")
+
+    print(f"\n{'mode':<12} {'docs/s':>9} {'chars/s':>12} {'recall':>8} {'listed':>8} {'unlisted':>9}")
+    for mode in gazetteer.NER_MODES:
+        def run():
+            return [set(text_utils.iter_entity_spans(text, ner_mode=mode)) for text, _ in corpus]
+
+        seconds = best_of(run, args.repeat)
+        found = run()
+        hits = {True: 0, False: 0}
+        for spans, (_, gold) in zip(found, corpus):
+            predicted = {(start, end, label) for start, end, label, _ in spans}
+            for start, end, label, listed in gold:
+                hits[listed] += (start, end, label) in predicted
+        unlisted_total = len(mentions) - listed_total
+        print(f"{mode:<12} {len(corpus) / seconds:>9.1f} {chars / seconds:>12,.0f} "
+              f"{(hits[True] + hits[False]) / len(mentions):>8.1%} {hits[True] / max(listed_total, 1):>8.1%} "
+              f"{hits[False] / max(unlisted_total, 1):>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+HTML-to-text engines: output parity, throughput and peak memory on the fixture pages.
+
+Usage: python benchmarks/bench_html_extract.py [--repeat N] [--engines bs4,stream,lxml]
+
+Peak memory is measured with tracemalloc, which sees Python allocations only;
+libxml2's own buffers (lxml engine) are not included.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import html_extract  # noqa: E402
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pages")
+
+
+def load_pages():
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(PAGES_DIR, "*.html"))):
+        with open(path, "rb") as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def run_engine(engine, content):
+    # Call the engine directly so the result cache doesn't short-circuit the timing
+    return html_extract.clean_whitespace(html_extract.ENGINES[engine](content))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the fixture corpus")
+    parser.add_argument("--engines", default=",".join(html_extract.ENGINES), help="comma-separated engines")
+    args = parser.parse_args()
+
+    pages = load_pages()
+    total_bytes = sum(len(content) for content in pages.values())
+    engines = args.engines.split(",")
+    reference = {name: run_engine("bs4", content) for name, content in pages.items()}
+
+    print(f"{len(pages)} pages, {total_bytes / 1024:.1f} KB per pass, {args.repeat} passes")
+    print(f"{'engine':<8} {'parity':<10} {'MB/s':>8} {'ms/pass':>9} {'peak KB (largest page)':>24}")
+    for engine in engines:
+        try:
+            mismatches = [name for name, content in pages.items() if run_engine(engine, content) != reference[name]]
+        except ImportError as e:
+            print(f"{engine:<8} unavailable: {e}")
+            continue
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for content in pages.values():
+                run_engine(engine, content)
+        elapsed = time.perf_counter() - start
+
+        largest = max(pages.values(), key=len)
+        tracemalloc.start()
+        run_engine(engine, largest)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        parity = "identical" if not mismatches else f"{len(mismatches)} differ"
+        print(f"{engine:<8} {parity:<10} {total_bytes * args.repeat / elapsed / 1e6:>8.2f} "
+              f"{elapsed / args.repeat * 1000:>9.2f} {peak / 1024:>24.0f}")
+        for name in mismatches:
+            print(f"         differs on {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Logging overhead on long inputs: the old f-string/full-dump logging vs. the lazy, previewed calls.
+
+Usage: python benchmarks/bench_logging.py [--sizes 100000,1000000] [--repeat N]
+
+For each input size, POS tagging (extract_pos_tags without the result cache)
+runs under:
+  legacy        what text_utils did before: root logger at DEBUG, the input
+                text and the full tag list formatted into f-strings and written
+  development   logconfig 'development' profile (DEBUG, capped previews)
+  production    logconfig 'production' profile (INFO, JSON lines)
+  legacy INFO   the old f-strings with DEBUG turned off: still built, never written
+
+A second table times the log calls alone (no spaCy), which is the overhead the
+pipeline numbers include. Log output goes to os.devnull.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logconfig  # noqa: E402
+import text_utils  # noqa: E402
+from benchmarks.suite import load_corpus  # noqa: E402
+
+DEVNULL = open(os.devnull, "w")
+
+
+def use_profile(name):
+    """Route logging to os.devnull with the given setup."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if name in ("legacy", "legacy INFO"):
+        handler = logging.StreamHandler(DEVNULL)
+        handler.setFormatter(logging.Formatter(logconfig.TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.DEBUG if name == "legacy" else logging.INFO)
+    else:
+        stderr, sys.stderr = sys.stderr, DEVNULL
+        try:
+            logconfig.configure_logging(name)
+        finally:
+            sys.stderr = stderr
+
+
+def legacy_pos_tags(text):
+    """extract_pos_tags as it logged before: full text and full tag list in f-strings."""
+    logging.debug(f"Processing text for POS tagging: {text!r}")
+    doc = text_utils._run_pipeline(text_utils.nlp, text, ('pos',))
+    pos_tags, html, grouped_tags = text_utils._pos_tags_from_doc(doc, visualize=True)
+    logging.debug(f"POS tags extracted: {pos_tags}")
+    return pos_tags, html, grouped_tags
+
+
+def current_pos_tags(text):
+    return text_utils.extract_pos_tags.__wrapped__(text, visualize=True)
+
+
+def legacy_log_calls(text, pos_tags):
+    logging.debug(f"Processing text for POS tagging: {text!r}")
+    logging.debug(f"POS tags extracted: {pos_tags}")
+
+
+def current_log_calls(text, pos_tags):
+    logger = text_utils.logger
+    logger.debug("Processing text for POS tagging: %s", logconfig.preview(text), extra=logconfig.SAMPLED)
+    logger.debug("POS tags extracted: %s", logconfig.preview(pos_tags), extra=logconfig.SAMPLED)
+
+
+def best_of(func, repeat):
+    """Fastest of `repeat` timed calls (after one warm-up call), in seconds."""
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def make_text(size):
+    texts, _, _ = load_corpus()
+    base = texts['long']
+    return (base * (size // len(base) + 1))[:size]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="100000,1000000", help="comma-separated input sizes in characters")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per measurement (best is reported)")
+    args = parser.parse_args()
+
+    nlp = text_utils.nlp
+    if nlp is None:
+        sys.exit("spaCy model is not loaded.")
+    nlp.max_length = max(nlp.max_length, max(int(size) for size in args.sizes.split(",")) + 1)
+
+    setups = [
+        ("legacy", legacy_pos_tags, legacy_log_calls),
+        ("development", current_pos_tags, current_log_calls),
+        ("production", current_pos_tags, current_log_calls),
+        ("legacy INFO", legacy_pos_tags, legacy_log_calls),
+    ]
+
+    for size in (int(size) for size in args.sizes.split(",")):
+        text = make_text(size)
+        pos_tags = current_pos_tags(text)[0]
+        print(f"\n{size:,} characters, {len(pos_tags):,} tokens")
+        print(f"{'setup':<12} {'pipeline ms':>12} {'chars/s':>12} {'log calls ms':>13}")
+        for name, pipeline, log_calls in setups:
+            use_profile(name)
+            pipeline_s = best_of(lambda: pipeline(text), args.repeat)
+            logging_s = best_of(lambda: log_calls(text, pos_tags), args.repeat)
+            print(f"{name:<12} {pipeline_s * 1000:>12.1f} {size / pipeline_s:>12,.0f} {logging_s * 1000:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Per-task latency: full spaCy pipeline vs. only the components each task needs.
+
+Usage: python benchmarks/bench_pipeline_tasks.py [--repeat N]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import text_utils  # noqa: E402
+
+SAMPLE_TEXT = (
+    "Apple is looking at buying a U.K. startup for $1 billion. "
+    "Barack Obama was born in Hawaii and served as the 44th President of the United States. "
+    "The quick brown fox jumps over the lazy dog while Google opens a new office in London. "
+) * 5
+
+# Routes served by each task in app.py
+TASK_ROUTES = {
+    'ner': '/ner, /web',
+    'pos': '/pos',
+    'deps': '/semantic',
+}
+
+
+def time_per_doc(func, repeat):
+    """Average seconds per call over `repeat` calls (after one warm-up call)."""
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=50, help="calls per measurement")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    nlp = text_utils.nlp
+    if nlp is None:
+        sys.exit("spaCy model is not loaded.")
+
+    full = time_per_doc(lambda: nlp(SAMPLE_TEXT), args.repeat)
+    print(f"pipeline: {', '.join(nlp.pipe_names)}")
+    print(f"{'task':<6} {'routes':<12} {'disabled':<40} {'full ms':>9} {'task ms':>9} {'speedup':>8}")
+    for task, routes in TASK_ROUTES.items():
+        disabled = text_utils._disabled_components(nlp, (task,))
+        trimmed = time_per_doc(lambda: text_utils._run_pipeline(nlp, SAMPLE_TEXT, (task,)), args.repeat)
+        print(f"{task:<6} {routes:<12} {','.join(disabled) or '-':<40} "
+              f"{full * 1000:>9.2f} {trimmed * 1000:>9.2f} {full / trimmed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
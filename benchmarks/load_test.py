@@ -0,0 +1,154 @@
+"""
+Load test: tail latency under mixed traffic, sync vs. pooled serving mode.
+
+Usage: python benchmarks/load_test.py [--duration 30] [--clients 8] [--web-share 0.25] [--delay 3]
+                                      [--modes sync,pooled]
+
+For each serving mode (see serving.py) the app is started under gunicorn with
+gunicorn_config.py on a free local port. Client threads then send, for
+--duration seconds, a mix of:
+  web   POST /web for a page on a local server that takes --delay seconds to answer
+  ner   POST /api/v1/ner with the medium fixture text (made unique per request,
+        so the result cache never answers)
+Reported per mode and request kind: requests, errors (503 shed by a
+concurrency cap, 504 past a deadline, other), throughput and p50/p95/p99 latency.
+"""
+import argparse
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.suite import load_corpus, percentile  # noqa: E402
+
+
+class SlowPage(BaseHTTPRequestHandler):
+    """A page that answers after ?delay= seconds and must not be cached."""
+
+    def do_GET(self):
+        delay = float(parse_qs(urlsplit(self.path).query).get("delay", ["1"])[0])
+        time.sleep(delay)
+        body = (f"<html><body><p>Page {self.path}. Barack Obama met Angela Merkel in Berlin "
+                f"to discuss a deal with Siemens.</p></body></html>").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port):
+    env = dict(os.environ, NLP_SERVE_MODE=mode, NLP_ENTITY_INDEX="0", NLP_DOC_STORE="0")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py", "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/about", timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.5)
+    process.kill()
+    sys.exit(f"gunicorn ({mode}) did not start")
+
+
+def run_clients(base, page_url, text, args):
+    """Send mixed traffic for args.duration seconds; returns {kind: [(seconds, status), ...]}."""
+    results = {'web': [], 'ner': []}
+    lock = threading.Lock()
+    stop_at = time.time() + args.duration
+    counter = iter(range(10 ** 9))
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.time() < stop_at:
+            n = next(counter)
+            if rng.random() < args.web_share:
+                kind = 'web'
+                send = lambda: session.post(f"{base}/web", data={'url_input': f"{page_url}&n={n}"}, timeout=60)
+            else:
+                kind = 'ner'
+                send = lambda: session.post(f"{base}/api/v1/ner", json={'text': f"{text} Request {n}."}, timeout=60)
+            start = time.perf_counter()
+            try:
+                status = send().status_code
+            except requests.RequestException:
+                status = 0
+            with lock:
+                results[kind].append((time.perf_counter() - start, status))
+            if status == 503:
+                time.sleep(0.1)  # shed: back off briefly, as a Retry-After aware client would
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30, help="seconds of traffic per mode")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--web-share", type=float, default=0.25, help="fraction of requests that are /web")
+    parser.add_argument("--delay", type=float, default=3, help="seconds the slow page takes to answer")
+    parser.add_argument("--modes", default="sync,pooled")
+    args = parser.parse_args()
+
+    pages = ThreadingHTTPServer(("127.0.0.1", 0), SlowPage)
+    threading.Thread(target=pages.serve_forever, daemon=True).start()
+    page_url = f"http://127.0.0.1:{pages.server_address[1]}/page?delay={args.delay}"
+    text = load_corpus()[0]['medium']
+
+    print(f"{args.clients} clients, {args.duration:g}s per mode, {args.web_share:.0%} /web (page delay {args.delay:g}s)")
+    print(f"{'mode':<8} {'kind':<5} {'requests':>9} {'ok':>6} {'503':>5} {'504':>5} {'other':>6} "
+          f"{'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for mode in args.modes.split(","):
+        port = _free_port()
+        server = start_server(mode, port)
+        try:
+            results = run_clients(f"http://127.0.0.1:{port}", page_url, text, args)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+        for kind, samples in results.items():
+            ok = sorted(seconds for seconds, status in samples if status == 200)
+            count = lambda code: sum(1 for _, status in samples if status == code)
+            other = len(samples) - len(ok) - count(503) - count(504)
+            row = f"{mode:<8} {kind:<5} {len(samples):>9} {len(ok):>6} {count(503):>5} {count(504):>5} {other:>6} " \
+                  f"{len(ok) / args.duration:>7.1f}"
+            if ok:
+                row += "".join(f" {percentile(ok, q) * 1000:>9.0f}" for q in (0.50, 0.95, 0.99))
+            print(row)
+
+    pages.shutdown()
+
+
+if __name__ == "__main__":
+    main()
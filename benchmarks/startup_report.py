@@ -0,0 +1,114 @@
+"""
+Startup time and per-worker memory, lazy vs. preloaded model loading.
+
+Usage: python benchmarks/startup_report.py [--workers N]
+
+- lazy:    time to import the app, then time for the first request (which loads the model)
+- preload: time for models.preload(), then RSS/PSS/private memory of N forked
+           workers that each serve one request, with and without gc.freeze()
+
+PSS counts shared pages divided among the processes sharing them, so
+sum(PSS) is the real memory footprint of the worker set.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SAMPLE_TEXT = "Barack Obama was born in Hawaii. Apple is opening an office in London."
+
+LAZY_SCRIPT = f"""
+import json, logging, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+logging.getLogger().setLevel(logging.WARNING)
+client = app.app.test_client()
+client.post('/ner', data={{'user_input': {SAMPLE_TEXT!r}}})
+first = time.perf_counter()
+client.post('/ner', data={{'user_input': {SAMPLE_TEXT!r} + ' Again.'}})
+second = time.perf_counter()
+print(json.dumps({{'import_s': imported - start, 'first_request_s': first - imported, 'warm_request_s': second - first}}))
+"""
+
+
+def lazy_report():
+    output = subprocess.run([sys.executable, "-c", LAZY_SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def preload_report(workers, freeze):
+    import gc
+    import logging
+
+    import models
+
+    logging.getLogger().setLevel(logging.WARNING)
+    start = time.perf_counter()
+    models.preload(freeze=freeze)
+    preload_s = time.perf_counter() - start
+
+    import app
+    master = models.memory_report()
+
+    pids = []
+    read_fds = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            client = app.app.test_client()
+            client.post('/ner', data={'user_input': SAMPLE_TEXT})
+            client.post('/pos', data={'user_input': SAMPLE_TEXT})
+            gc.collect()
+            os.write(write_fd, json.dumps(models.memory_report()).encode())
+            os.close(write_fd)
+            time.sleep(1)  # stay alive so siblings' PSS still accounts for shared pages
+            os._exit(0)
+        os.close(write_fd)
+        pids.append(pid)
+        read_fds.append(read_fd)
+
+    reports = []
+    for read_fd in read_fds:
+        with os.fdopen(read_fd) as f:
+            reports.append(json.loads(f.read()))
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+    return {'preload_s': preload_s, 'master': master, 'workers': reports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=2, help="forked workers to measure")
+    args = parser.parse_args()
+
+    lazy = lazy_report()
+    print("lazy loading:")
+    print(f"  import app          {lazy['import_s']:.2f}s")
+    print(f"  first request       {lazy['first_request_s']:.2f}s (loads the model)")
+    print(f"  warm request        {lazy['warm_request_s'] * 1000:.1f}ms")
+
+    for freeze in (False, True):
+        # Each configuration runs in a fresh interpreter so they don't share state
+        code = (f"import sys, json; sys.path.insert(0, {ROOT!r}); sys.path.insert(0, {os.path.dirname(__file__)!r}); "
+                f"import startup_report; print(json.dumps(startup_report.preload_report({args.workers}, {freeze})))")
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        report = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f"preload in master ({'gc.freeze' if freeze else 'no gc.freeze'}): {report['preload_s']:.2f}s")
+        print(f"  master              rss={report['master'].get('rss')} kB")
+        for i, worker in enumerate(report['workers']):
+            print(f"  worker {i}            rss={worker.get('rss')} kB pss={worker.get('pss')} kB "
+                  f"shared={worker.get('shared')} kB private={worker.get('private')} kB")
+        print(f"  sum(pss) of workers {sum(w.get('pss', 0) for w in report['workers'])} kB")
+
+
+if __name__ == "__main__":
+    main()
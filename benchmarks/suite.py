@@ -0,0 +1,353 @@
+"""
+Benchmark suite: every text_utils function and Flask endpoint over a fixed corpus.
+
+Usage:
+  python benchmarks/suite.py run [--repeat N] [--filter SUBSTRING] [--output PATH]
+  python benchmarks/suite.py compare OLD.json NEW.json [--threshold 0.10]
+
+Corpus (benchmarks/fixtures):
+  texts/short.txt, texts/medium.txt   fixed prose; "long" is medium.txt repeated
+                                      to LONG_CHARS with paragraph breaks
+  texts/romanize.json                 one sample per romanization script, plus mixed
+  pages/*.html                        saved pages for the HTML extraction step
+
+Each case is timed with the result cache cleared before every call (untimed),
+so the numbers are for computing results, not serving them from the cache. The
+disk cache tier and the doc store are disabled for the run, except in the
+doc_store.* cases, which time loading a stored Doc against re-running the full
+pipeline to get it again (reparse) and storing it (put). Per case the suite records throughput,
+p50/p95/p99 latency and peak RSS (sampled from /proc while the case runs, so
+on other platforms only the process-wide high-water mark is available).
+
+`run` writes JSON to benchmarks/results/<commit>.json by default; `compare`
+flags cases whose p50 or p95 got slower by more than the threshold and exits
+with status 1 if there are any.
+"""
+import argparse
+import glob
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, "benchmarks", "fixtures")
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+sys.path.insert(0, ROOT)
+
+LONG_CHARS = 50_000
+
+
+# ============================================================================
+# CORPUS
+# ============================================================================
+
+def _read(*parts):
+    with open(os.path.join(FIXTURES, *parts), encoding="utf-8") as f:
+        return f.read()
+
+
+def load_corpus():
+    """Return ({'short', 'medium', 'long'} -> text, script -> text, page name -> bytes)."""
+    short = _read("texts", "short.txt").strip()
+    medium = _read("texts", "medium.txt").strip()
+    paragraphs = []
+    while sum(len(p) + 2 for p in paragraphs) < LONG_CHARS:
+        paragraphs.append(medium)
+    texts = {'short': short, 'medium': medium, 'long': "\n\n".join(paragraphs)}
+
+    scripts = json.loads(_read("texts", "romanize.json"))
+
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES, "pages", "*.html"))):
+        with open(path, "rb") as f:
+            pages[os.path.splitext(os.path.basename(path))[0]] = f.read()
+
+    return texts, scripts, pages
+
+
+# ============================================================================
+# CASES
+# ============================================================================
+
+def build_cases(texts, scripts, pages):
+    """Return a list of (name, input_bytes, func) cases."""
+    import app
+    import displacy_render
+    import doc_store
+    import html_extract
+    import term_stats
+    import text_utils
+
+    cases = []
+
+    def add(name, payload_size, func):
+        cases.append((name, payload_size, func))
+
+    for size, text in texts.items():
+        n = len(text.encode("utf-8"))
+        add(f"extract_named_entities/{size}", n, lambda text=text: text_utils.extract_named_entities(text))
+        add(f"extract_pos_tags/{size}", n, lambda text=text: text_utils.extract_pos_tags(text, visualize=True))
+        add(f"extract_dependencies/{size}", n, lambda text=text: text_utils.extract_dependencies(text))
+        add(f"generate_wordcloud/{size}", n, lambda text=text: text_utils.generate_wordcloud(text))
+        add(f"compute_term_stats/{size}", n, lambda text=text: text_utils.compute_term_stats(text))
+
+    # Load vs. reparse: a Doc with every component's annotations, from a store of its own
+    store = doc_store.DocStore(store_dir=tempfile.mkdtemp(prefix="nlp-bench-docs-"))
+    nlp = text_utils.nlp
+    tasks = tuple(text_utils.TASK_COMPONENTS)
+    for size, text in texts.items():
+        n = len(text.encode("utf-8"))
+        doc = text_utils._run_pipeline(nlp, text, tasks)
+        add(f"doc_store.reparse/{size}", n, lambda text=text: text_utils._run_pipeline(nlp, text, tasks))
+        add(f"doc_store.put/{size}", n, lambda text=text, doc=doc: store.put(text, doc, "bench", nlp.pipe_names))
+        add(f"doc_store.get/{size}", n, lambda text=text: store.get(text, nlp.vocab, "bench", nlp.pipe_names))
+        # Counting alone, on the Doc a stored parse gives back
+        add(f"term_stats.count/{size}", n, lambda doc=doc: term_stats.TermCounts.from_docs([doc]))
+        # Rendering alone: the first page of each displaCy view (the fragment cache is cleared per call)
+        ents = displacy_render.entity_source(doc)[1]
+        add(f"displacy_render.ent/{size}", n,
+            lambda text=text, ents=ents: displacy_render.render_entities(text, ents, "bench"))
+        add(f"displacy_render.dep/{size}", n, lambda doc=doc: displacy_render.render(doc, "bench"))
+
+    for script, text in scripts.items():
+        add(f"romanize_text/{script}", len(text.encode("utf-8")), lambda text=text: text_utils.romanize_text(text))
+
+    # The HTML-to-text step of fetch_website_text (no network)
+    for name, content in pages.items():
+        add(f"fetch_website_text.extract/{name}", len(content), lambda content=content: html_extract.extract_text(content))
+
+    # Request-level overhead: the same work through the Flask routes
+    client = app.app.test_client()
+    short, medium = texts['short'], texts['medium']
+    routes = [
+        ("GET /", None, lambda: client.get("/")),
+        ("POST /ner", medium, lambda: client.post("/ner", data={'user_input': medium})),
+        ("POST /pos", medium, lambda: client.post("/pos", data={'user_input': medium})),
+        ("POST /semantic", short, lambda: client.post("/semantic", data={'user_input': short})),
+        ("POST /wordcloud", medium, lambda: client.post("/wordcloud", data={'user_input': medium})),
+        ("POST /romanize", scripts['mixed'], lambda: client.post("/romanize", data={'user_input': scripts['mixed']})),
+        ("POST /analyze", medium, lambda: client.post("/analyze", json={'text': medium})),
+        ("POST /api/v1/ner", medium, lambda: client.post("/api/v1/ner", json={'text': medium})),
+        ("POST /api/v1/pos", medium, lambda: client.post("/api/v1/pos", json={'text': medium})),
+        ("POST /api/v1/stats", medium, lambda: client.post("/api/v1/stats", json={'text': medium})),
+    ]
+    for name, text, func in routes:
+        add(f"flask {name}", len(text.encode("utf-8")) if text else 0, _checked(func))
+
+    return cases
+
+
+def _checked(request):
+    def call():
+        response = request()
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return response
+    return call
+
+
+# ============================================================================
+# MEASUREMENT
+# ============================================================================
+
+def _current_rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return None
+
+
+class _RssSampler(threading.Thread):
+    """Track the peak RSS of this process while a case runs."""
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _current_rss_kb()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            rss = _current_rss_kb()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(func, repeat, reset):
+    """Call func repeat times (after one warm-up call), calling reset before each call outside the timing."""
+    reset()
+    func()
+
+    baseline = _current_rss_kb()
+    sampler = _RssSampler() if baseline is not None else None
+    if sampler:
+        sampler.start()
+
+    latencies = []
+    for _ in range(repeat):
+        reset()
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+
+    if sampler:
+        peak_rss_kb = sampler.stop()
+    else:
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'calls': repeat,
+        'ops_per_s': repeat / total if total else None,
+        'mean_ms': total / repeat * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_kb': peak_rss_kb,
+        'rss_growth_kb': peak_rss_kb - baseline if baseline is not None else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args):
+    # Measure computation, not the shared disk tier or stored Docs left over from another run
+    os.environ.pop("NLP_CACHE_DIR", None)
+    os.environ["NLP_DOC_STORE"] = "0"
+
+    from cache import result_cache
+    from models import model_version
+
+    logging.getLogger().setLevel(logging.WARNING)
+    cases = build_cases(*load_corpus())
+    logging.getLogger().setLevel(logging.WARNING)  # importing app reconfigures logging
+
+    if args.filter:
+        cases = [case for case in cases if args.filter in case[0]]
+
+    commit = _git_commit()
+    results = {
+        'meta': {
+            'commit': commit,
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'model': model_version(),
+            'repeat': args.repeat,
+        },
+        'cases': {},
+    }
+
+    print(f"{'case':<44} {'ops/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'MB/s':>7} {'peak RSS MB':>12}")
+    for name, payload_size, func in cases:
+        try:
+            stats = measure(func, args.repeat, result_cache.clear)
+        except Exception as e:
+            print(f"{name:<44} failed: {e}")
+            results['cases'][name] = {'error': str(e)}
+            continue
+        stats['input_bytes'] = payload_size
+        stats['mb_per_s'] = payload_size * stats['ops_per_s'] / 1e6 if payload_size and stats['ops_per_s'] else None
+        results['cases'][name] = stats
+        print(f"{name:<44} {stats['ops_per_s']:>8.1f} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['mb_per_s'] or 0:>7.2f} {stats['peak_rss_kb'] / 1024:>12.1f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"\nResults written to {output}")
+
+
+# ============================================================================
+# COMPARISON
+# ============================================================================
+
+def compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']} (threshold +{args.threshold:.0%})")
+    print(f"{'case':<44} {'p50 old':>9} {'p50 new':>9} {'change':>8} {'p95 change':>11}  status")
+
+    regressions = []
+    for name in sorted(set(old['cases']) | set(new['cases'])):
+        before, after = old['cases'].get(name), new['cases'].get(name)
+        if before is None or after is None:
+            print(f"{name:<44} {'only in ' + ('new' if before is None else 'old'):>40}")
+            continue
+        if 'error' in before or 'error' in after:
+            status = "FAILED" if 'error' in after else "fixed"
+            if 'error' in after:
+                regressions.append(name)
+            print(f"{name:<44} {'':>40}  {status}")
+            continue
+
+        p50 = after['p50_ms'] / before['p50_ms'] - 1
+        p95 = after['p95_ms'] / before['p95_ms'] - 1
+        if p50 > args.threshold or p95 > args.threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif p50 < -args.threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        print(f"{name:<44} {before['p50_ms']:>9.2f} {after['p50_ms']:>9.2f} {p50:>+8.1%} {p95:>+11.1%}  {status}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and save JSON results")
+    run_parser.add_argument("--repeat", type=int, default=20, help="timed calls per case")
+    run_parser.add_argument("--filter", help="only run cases whose name contains this")
+    run_parser.add_argument("--output", help="results file (default: benchmarks/results/<commit>.json)")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown (default 0.10 = 10%%)")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Content-addressed result cache for the NLP endpoints.
+
+Results are keyed by a hash of (task, text, model version, options) and kept in
+an in-process LRU bounded by entry count and total bytes. When NLP_CACHE_DIR is
+set, a SQLite tier in that directory is shared by every gunicorn worker on the
+host, so a result computed in one worker also serves the others.
+
+Configuration (environment variables):
+  NLP_CACHE_MAX_ENTRIES      in-memory entry limit (default 1024, 0 disables the memory tier)
+  NLP_CACHE_MAX_BYTES        in-memory size limit in bytes (default 64 MB)
+  NLP_CACHE_DIR              directory for the shared disk tier (disabled when unset)
+  NLP_CACHE_DISK_MAX_BYTES   disk tier size limit in bytes (default 512 MB)
+"""
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from logconfig import SAMPLED
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Two-tier (memory LRU + optional shared SQLite) cache of pickled results."""
+
+    # Check the disk tier's total size every this many writes
+    DISK_EVICTION_INTERVAL = 32
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_path = os.path.join(disk_dir, "results.sqlite3") if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._disk_writes = 0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'disk_hits': 0,
+            'disk_evictions': 0,
+        }
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache configured from the NLP_CACHE_* environment variables."""
+        return cls(
+            max_entries=int(os.environ.get("NLP_CACHE_MAX_ENTRIES", 1024)),
+            max_bytes=int(os.environ.get("NLP_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            disk_dir=os.environ.get("NLP_CACHE_DIR") or None,
+            disk_max_bytes=int(os.environ.get("NLP_CACHE_DISK_MAX_BYTES", 512 * 1024 * 1024)),
+        )
+
+    @staticmethod
+    def make_key(task, text, version=None, options=None):
+        """Hash (task, text, model version, options) into a cache key. text may be str or bytes."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps([task, version, options], sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text if isinstance(text, bytes) else text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[0]
+
+        blob = self._disk_get(key)
+        if blob is not None:
+            value = pickle.loads(blob)
+            with self._lock:
+                self._counters['hits'] += 1
+                self._counters['disk_hits'] += 1
+                self._memory_set(key, value, len(blob))
+            return value
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def set(self, key, value):
+        """Store value under key in both tiers."""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._memory_set(key, value, len(blob))
+        self._disk_set(key, blob)
+
+    def clear(self):
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        conn = self._disk_connection()
+        if conn is not None:
+            with conn:
+                conn.execute("DELETE FROM results")
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current sizes."""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['disk_enabled'] = self.disk_path is not None
+        return stats
+
+    # ------------------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------------------
+
+    def _memory_set(self, key, value, size):
+        """Insert into the LRU and evict down to the limits. Caller holds the lock."""
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+
+        self._entries[key] = (value, size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._counters['evictions'] += 1
+
+    # ------------------------------------------------------------------
+    # Shared disk tier
+    # ------------------------------------------------------------------
+
+    def _disk_connection(self):
+        """Return this thread's SQLite connection, reopening it after a fork."""
+        if self.disk_path is None:
+            return None
+
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.disk_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _disk_get(self, key):
+        try:
+            conn = self._disk_connection()
+            if conn is None:
+                return None
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            with conn:
+                conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+        except sqlite3.Error as e:
+            logger.error("Result cache disk read failed: %s", e)
+            return None
+
+    def _disk_set(self, key, blob):
+        if self.disk_path is None or len(blob) > self.disk_max_bytes:
+            return
+        try:
+            conn = self._disk_connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, sqlite3.Binary(blob), len(blob), time.time()),
+                )
+            self._disk_writes += 1
+            if self._disk_writes % self.DISK_EVICTION_INTERVAL == 0:
+                self._disk_evict(conn)
+        except sqlite3.Error as e:
+            logger.error("Result cache disk write failed: %s", e)
+
+    def _disk_evict(self, conn):
+        """Delete least recently used rows until the disk tier fits its size limit."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+
+        excess = total - self.disk_max_bytes
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+
+        with conn:
+            conn.executemany("DELETE FROM results WHERE key = ?", victims)
+        with self._lock:
+            self._counters['disk_evictions'] += len(victims)
+        logger.debug("Result cache evicted %d disk entries", len(victims))
+
+
+def _is_cacheable(result):
+    """Don't cache failures: None, or the (None, ...) tuples the extractors return on error."""
+    if result is None:
+        return False
+    if isinstance(result, tuple) and result and result[0] is None:
+        return False
+    return True
+
+
+def cached(task, version=None, should_cache=_is_cacheable, cache=None):
+    """
+    Decorator that serves a text_utils function from the result cache.
+
+    The decorated function must take the input text (str or bytes) as its first argument.
+    Its remaining arguments (with defaults applied) become the key's options,
+    and version(**options) is called per request so a model reload changes the key.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            store = cache or result_cache
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            options = dict(bound.arguments)
+            text = options.pop(next(iter(signature.parameters)))
+
+            if not isinstance(text, (str, bytes)):
+                return func(*args, **kwargs)
+
+            key = store.make_key(task, text, version(**options) if version else None, options)
+            result = store.get(key)
+            if result is not None:
+                logger.debug("Result cache hit for task %s", task, extra=SAMPLED)
+                return result
+
+            result = func(*args, **kwargs)
+            if should_cache(result):
+                store.set(key, result)
+            return result
+
+        wrapper.cache_task = task
+        return wrapper
+
+    return decorator
+
+
+# Shared instance used by text_utils and reported by the app
+result_cache = ResultCache.from_env()
@@ -0,0 +1,472 @@
+"""
+Command-line bulk ingestion: the text_utils analyses over files, corpora or
+URL lists, without going through the Flask app.
+
+Usage:
+  python cli.py ingest INPUT [INPUT ...] --output OUT.jsonl [--tasks ner,pos,deps,romanize]
+                [--workers N] [--batch-size N] [--model NAME | --lang CODE]
+                [--urls] [--lines] [--text-field text] [--id-field id] [--restart]
+  python cli.py term-reference INPUT [INPUT ...] --output reference.json [--update] [--min-df N]
+                [--workers N] [--batch-size N] [--model NAME | --lang CODE] [--urls] [--lines] ...
+
+Inputs:
+  directory       every .txt/.md/.html/.htm/.jsonl/.csv file under it, in sorted order
+  .txt, .md       one record per file (--lines: one per non-empty line)
+  .html, .htm     one record per file; the text is extracted as for /web
+  .jsonl          one record per line: text in --text-field, id in --id-field
+  .csv            one record per row (the header row names the fields), same fields
+  --urls          the inputs are files of URLs, one per line ('-' reads stdin);
+                  the workers fetch the pages
+
+Output is one JSON object per record, in input order:
+  {"id", "source", "chars", "entities", "pos_tags", "dependencies", "romanized"}
+with only the requested tasks' fields, and "error" for a record that failed.
+
+Records go to a pool of worker processes (one per available core by default,
+each with its own spaCy model) in batches. After every batch the results are
+appended to the output and a checkpoint (OUT.jsonl.checkpoint) records how
+many input records and output bytes are done, so running the same command
+again after an interruption continues where it stopped. An existing output
+without a checkpoint is left alone unless --restart is given. Progress
+(docs/s) is reported on stderr.
+
+term-reference reads the same inputs, counts the terms of every record (one
+record is one document) in the same worker pool, merges the counts and writes
+them as the reference corpus that term_stats.py scores TF-IDF against
+(NLP_TERM_REFERENCE). --update merges into an existing reference file.
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from logconfig import configure_logging
+
+logger = logging.getLogger(__name__)
+
+TASKS = ('ner', 'pos', 'deps', 'romanize')
+TEXT_EXTENSIONS = ('.txt', '.md')
+HTML_EXTENSIONS = ('.html', '.htm')
+INPUT_EXTENSIONS = TEXT_EXTENSIONS + HTML_EXTENSIONS + ('.jsonl', '.csv')
+
+
+# ============================================================================
+# INPUT RECORDS
+# ============================================================================
+
+def _input_files(path):
+    """path itself, or for a directory every input file under it (sorted, so reruns see the same order)."""
+    if not os.path.isdir(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(INPUT_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def _file_records(path, text_field="text", id_field="id", lines=False):
+    """Yield {'id', 'source', and 'text' or 'html'} records from one input file."""
+    lower = path.lower()
+    if lower.endswith('.jsonl'):
+        with open(path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    entry = json.loads(line)
+                    yield {'id': entry.get(id_field, f"{path}:{lineno}"), 'source': path, 'text': entry.get(text_field)}
+    elif lower.endswith('.csv'):
+        with open(path, encoding="utf-8", newline="") as f:
+            for rowno, row in enumerate(csv.DictReader(f), 1):
+                yield {'id': row.get(id_field) or f"{path}:{rowno}", 'source': path, 'text': row.get(text_field)}
+    elif lower.endswith(HTML_EXTENSIONS):
+        with open(path, "rb") as f:
+            # Extracted in the worker, like everything else that costs CPU
+            yield {'id': path, 'source': path, 'html': f.read()}
+    else:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            if lines:
+                for lineno, line in enumerate(f, 1):
+                    if line.strip():
+                        yield {'id': f"{path}:{lineno}", 'source': path, 'text': line.strip()}
+            else:
+                yield {'id': path, 'source': path, 'text': f.read()}
+
+
+def _url_records(path):
+    """Yield {'id', 'source', 'url'} records from a file of URLs ('-' for stdin)."""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    with f:
+        for line in f:
+            url = line.strip()
+            if url and not url.startswith("#"):
+                yield {'id': url, 'source': url, 'url': url}
+
+
+def iter_records(inputs, urls=False, text_field="text", id_field="id", lines=False):
+    """All records of the inputs, in a stable order."""
+    for path in inputs:
+        if urls:
+            yield from _url_records(path)
+            continue
+        for file_path in _input_files(path):
+            yield from _file_records(file_path, text_field=text_field, id_field=id_field, lines=lines)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ============================================================================
+# WORKERS
+# ============================================================================
+
+def _init_worker(model):
+    # Load the model once per worker process rather than on its first batch
+    from models import get_model
+    get_model(model)
+
+
+def _record_texts(records):
+    """
+    The text of each record (fetched, extracted from HTML or as given), or
+    None where there is none. Returns (one output dict per record, texts).
+    """
+    import text_utils
+    from html_extract import extract_text
+
+    urls = [record['url'] for record in records if 'url' in record]
+    fetched = iter(text_utils.fetch_websites_text(urls) if urls else ())
+
+    outputs = []
+    texts = []
+    for record in records:
+        output = {'id': record['id'], 'source': record['source']}
+        if 'url' in record:
+            text = next(fetched)
+        elif 'html' in record:
+            text = extract_text(record['html'])
+        else:
+            text = record['text']
+
+        if not isinstance(text, str) or not text.strip():
+            output['error'] = "Could not fetch the page." if 'url' in record else "No text."
+            text = None
+        else:
+            output['chars'] = len(text)
+        outputs.append(output)
+        texts.append(text)
+    return outputs, texts
+
+
+def process_batch(records, tasks, model=None, batch_size=32):
+    """Run the tasks over a batch of records. Returns one output dict per record, in order."""
+    import text_utils
+
+    outputs, texts = _record_texts(records)
+    todo = [i for i, text in enumerate(texts) if text is not None]
+    spacy_tasks = [task for task in tasks if task in text_utils.TASK_COMPONENTS]
+    if spacy_tasks and todo:
+        try:
+            results = list(text_utils.iter_analyze_batch(
+                [texts[i] for i in todo], tasks=spacy_tasks, batch_size=batch_size, model=model))
+        except Exception as e:
+            # One bad text (e.g. longer than nlp.max_length) shouldn't fail the whole batch
+            logger.warning("Batch failed (%s); processing its records one by one", e)
+            results = []
+            for i in todo:
+                try:
+                    results.extend(text_utils.iter_analyze_batch([texts[i]], tasks=spacy_tasks, model=model))
+                except Exception as e:
+                    results.append({'error': str(e)})
+        for i, result in zip(todo, results):
+            outputs[i].update(result)
+
+    if 'romanize' in tasks:
+        for i in todo:
+            result = text_utils.romanize_text(texts[i])
+            outputs[i]['romanized'] = {key: result[key] for key in ('romanized', 'method', 'detected_script')}
+
+    if 'ner' in tasks:
+        for i in todo:
+            if 'url' in records[i]:
+                text_utils.record_entity_source(texts[i], records[i]['url'])
+
+    return outputs
+
+
+def count_batch(records, model=None, batch_size=32):
+    """Term counts (see term_stats.py) of a batch of records. Returns (TermCounts, one output dict per record)."""
+    import text_utils
+    from term_stats import TermCounts
+
+    outputs, texts = _record_texts(records)
+    todo = [i for i, text in enumerate(texts) if text is not None]
+    try:
+        counts = text_utils.term_counts([texts[i] for i in todo], model=model, batch_size=batch_size)
+    except Exception as e:
+        logger.warning("Batch failed (%s); counting its records one by one", e)
+        counts = TermCounts()
+        for i in todo:
+            try:
+                counts += text_utils.term_counts([texts[i]], model=model)
+            except Exception as e:
+                outputs[i]['error'] = str(e)
+    return counts, outputs
+
+
+def _map_batches(batches, func, args, workers, model):
+    """
+    func(batch, *args) for each batch, yielded in order: in this process
+    (workers=1) or in a pool of worker processes with model loaded.
+    """
+    if workers == 1:
+        _init_worker(model)
+        for batch in batches:
+            yield func(batch, *args)
+        return
+
+    # At most 2 batches per worker in flight, so memory doesn't grow with the corpus
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model,))
+    pending = deque()
+    try:
+        for batch in batches:
+            pending.append(pool.submit(func, batch, *args))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BaseException:
+        # Interrupted, or the caller stopped early
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+
+def available_cores():
+    """CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# ============================================================================
+# INGEST COMMAND
+# ============================================================================
+
+class Checkpoint:
+    """Progress of one ingest run, saved next to its output: records done and output bytes written."""
+
+    def __init__(self, output, signature):
+        self.path = f"{output}.checkpoint"
+        self.signature = signature
+        self.records = 0
+        self.bytes = 0
+
+    def load(self):
+        """Resume from a saved checkpoint, if any. Raises ValueError if it belongs to a different command."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            state = json.load(f)
+        if state['signature'] != self.signature:
+            raise ValueError(f"{self.path} was written by a run with different inputs or options; "
+                             f"use --restart to start over.")
+        self.records = state['records']
+        self.bytes = state['bytes']
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({'signature': self.signature, 'records': self.records, 'bytes': self.bytes}, f)
+        os.replace(tmp_path, self.path)
+
+
+class Progress:
+    """Docs/s and chars/s on stderr, at most every interval seconds."""
+
+    def __init__(self, skipped=0, interval=5.0):
+        self.skipped = skipped
+        self.interval = interval
+        self.docs = 0
+        self.chars = 0
+        self.errors = 0
+        self.start = self._last = time.perf_counter()
+
+    def update(self, outputs):
+        self.docs += len(outputs)
+        self.chars += sum(output.get('chars', 0) for output in outputs)
+        self.errors += sum(1 for output in outputs if 'error' in output)
+        if time.perf_counter() - self._last >= self.interval:
+            self.report()
+
+    def report(self, final=False):
+        self._last = time.perf_counter()
+        elapsed = max(self._last - self.start, 1e-9)
+        print(f"{'done' if final else 'progress'}: {self.skipped + self.docs:,} docs ({self.docs:,} this run, "
+              f"{self.errors:,} errors), {self.docs / elapsed:.1f} docs/s, {self.chars / elapsed:,.0f} chars/s",
+              file=sys.stderr, flush=True)
+
+
+def _signature(args, tasks):
+    """Identify what a run processes, so a checkpoint is only resumed by the same command."""
+    options = [[os.path.abspath(path) for path in args.inputs], tasks, args.model, args.lang,
+               args.urls, args.lines, args.text_field, args.id_field]
+    return hashlib.sha256(json.dumps(options).encode("utf-8")).hexdigest()[:16]
+
+
+def ingest(args):
+    from models import select_model
+
+    tasks = [task.strip() for task in args.tasks.split(",") if task.strip()]
+    unknown = [task for task in tasks if task not in TASKS]
+    if unknown or not tasks:
+        sys.exit(f"--tasks must be drawn from: {', '.join(TASKS)}")
+    try:
+        model = select_model(model=args.model, lang=args.lang)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    checkpoint = Checkpoint(args.output, _signature(args, tasks))
+    if not args.restart:
+        try:
+            checkpoint.load()
+        except ValueError as e:
+            sys.exit(str(e))
+        # Only output this command wrote, up to its checkpoint, is ever truncated
+        written = os.path.getsize(args.output) if os.path.exists(args.output) else 0
+        if written and not os.path.exists(checkpoint.path):
+            sys.exit(f"{args.output} already exists and has no checkpoint to resume from; "
+                     f"use --restart to overwrite it.")
+        if written < checkpoint.bytes:
+            sys.exit(f"{args.output} is shorter than {checkpoint.path} records; use --restart to start over.")
+    if checkpoint.records:
+        print(f"Resuming after {checkpoint.records:,} records", file=sys.stderr)
+
+    records = itertools.islice(
+        iter_records(args.inputs, urls=args.urls, text_field=args.text_field, id_field=args.id_field, lines=args.lines),
+        checkpoint.records, None,
+    )
+    batches = _batches(records, args.batch_size)
+    workers = args.workers or available_cores()
+    progress = Progress(skipped=checkpoint.records, interval=args.progress_interval)
+
+    with open(args.output, "ab") as out:
+        # Drop anything written after the last checkpoint (e.g. a half-written batch)
+        out.truncate(checkpoint.bytes)
+
+        def write(outputs):
+            out.write(b"".join(json.dumps(output, ensure_ascii=False).encode("utf-8") + b"\n" for output in outputs))
+            out.flush()
+            checkpoint.records += len(outputs)
+            checkpoint.bytes = out.tell()
+            checkpoint.save()
+            progress.update(outputs)
+
+        try:
+            for outputs in _map_batches(batches, process_batch, (tasks, model, args.batch_size), workers, model):
+                write(outputs)
+        except KeyboardInterrupt:
+            sys.exit(f"Interrupted after {checkpoint.records:,} records; run the same command again to resume.")
+
+    progress.report(final=True)
+
+
+# ============================================================================
+# TERM-REFERENCE COMMAND
+# ============================================================================
+
+def term_reference(args):
+    from models import select_model
+    from term_stats import TermCounts
+
+    try:
+        model = select_model(model=args.model, lang=args.lang)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    reference = TermCounts()
+    if args.update and os.path.exists(args.output):
+        reference = TermCounts.load(args.output)
+        print(f"Adding to {args.output} ({reference.documents:,} documents)", file=sys.stderr)
+
+    records = iter_records(args.inputs, urls=args.urls, text_field=args.text_field, id_field=args.id_field,
+                           lines=args.lines)
+    workers = args.workers or available_cores()
+    progress = Progress(interval=args.progress_interval)
+    try:
+        for counts, outputs in _map_batches(_batches(records, args.batch_size), count_batch, (model, args.batch_size),
+                                            workers, model):
+            reference += counts
+            progress.update(outputs)
+    except KeyboardInterrupt:
+        sys.exit(f"Interrupted; {args.output} was not written.")
+
+    if args.min_df > 1:
+        reference.prune(args.min_df)
+    reference.save(args.output)
+    progress.report(final=True)
+    print(f"{args.output}: {reference.documents:,} documents, {reference.tokens:,} tokens, "
+          f"{len(reference.document_frequency):,} terms", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="analyze files or URLs into a JSONL file")
+    ingest_parser.add_argument("inputs", nargs="+", help="directories, .txt/.md/.html/.jsonl/.csv files, or URL lists with --urls")
+    ingest_parser.add_argument("--output", "-o", required=True, help="JSONL output file (appended to when resuming)")
+    ingest_parser.add_argument("--tasks", default="ner,pos,deps", help=f"comma-separated, from: {', '.join(TASKS)}")
+    ingest_parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per available core)")
+    ingest_parser.add_argument("--batch-size", type=int, default=32, help="records per batch")
+    ingest_parser.add_argument("--model", help="spaCy pipeline to use (see models.py)")
+    ingest_parser.add_argument("--lang", help="language whose pipeline to use")
+    ingest_parser.add_argument("--urls", action="store_true", help="inputs are files of URLs to fetch")
+    ingest_parser.add_argument("--lines", action="store_true", help="one record per line of .txt/.md files")
+    ingest_parser.add_argument("--text-field", default="text", help="JSONL/CSV field holding the text")
+    ingest_parser.add_argument("--id-field", default="id", help="JSONL/CSV field holding the record id")
+    ingest_parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and overwrite the output")
+    ingest_parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    ingest_parser.add_argument("--log-level", default="WARNING", help="log level (default WARNING)")
+    ingest_parser.set_defaults(handler=ingest)
+
+    reference_parser = commands.add_parser("term-reference", help="count a reference corpus for TF-IDF (NLP_TERM_REFERENCE)")
+    reference_parser.add_argument("inputs", nargs="+", help="directories, .txt/.md/.html/.jsonl/.csv files, or URL lists with --urls")
+    reference_parser.add_argument("--output", "-o", required=True, help="reference file to write (JSON)")
+    reference_parser.add_argument("--update", action="store_true", help="add the inputs' counts to an existing output file")
+    reference_parser.add_argument("--min-df", type=int, default=1,
+                                  help="drop terms found in fewer documents than this (a pruned file undercounts if updated later)")
+    reference_parser.add_argument("--workers", type=int, default=0, help="worker processes (default: one per available core)")
+    reference_parser.add_argument("--batch-size", type=int, default=32, help="records per batch")
+    reference_parser.add_argument("--model", help="spaCy pipeline to use (see models.py)")
+    reference_parser.add_argument("--lang", help="language whose pipeline to use")
+    reference_parser.add_argument("--urls", action="store_true", help="inputs are files of URLs to fetch")
+    reference_parser.add_argument("--lines", action="store_true", help="one record (document) per line of .txt/.md files")
+    reference_parser.add_argument("--text-field", default="text", help="JSONL/CSV field holding the text")
+    reference_parser.add_argument("--id-field", default="id", help="JSONL/CSV field holding the record id")
+    reference_parser.add_argument("--progress-interval", type=float, default=5.0, help="seconds between progress lines")
+    reference_parser.add_argument("--log-level", default="WARNING", help="log level (default WARNING)")
+    reference_parser.set_defaults(handler=term_reference)
+
+    args = parser.parse_args(argv)
+    configure_logging()
+    logging.getLogger().setLevel(args.log_level.upper())
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+displaCy visualizations (the entity view and the dependency view) as bounded HTML fragments.
+
+The views are rendered with page=False: a fragment the templates (or API
+clients) embed, not a full HTML document of its own. Each view is split into
+pages with a size cap, and only the requested page is rendered:
+  ent  pages of up to ENT_PAGE_CHARS characters, cut at whitespace and never
+       inside an entity. Drawn from the text and the entities' character
+       offsets (displaCy's manual input), not from a Doc, so the entities
+       stitched together from the chunks of a long page (text_utils'
+       chunked NER) are drawn without tokenizing the whole page.
+  dep  one SVG per sentence, pages of whole sentences up to DEP_PAGE_TOKENS
+       tokens; a sentence longer than a page is split into pieces of
+       DEP_PAGE_TOKENS tokens, and a sentence (or piece) longer than
+       DEP_SENT_TOKENS is drawn up to that token
+
+A page that isn't the last one ends with a "Render more" button, which
+static/render.js replaces with the next page, fetched from
+/render/<view>/<key>?page=N (see app.py). key is the doc store key the view's
+source was kept under (see doc_store.py): the parsed Doc for the dep view, the
+text and entity offsets for the ent view. The route reads it back and renders
+the one page asked for. With the doc store disabled there is no continuation:
+the first page ends with a note on how much was left out.
+
+Rendered pages are kept in the result cache (cache.py), keyed by the source's
+key, the view, the page and the render options, so the views of one text on
+/ner, /semantic, /analyze and the API's visualize=true responses share them.
+
+Configuration (environment variables):
+  NLP_RENDER_ENT_CHARS         characters per entity view page (default 10000)
+  NLP_RENDER_DEP_TOKENS        tokens per dependency view page (default 200)
+  NLP_RENDER_DEP_SENT_TOKENS   longest sentence drawn in full, in tokens (default 100)
+"""
+import os
+from html import escape
+from urllib.parse import urlencode
+
+from cache import result_cache
+
+VIEWS = ('ent', 'dep')
+
+ENT_PAGE_CHARS = int(os.environ.get("NLP_RENDER_ENT_CHARS", 10000))
+DEP_PAGE_TOKENS = int(os.environ.get("NLP_RENDER_DEP_TOKENS", 200))
+DEP_SENT_TOKENS = int(os.environ.get("NLP_RENDER_DEP_SENT_TOKENS", 100))
+
+# The app route that renders further pages: <CONTINUATION_PATH>/<view>/<key>?page=N
+CONTINUATION_PATH = "/render"
+
+
+def page_ranges(doc):
+    """
+    The (start, end) token ranges of the pages of doc's dep view, none longer
+    than DEP_PAGE_TOKENS. Always at least one page.
+    """
+    ranges = []
+    start = 0
+    for sent in _sentences(doc):
+        if sent.end - start > DEP_PAGE_TOKENS and sent.start > start:
+            # The page ends before the sentence that would overflow it
+            ranges.append((start, sent.start))
+            start = sent.start
+        while sent.end - start > DEP_PAGE_TOKENS:
+            # A sentence longer than a page takes full pages until the rest fits
+            ranges.append((start, start + DEP_PAGE_TOKENS))
+            start += DEP_PAGE_TOKENS
+    if start < len(doc):
+        ranges.append((start, len(doc)))
+    return ranges or [(0, 0)]
+
+
+def entity_page_ranges(text, ents):
+    """
+    The (start, end) character ranges of the pages of the ent view of text,
+    whose entities ents are (start, end, label) in text order. Always at least one page.
+    """
+    ranges = []
+    start = 0
+    i = 0  # first entity not ending before start
+    while start < len(text):
+        end = min(start + ENT_PAGE_CHARS, len(text))
+        if end < len(text):
+            # After the last whitespace in the second half of the page, if there is any
+            half = start + ENT_PAGE_CHARS // 2
+            cut = max(text.rfind(' ', half, end), text.rfind('\n', half, end))
+            if cut >= 0:
+                end = cut + 1
+            while i < len(ents) and ents[i][1] <= end:
+                i += 1
+            if i < len(ents) and ents[i][0] < end:  # don't cut an entity in two
+                end = ents[i][1]
+        ranges.append((start, end))
+        start = end
+    return ranges or [(0, 0)]
+
+
+def entity_source(doc):
+    """The text and (start, end, label) entities of a Doc: what the ent view is drawn from."""
+    return doc.text, [(ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
+
+
+def _sentences(span):
+    # A Doc without sentence boundaries (no parser or senter) is drawn as one sentence
+    doc = getattr(span, 'doc', span)
+    if doc.has_annotation("SENT_START"):
+        return list(span.sents)
+    return [span[:]]
+
+
+def _render_ents(text, ents, start, end):
+    from spacy import displacy
+
+    page = [{'start': ent_start - start, 'end': ent_end - start, 'label': label}
+            for ent_start, ent_end, label in ents if start <= ent_start and ent_end <= end]
+    return displacy.render({'text': text[start:end], 'ents': page}, style="ent", manual=True, page=False)
+
+
+def _parse_sentence(sent, settings):
+    """
+    displacy.parse_deps(sent) with its default options (punctuation merged into
+    the word before it), from the token attributes. parse_deps copies the Doc
+    through to_bytes/from_bytes to merge tokens, which costs more per sentence
+    than drawing the sentence does.
+    """
+    groups = []  # [first token, last token] per word drawn
+    for token in sent:
+        if groups and token.is_punct and not groups[-1][0].is_punct:
+            groups[-1][1] = token
+        else:
+            groups.append([token, token])
+
+    index = {}  # token i -> word index, for every token of a group
+    for n, (first, last) in enumerate(groups):
+        for i in range(first.i, last.i + 1):
+            index[i] = n
+
+    words = []
+    arcs = []
+    for n, (first, last) in enumerate(groups):
+        # A merged word takes the POS, head and label of the group's syntactic root
+        group = sent.doc[first.i:last.i + 1]
+        root = group.root
+        words.append({'text': group.text, 'tag': root.pos_, 'lemma': None})
+        head = index.get(root.head.i)
+        if head is None or head == n:
+            continue
+        if n < head:
+            arcs.append({'start': n, 'end': head, 'label': root.dep_, 'dir': 'left'})
+        else:
+            arcs.append({'start': head, 'end': n, 'label': root.dep_, 'dir': 'right'})
+    return {'words': words, 'arcs': arcs, 'settings': settings}
+
+
+def _render_deps(doc, start, end):
+    from spacy.displacy import get_doc_settings
+    from spacy.displacy.render import DependencyRenderer
+
+    # One renderer for the page: building one looks up the registered displaCy
+    # colors, which costs more than drawing a sentence
+    renderer = DependencyRenderer()
+    settings = get_doc_settings(doc)
+    parts = []
+    for sent in _sentences(doc[start:end]):
+        # Span.sents yields whole sentences: keep the part of a split sentence on this page
+        part = doc[max(sent.start, start):min(sent.end, end)]
+        drawn = part if len(part) <= DEP_SENT_TOKENS else doc[part.start:part.start + DEP_SENT_TOKENS]
+        parts.append(renderer.render([_parse_sentence(drawn, settings)], page=False).strip())
+        if len(part) < len(sent):
+            cut = f", cut after {DEP_SENT_TOKENS}" if drawn is not part else ""
+            parts.append(f'<p class="render-note">Tokens {part.start - sent.start + 1:,} to {part.end - sent.start:,}'
+                         f' of a {len(sent):,}-token sentence{cut}.</p>')
+        elif drawn is not part:
+            parts.append(f'<p class="render-note">Sentence cut after {DEP_SENT_TOKENS} of its {len(sent):,} tokens.</p>')
+    return "".join(parts)
+
+
+def _continuation(view, key, page, left, unit, model):
+    params = {'page': page}
+    if model:
+        params['model'] = model
+    url = f"{CONTINUATION_PATH}/{view}/{key}?{urlencode(params)}"
+    return (f'<div class="render-more" data-url="{escape(url)}">'
+            f'<button type="button">Render more ({left:,} {unit} left)</button></div>')
+
+
+def _cache_key(key, view, page, model, continuable):
+    options = {'view': view, 'page': page, 'model': model, 'continuable': continuable,
+               'limits': [ENT_PAGE_CHARS, DEP_PAGE_TOKENS, DEP_SENT_TOKENS],
+               'paging': 2}  # dep pages no longer run past DEP_PAGE_TOKENS
+    return result_cache.make_key('displacy', key, None, options)
+
+
+def cached_page(key, view, page=0, model=None, continuable=True):
+    """A page of a view already rendered (see render), or None."""
+    return result_cache.get(_cache_key(key, view, page, model, continuable))
+
+
+def render(doc, key, page=0, model=None, continuable=True):
+    """
+    One page of doc's dep view as an HTML fragment, from the fragment cache if
+    it was rendered before. key identifies doc (its doc store key);
+    continuable: whether the continuation route can read doc back by it.
+    Raises IndexError for a page past the last one.
+    """
+    cache_key = _cache_key(key, 'dep', page, model, continuable)
+    html = result_cache.get(cache_key)
+    if html is None:
+        ranges = page_ranges(doc)
+        start, end = _page(ranges, 'dep', page)
+        html = _render_deps(doc, start, end) + _tail('dep', key, page, end, len(doc), 'tokens', model, continuable)
+        result_cache.set(cache_key, html)
+    return html
+
+
+def render_entities(text, ents, key, page=0, model=None, continuable=True):
+    """
+    One page of the ent view of text (entities ents, see entity_source) as
+    an HTML fragment, like render. key identifies the text and entities (their
+    doc store key, see doc_store.DocStore.put_entities).
+    """
+    cache_key = _cache_key(key, 'ent', page, model, continuable)
+    html = result_cache.get(cache_key)
+    if html is None:
+        start, end = _page(entity_page_ranges(text, ents), 'ent', page)
+        html = _render_ents(text, ents, start, end) + _tail('ent', key, page, end, len(text), 'characters', model,
+                                                              continuable)
+        result_cache.set(cache_key, html)
+    return html
+
+
+def _page(ranges, view, page):
+    if not 0 <= page < len(ranges):
+        raise IndexError(f"The {view} view has {len(ranges)} pages; there is no page {page}.")
+    return ranges[page]
+
+
+def _tail(view, key, page, end, total, unit, model, continuable):
+    # What follows a page: the continuation, or a note on what was left out
+    if end >= total:
+        return ''
+    if continuable:
+        return _continuation(view, key, page + 1, total - end, unit, model)
+    return f'<p class="render-note">Showing {end:,} of {total:,} {unit}.</p>'
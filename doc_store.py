@@ -0,0 +1,277 @@
+"""
+Content-addressed store of processed spaCy Docs.
+
+Every view of a text (entities, POS tags, dependencies, the JSON records and
+their displaCy renderings) is built from a Doc, so text_utils keeps the Doc it
+parsed here and builds the next view of the same text from it instead of
+running the pipeline again; the result cache (cache.py) only helps when the
+exact same view is asked for twice.
+
+Each Doc is a one-document DocBin file (the token attributes as one array plus
+the strings they use, compressed) named by a hash of the model version and the
+text, and is read back through mmap. A SQLite table next to the files records
+the pipeline components that produced each Doc, its size and when it was last
+used. A lookup is served by a stored Doc whose components include all the
+ones the caller needs, and the least recently used files are deleted once the
+store outgrows its size limit. All gunicorn workers on the host share the store.
+
+The store also keeps entity sources: a text and its entities' character
+offsets, without a Doc (compressed JSON files, under the same index and size
+limit). The paged entity view is drawn from them (see displacy_render.py),
+so entities found chunk by chunk in a long page can be paged through without
+tokenizing the whole page into one Doc.
+
+Configuration (environment variables):
+  NLP_DOC_STORE             set to 0 to always re-run the pipeline
+  NLP_DOC_STORE_DIR         directory for the store (default: <tmp>/nlp-toolkit-docs)
+  NLP_DOC_STORE_MAX_BYTES   size limit of the stored files in bytes (default 256 MB)
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+_KEY = re.compile(r"[0-9a-f]{64}")
+
+
+class DocStore:
+    """DocBin files keyed by (model version, text hash), with a SQLite index for lookup and LRU eviction."""
+
+    # Check the store's total size every this many writes
+    EVICTION_INTERVAL = 32
+
+    def __init__(self, store_dir=None, max_bytes=256 * 1024 * 1024):
+        self.store_dir = store_dir or os.path.join(tempfile.gettempdir(), "nlp-toolkit-docs")
+        self.db_path = os.path.join(self.store_dir, "docs.sqlite3")
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Build a store configured from the NLP_DOC_STORE_* environment variables."""
+        return cls(
+            store_dir=os.environ.get("NLP_DOC_STORE_DIR") or None,
+            max_bytes=int(os.environ.get("NLP_DOC_STORE_MAX_BYTES", 256 * 1024 * 1024)),
+        )
+
+    @staticmethod
+    def make_key(text, version=None):
+        """Hash (model version, text) into a store key."""
+        digest = hashlib.sha256()
+        digest.update(str(version).encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def _connection(self):
+        """Return this thread's SQLite connection, reopening it after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " key TEXT PRIMARY KEY, components TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS docs_accessed ON docs (accessed)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # Files per kind of stored item: a Doc, or an entity source (text and entity offsets)
+    SUFFIXES = {'doc': '.spacy', 'entities': '.ents'}
+
+    def _path(self, key, kind='doc'):
+        return os.path.join(self.store_dir, key[:2], key + self.SUFFIXES[kind])
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def components(self, text, version=None):
+        """The components the stored Doc for text was processed with (empty if there is none)."""
+        try:
+            row = self._connection().execute(
+                "SELECT components FROM docs WHERE key = ?", (self.make_key(text, version),)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Doc store lookup failed: %s", e)
+            return frozenset()
+        return frozenset(row[0].split(",")) - {""} if row else frozenset()
+
+    def get(self, text, vocab, version=None, components=()):
+        """
+        The stored Doc for text if it was processed with at least the given
+        components, else None. vocab is the Vocab of the pipeline asking.
+        """
+        return self.load(self.make_key(text, version), vocab, components)
+
+    def load(self, key, vocab, components=()):
+        """Like get(), by store key (see make_key). Returns None for a key that isn't stored."""
+        from spacy.tokens import DocBin
+
+        if not _KEY.fullmatch(key):
+            return None
+        try:
+            conn = self._connection()
+            row = conn.execute("SELECT components FROM docs WHERE key = ?", (key,)).fetchone()
+            if row is None or not set(components) <= set(row[0].split(",")):
+                self._count('misses')
+                return None
+
+            with open(self._path(key), "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                doc = next(DocBin().from_bytes(data).get_docs(vocab))
+            with conn:
+                conn.execute("UPDATE docs SET accessed = ? WHERE key = ?", (time.time(), key))
+        except (OSError, ValueError, sqlite3.Error) as e:
+            # e.g. the file was evicted by another worker between the lookup and the read
+            logger.warning("Doc store read failed for %s: %s", key, e)
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return doc
+
+    def put(self, text, doc, version=None, components=()):
+        """Store doc, replacing the text's previous Doc, if any. components: what doc was processed with."""
+        from spacy.tokens import DocBin
+
+        self._write(self.make_key(text, version), 'doc', DocBin(docs=[doc]).to_bytes(), components)
+
+    def put_entities(self, text, ents, version=None):
+        """Store an entity source: text and its (start, end, label) entities. Returns its key."""
+        key = self.make_key(text, version)
+        data = json.dumps({'text': text, 'ents': ents}, ensure_ascii=False).encode("utf-8", "surrogatepass")
+        self._write(key, 'entities', zlib.compress(data), ('entities',))
+        return key
+
+    def has(self, key):
+        """Whether anything is stored under key."""
+        try:
+            return self._connection().execute("SELECT 1 FROM docs WHERE key = ?", (key,)).fetchone() is not None
+        except sqlite3.Error as e:
+            logger.error("Doc store lookup failed: %s", e)
+            return False
+
+    def load_entities(self, key):
+        """The (text, ents) entity source stored under key (see put_entities), or None."""
+        if not _KEY.fullmatch(key):
+            return None
+        try:
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM docs WHERE key = ?", (key,)).fetchone() is None:
+                self._count('misses')
+                return None
+            with open(self._path(key, 'entities'), "rb") as f:
+                source = json.loads(zlib.decompress(f.read()).decode("utf-8", "surrogatepass"))
+            with conn:
+                conn.execute("UPDATE docs SET accessed = ? WHERE key = ?", (time.time(), key))
+        except (OSError, ValueError, zlib.error, sqlite3.Error) as e:
+            logger.warning("Doc store read failed for %s: %s", key, e)
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return source['text'], [tuple(ent) for ent in source['ents']]
+
+    def _write(self, key, kind, data, components):
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key, kind)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # atomic, so a concurrent reader never maps half a file
+
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO docs (key, components, size, accessed) VALUES (?, ?, ?, ?)",
+                    (key, ",".join(sorted(components)), len(data), time.time()),
+                )
+            with self._lock:
+                self._writes += 1
+                evict = self._writes % self.EVICTION_INTERVAL == 0
+            if evict:
+                self._evict(conn)
+        except (OSError, sqlite3.Error) as e:
+            logger.error("Doc store write failed: %s", e)
+
+    def clear(self):
+        """Delete every stored Doc."""
+        conn = self._connection()
+        with conn:
+            keys = [key for (key,) in conn.execute("SELECT key FROM docs")]
+            conn.execute("DELETE FROM docs")
+        for key in keys:
+            self._remove_files(key)
+
+    def stats(self):
+        """Hit/miss/eviction counters for this process, and the store's current size."""
+        with self._lock:
+            stats = dict(self._counters)
+        count, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM docs").fetchone()
+        stats['docs'] = count
+        stats['bytes'] = size
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _remove_files(self, key):
+        for kind in self.SUFFIXES:
+            try:
+                os.remove(self._path(key, kind))
+            except OSError:
+                pass
+
+    def _evict(self, conn):
+        """Delete least recently used Docs until the store fits its size limit."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM docs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM docs ORDER BY accessed"):
+            victims.append(key)
+            excess -= size
+            if excess <= 0:
+                break
+
+        with conn:
+            conn.executemany("DELETE FROM docs WHERE key = ?", [(key,) for key in victims])
+        for key in victims:
+            self._remove_files(key)
+        self._count('evictions', len(victims))
+        logger.debug("Doc store evicted %d docs", len(victims))
+
+
+ENABLED = os.environ.get("NLP_DOC_STORE", "1") != "0"
+
+# Shared instance used by text_utils
+doc_store = DocStore.from_env()
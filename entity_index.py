@@ -0,0 +1,203 @@
+"""
+Persistent index of the named entities found in processed documents.
+
+The NER path (text_utils) records every document it processes: one row per
+entity mention with its character offsets, plus a per-(label, entity) tally
+that is updated as documents are added, so "top ORGs across everything seen"
+is an index scan instead of a re-run of NER over the corpus. Documents are
+keyed by a hash of their text, so a document is only ever indexed once.
+
+Entities are matched case-insensitively: mentions are grouped under their
+casefolded text, and the first surface form seen is the one reported.
+
+Configuration (environment variables):
+  NLP_ENTITY_INDEX       set to 0 to stop the NER path from recording documents
+  NLP_ENTITY_INDEX_DIR   directory for the index (default: <tmp>/nlp-toolkit-entities)
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS documents ("
+    " id INTEGER PRIMARY KEY, doc_key TEXT NOT NULL UNIQUE, source TEXT,"
+    " chars INTEGER NOT NULL, entities INTEGER NOT NULL, added REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS documents_source ON documents (source)",
+    "CREATE TABLE IF NOT EXISTS mentions ("
+    " doc_id INTEGER NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL,"
+    " label TEXT NOT NULL, text TEXT NOT NULL, norm TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS mentions_doc ON mentions (doc_id, start)",
+    "CREATE TABLE IF NOT EXISTS entities ("
+    " label TEXT NOT NULL, norm TEXT NOT NULL, text TEXT NOT NULL,"
+    " mentions INTEGER NOT NULL, documents INTEGER NOT NULL, PRIMARY KEY (label, norm))",
+    "CREATE INDEX IF NOT EXISTS entities_top ON entities (label, mentions DESC)",
+    "CREATE INDEX IF NOT EXISTS entities_mentions ON entities (mentions DESC)",
+    "CREATE INDEX IF NOT EXISTS entities_norm ON entities (norm)",
+)
+
+
+def document_key(text):
+    """Content key of a document: a hash of its text."""
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _normalize(entity_text):
+    return ' '.join(entity_text.split()).casefold()
+
+
+class EntityIndex:
+    """SQLite store of entity mentions per document, with running per-entity tallies."""
+
+    def __init__(self, db_dir=None):
+        self.db_path = os.path.join(db_dir or os.path.join(tempfile.gettempdir(), "nlp-toolkit-entities"),
+                                    "entities.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        """Build an index configured from the NLP_ENTITY_INDEX_DIR environment variable."""
+        return cls(db_dir=os.environ.get("NLP_ENTITY_INDEX_DIR") or None)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # ------------------------------------------------------------------
+    # Adding documents
+    # ------------------------------------------------------------------
+
+    def document_id(self, text):
+        """Id of the document with this text, or None if it hasn't been indexed."""
+        row = self._connection().execute("SELECT id FROM documents WHERE doc_key = ?", (document_key(text),)).fetchone()
+        return row['id'] if row else None
+
+    def add_document(self, text, spans, source=None):
+        """
+        Index a document's entities. spans are (start, end, label, entity_text)
+        tuples. A document already in the index is left as it is (only a missing
+        source is filled in). Returns the document id.
+        """
+        key = document_key(text)
+        conn = self._connection()
+        with conn:
+            row = conn.execute("SELECT id, source FROM documents WHERE doc_key = ?", (key,)).fetchone()
+            if row is not None:
+                if source and not row['source']:
+                    conn.execute("UPDATE documents SET source = ? WHERE id = ?", (source, row['id']))
+                return row['id']
+
+            spans = list(spans)
+            doc_id = conn.execute(
+                "INSERT INTO documents (doc_key, source, chars, entities, added) VALUES (?, ?, ?, ?, ?)",
+                (key, source, len(text), len(spans), time.time()),
+            ).lastrowid
+
+            rows = [(doc_id, start, end, label, entity_text, _normalize(entity_text))
+                    for start, end, label, entity_text in spans]
+            conn.executemany("INSERT INTO mentions (doc_id, start, end, label, text, norm) VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+            # Fold this document into the running tallies
+            counts = Counter((label, norm) for _, _, _, label, _, norm in rows)
+            surface = {}
+            for _, _, _, label, entity_text, norm in rows:
+                surface.setdefault((label, norm), entity_text)
+            conn.executemany(
+                "INSERT INTO entities (label, norm, text, mentions, documents) VALUES (?, ?, ?, ?, 1)"
+                " ON CONFLICT (label, norm) DO UPDATE SET"
+                " mentions = mentions + excluded.mentions, documents = documents + 1",
+                [(label, norm, surface[label, norm], count) for (label, norm), count in counts.items()],
+            )
+
+        logger.debug("Indexed document %d: %d entities (%d distinct)", doc_id, len(rows), len(counts))
+        return doc_id
+
+    def set_source(self, text, source):
+        """Attach a source (e.g. the URL it was fetched from) to an indexed document."""
+        conn = self._connection()
+        with conn:
+            conn.execute("UPDATE documents SET source = ? WHERE doc_key = ?", (source, document_key(text)))
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def top_entities(self, label=None, k=10):
+        """The k entities with the most mentions, optionally of one label."""
+        query = "SELECT text, label, mentions, documents FROM entities"
+        params = ()
+        if label:
+            query += " WHERE label = ?"
+            params = (label,)
+        query += " ORDER BY mentions DESC, documents DESC LIMIT ?"
+        return [dict(row) for row in self._connection().execute(query, (*params, k))]
+
+    def search(self, prefix, label=None, limit=20):
+        """Entities whose text starts with prefix (case-insensitive), most mentioned first."""
+        norm = _normalize(prefix)
+        if not norm:
+            return []
+        # Range scan on the norm index instead of LIKE, which can't use it case-insensitively
+        query = "SELECT text, label, mentions, documents FROM entities WHERE norm >= ? AND norm < ?"
+        params = [norm, norm + '\U0010ffff']
+        if label:
+            query += " AND label = ?"
+            params.append(label)
+        query += " ORDER BY mentions DESC LIMIT ?"
+        return [dict(row) for row in self._connection().execute(query, (*params, limit))]
+
+    def document(self, doc_id):
+        """A document's metadata and its entity mentions in text order, or None if unknown."""
+        conn = self._connection()
+        row = conn.execute("SELECT id, source, chars, entities, added FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        document = dict(row)
+        document['mentions'] = [
+            dict(mention) for mention in conn.execute(
+                "SELECT start, end, label, text FROM mentions WHERE doc_id = ? ORDER BY start", (doc_id,))
+        ]
+        return document
+
+    def documents(self, source=None, limit=100):
+        """Indexed documents (newest first), optionally only those from one source."""
+        query = "SELECT id, source, chars, entities, added FROM documents"
+        params = ()
+        if source:
+            query += " WHERE source = ?"
+            params = (source,)
+        query += " ORDER BY id DESC LIMIT ?"
+        return [dict(row) for row in self._connection().execute(query, (*params, limit))]
+
+    def stats(self):
+        """Document, mention and distinct entity counts."""
+        conn = self._connection()
+        return {
+            'documents': conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            'mentions': conn.execute("SELECT COUNT(*) FROM mentions").fetchone()[0],
+            'entities': conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0],
+        }
+
+
+ENABLED = os.environ.get("NLP_ENTITY_INDEX", "1") != "0"
+
+# Shared instance fed by text_utils and queried by the API
+entity_index = EntityIndex.from_env()
@@ -0,0 +1,284 @@
+"""
+Connection-pooled, caching URL fetcher used by fetch_website_text.
+
+- One pooled requests.Session per process (keep-alive, connection reuse)
+- On-disk page cache keyed by URL that honours Cache-Control/Expires TTLs and
+  revalidates stale pages with If-None-Match / If-Modified-Since
+- fetch_many() fetches many pages concurrently with a per-host concurrency limit
+
+Configuration (environment variables):
+  NLP_FETCH_CACHE_DIR        page cache directory (default: <tmp>/nlp-toolkit-pages)
+  NLP_FETCH_CACHE_TTL        seconds a page is fresh when the server sends no TTL (default 300)
+  NLP_FETCH_CACHE_MAX_BYTES  page cache size limit in bytes (default 256 MB)
+  NLP_FETCH_PER_HOST         concurrent requests per host in fetch_many (default 4)
+  NLP_FETCH_MAX_BYTES        largest page body downloaded, in bytes (default 10 MB)
+"""
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# content: raw response bytes; from_cache: served without a full download (fresh hit or 304)
+FetchResult = namedtuple('FetchResult', ['url', 'status', 'content', 'encoding', 'from_cache'])
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+# Size of the pieces a response body is streamed in
+READ_CHUNK_BYTES = 64 * 1024
+
+
+class PageTooLarge(requests.exceptions.RequestException):
+    """The page body is larger than the fetcher's max_bytes; raised before it is read in full."""
+
+
+class PageCache:
+    """Pages stored as <sha256(url)>.body plus a <sha256(url)>.json metadata file."""
+
+    # Check the cache's total size every this many writes
+    PRUNE_INTERVAL = 64
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + '.json', base + '.body'
+
+    def get(self, url):
+        """Return (meta, body) for url, or None if it isn't cached."""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get('url') != url:
+            return None
+        return meta, body
+
+    def put(self, url, meta, body=None):
+        """Store meta (and body, unless only the metadata changed) atomically."""
+        meta_path, body_path = self._paths(url)
+        if body is not None:
+            self._atomic_write(body_path, body)
+        self._atomic_write(meta_path, json.dumps(dict(meta, url=url)).encode('utf-8'))
+
+        self._writes += 1
+        if self._writes % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def prune(self):
+        """Delete the least recently written pages until the cache fits max_bytes."""
+        bodies = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.body'):
+                stat = entry.stat()
+                bodies.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        for _, size, body_path in sorted(bodies):
+            if total <= self.max_bytes:
+                break
+            for path in (body_path, body_path[:-len('.body')] + '.json'):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            total -= size
+
+
+class Fetcher:
+    """Fetch pages through a pooled session and the on-disk page cache."""
+
+    def __init__(self, cache_dir=None, default_ttl=300, cache_max_bytes=256 * 1024 * 1024,
+                 per_host_limit=4, pool_size=16, timeout=10, headers=None, max_bytes=10 * 1024 * 1024):
+        self.cache = PageCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.per_host_limit = per_host_limit
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.headers = dict(headers or DEFAULT_HEADERS)
+
+        self._session = None
+        self._session_pid = None
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a fetcher configured from the NLP_FETCH_* environment variables."""
+        return cls(
+            cache_dir=os.environ.get("NLP_FETCH_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "nlp-toolkit-pages"),
+            default_ttl=int(os.environ.get("NLP_FETCH_CACHE_TTL", 300)),
+            cache_max_bytes=int(os.environ.get("NLP_FETCH_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+            per_host_limit=int(os.environ.get("NLP_FETCH_PER_HOST", 4)),
+            max_bytes=int(os.environ.get("NLP_FETCH_MAX_BYTES", 10 * 1024 * 1024)),
+        )
+
+    @property
+    def session(self):
+        """The pooled session for this process (sockets must not be shared across a fork)."""
+        with self._lock:
+            if self._session is None or self._session_pid != os.getpid():
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(self.headers)
+                self._session = session
+                self._session_pid = os.getpid()
+            return self._session
+
+    def _host_slot(self, url):
+        """Semaphore limiting concurrent requests to url's host."""
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return slot
+
+    def _expires_at(self, response):
+        """Epoch time until which a response is fresh, or None if it must not be stored."""
+        cache_control = response.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control:
+            return None
+        if 'no-cache' in cache_control:
+            return time.time()
+
+        max_age = _MAX_AGE.search(cache_control)
+        if max_age:
+            return time.time() + int(max_age.group(1))
+
+        expires = response.headers.get('Expires')
+        if expires:
+            try:
+                return email.utils.parsedate_to_datetime(expires).timestamp()
+            except (TypeError, ValueError):
+                return time.time()
+
+        return time.time() + self.default_ttl
+
+    def _read_body(self, url, response):
+        """Stream the response body, raising PageTooLarge as soon as it passes max_bytes."""
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise PageTooLarge(f"{url} is {int(length)} bytes, larger than the {self.max_bytes} byte limit")
+
+        chunks, total = [], 0
+        for chunk in response.iter_content(READ_CHUNK_BYTES):
+            total += len(chunk)
+            if total > self.max_bytes:
+                raise PageTooLarge(f"{url} is larger than the {self.max_bytes} byte limit")
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def fetch(self, url):
+        """
+        Fetch url, serving it from the page cache when fresh and revalidating it
+        when stale. Raises requests.RequestException on network or HTTP errors,
+        and PageTooLarge (a RequestException) for a body over max_bytes.
+        """
+        cached = self.cache.get(url) if self.cache else None
+        if cached is not None:
+            meta, body = cached
+            if meta.get('expires', 0) > time.time():
+                logger.debug("Page cache hit: %s", url)
+                return FetchResult(url, meta.get('status', 200), body, meta.get('encoding'), True)
+
+        headers = {}
+        if cached is not None:
+            if cached[0].get('etag'):
+                headers['If-None-Match'] = cached[0]['etag']
+            if cached[0].get('last_modified'):
+                headers['If-Modified-Since'] = cached[0]['last_modified']
+
+        # The body is streamed, so the connection (and the host slot) is held until it is read
+        with self._host_slot(url), self.session.get(url, headers=headers, timeout=self.timeout,
+                                                    stream=True) as response:
+            if response.status_code == 304 and cached is not None:
+                meta, body = cached
+                expires = self._expires_at(response)
+                if expires is not None:
+                    self.cache.put(url, dict(meta, expires=expires))
+                logger.debug("Page revalidated (304): %s", url)
+                return FetchResult(url, meta.get('status', 200), body, meta.get('encoding'), True)
+
+            response.raise_for_status()  # Raise an error for bad status codes
+            content = self._read_body(url, response)
+
+        expires = self._expires_at(response)
+        if self.cache is not None and expires is not None:
+            self.cache.put(url, {
+                'status': response.status_code,
+                'encoding': response.encoding,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'expires': expires,
+            }, content)
+
+        return FetchResult(url, response.status_code, content, response.encoding, False)
+
+    def fetch_many(self, urls, max_workers=8):
+        """
+        Fetch many URLs concurrently (at most per_host_limit at a time per host).
+        Returns a list aligned with urls holding a FetchResult, or None for a failed URL.
+        """
+        def fetch_one(url):
+            try:
+                return self.fetch(url)
+            except requests.exceptions.RequestException as e:
+                logger.error("Error fetching URL %s: %s", url, e)
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(fetch_one, urls))
+
+
+_default_fetcher = None
+_default_lock = threading.Lock()
+
+
+def default_fetcher():
+    """Process-wide Fetcher configured from the environment."""
+    global _default_fetcher
+    with _default_lock:
+        if _default_fetcher is None:
+            _default_fetcher = Fetcher.from_env()
+        return _default_fetcher
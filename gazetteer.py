@@ -0,0 +1,209 @@
+"""
+Gazetteer NER: known entity names (customers, products, places...) matched
+with a spaCy PhraseMatcher instead of, or in front of, the statistical NER.
+
+The term list is a file given by NLP_GAZETTEER, either JSONL in EntityRuler
+pattern format ({"label": "ORG", "pattern": "Acme Corp"}) or tab-separated
+"LABEL<TAB>term" lines. Tokenizing 100k+ terms is the slow part of building
+the matcher, so the tokenized terms are saved (msgpack) in NLP_GAZETTEER_CACHE,
+keyed by the term file's content, the model and the match attribute; later
+starts load that instead of re-tokenizing. Under gunicorn the gazetteer is
+built in the master (preload) and shared with the forked workers. A process
+rebuilds its gazetteer when the term list file changes.
+
+NER modes (NER_MODES; text_utils and the /ner endpoints take ner_mode=):
+  statistical  the model's NER component only (default)
+  gazetteer    tokenizer + PhraseMatcher; no statistical components run
+  hybrid       gazetteer matches are set first and the statistical NER fills
+               in around them (spaCy's NER keeps entities already on the Doc)
+
+Configuration (environment variables):
+  NLP_NER_MODE            default NER mode (default statistical)
+  NLP_GAZETTEER           term list file (required by the gazetteer and hybrid modes)
+  NLP_GAZETTEER_ATTR      token attribute to match on: LOWER (default, case-insensitive) or ORTH
+  NLP_GAZETTEER_CACHE     directory for compiled term lists (default: <tmp>/nlp-toolkit-gazetteer)
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from models import DEFAULT_MODEL, get_model, model_version
+
+logger = logging.getLogger(__name__)
+
+NER_MODES = ('statistical', 'gazetteer', 'hybrid')
+DEFAULT_NER_MODE = os.environ.get("NLP_NER_MODE", "statistical")
+
+DEFAULT_PATH = os.environ.get("NLP_GAZETTEER") or None
+DEFAULT_ATTR = os.environ.get("NLP_GAZETTEER_ATTR", "LOWER")
+CACHE_DIR = os.environ.get("NLP_GAZETTEER_CACHE") or os.path.join(tempfile.gettempdir(), "nlp-toolkit-gazetteer")
+
+
+def resolve_ner_mode(mode=None):
+    """Validate a requested NER mode; None means DEFAULT_NER_MODE. Raises ValueError."""
+    mode = mode or DEFAULT_NER_MODE
+    if mode not in NER_MODES:
+        raise ValueError(f"Unknown NER mode: {mode}. Expected one of: {', '.join(NER_MODES)}.")
+    if mode != 'statistical' and not DEFAULT_PATH:
+        raise ValueError(f"NER mode {mode} needs a gazetteer. Set NLP_GAZETTEER to a term list file.")
+    return mode
+
+
+def read_terms(path):
+    """Read (label, term) pairs from a JSONL pattern file or a LABEL<TAB>term file."""
+    terms = []
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if isinstance(entry.get("pattern"), str):
+                        terms.append((entry["label"], entry["pattern"]))
+        else:
+            for line in f:
+                label, _, term = line.rstrip("\n").partition("\t")
+                if label and term.strip():
+                    terms.append((label, term.strip()))
+    return terms
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Gazetteer:
+    """A PhraseMatcher over a term list, compiled for one pipeline's vocab and tokenizer."""
+
+    def __init__(self, nlp, path, attr=DEFAULT_ATTR, cache_dir=CACHE_DIR, model_name=None):
+        from spacy.matcher import PhraseMatcher
+        from spacy.tokens import Doc
+
+        self.path = path
+        self.attr = attr
+        # Taken before the file is read: if it changes meanwhile, the next lookup rebuilds
+        self.version = _file_version(path, attr)
+        self.key = hashlib.sha256(
+            f"{_file_digest(path)}:{model_version(model_name)}:{attr}".encode("utf-8")
+        ).hexdigest()[:16]
+        self.matcher = PhraseMatcher(nlp.vocab, attr=attr)
+
+        start = time.perf_counter()
+        tokenized = self._load(cache_dir)
+        from_cache = tokenized is not None
+        if tokenized is None:
+            tokenized = self._compile(nlp, cache_dir)
+
+        # Docs rebuilt from their words skip the tokenizer, which is most of the compile time
+        for label, terms in tokenized.items():
+            self.matcher.add(label, [Doc(nlp.vocab, words=words) for words in terms])
+
+        self.size = sum(len(terms) for terms in tokenized.values())
+        self.labels = sorted(tokenized)
+        logger.info("Gazetteer %s: %d terms, %d labels, ready in %.2fs (%s)", path, self.size, len(self.labels),
+                    time.perf_counter() - start, "cached" if from_cache else "compiled")
+
+    def _cache_path(self, cache_dir):
+        return os.path.join(cache_dir, f"gazetteer-{self.key}.msgpack")
+
+    def _load(self, cache_dir):
+        import srsly
+
+        path = self._cache_path(cache_dir)
+        if not os.path.exists(path):
+            return None
+        try:
+            return srsly.read_msgpack(path)
+        except Exception as e:
+            logger.warning("Ignoring unreadable gazetteer cache %s: %s", path, e)
+            return None
+
+    def _compile(self, nlp, cache_dir):
+        """Tokenize the term list: {label: [[word, ...], ...]}, saved to the cache."""
+        import srsly
+
+        terms = read_terms(self.path)
+        tokenized = {}
+        # Only the tokenizer: the matcher needs the terms tokenized exactly like the texts
+        for (label, _), doc in zip(terms, nlp.tokenizer.pipe(term for _, term in terms)):
+            tokenized.setdefault(label, []).append([token.text for token in doc])
+
+        os.makedirs(cache_dir, exist_ok=True)
+        path = self._cache_path(cache_dir)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        srsly.write_msgpack(tmp_path, tokenized)
+        os.replace(tmp_path, path)  # atomic, so another worker never reads half a file
+        return tokenized
+
+    def spans(self, doc):
+        """Non-overlapping entity spans for the matches in doc (longest match wins)."""
+        from spacy.tokens import Span
+        from spacy.util import filter_spans
+
+        return filter_spans([Span(doc, start, end, label=label_id) for label_id, start, end in self.matcher(doc)])
+
+    def annotate(self, doc):
+        """Set doc.ents to the gazetteer matches and return doc."""
+        doc.ents = self.spans(doc)
+        return doc
+
+
+_gazetteers = {}  # (model name, path, attr) -> Gazetteer
+_lock = threading.Lock()
+
+
+def get_gazetteer(nlp, model_name=None, path=None, attr=None):
+    """
+    The gazetteer for a pipeline, built (or loaded from its compiled cache) on
+    first use, and rebuilt when the term list file changes (gazetteer_version),
+    so results cached under the new version come from the new terms. Raises
+    ValueError if no term list is configured.
+    """
+    path = path or DEFAULT_PATH
+    attr = attr or DEFAULT_ATTR
+    if not path:
+        raise ValueError("No gazetteer configured. Set NLP_GAZETTEER to a term list file.")
+
+    key = (model_name or DEFAULT_MODEL, path, attr)
+    gazetteer = _gazetteers.get(key)
+    if gazetteer is None or _stale(gazetteer):
+        with _lock:
+            gazetteer = _gazetteers.get(key)
+            if gazetteer is None or _stale(gazetteer):
+                if gazetteer is not None:
+                    logger.info("Gazetteer %s changed; rebuilding it", path)
+                gazetteer = _gazetteers[key] = Gazetteer(nlp, path, attr=attr, model_name=model_name)
+    return gazetteer
+
+
+def _stale(gazetteer):
+    # A term list that has gone missing keeps the gazetteer built from it
+    version = _file_version(gazetteer.path, gazetteer.attr)
+    return version is not None and version != gazetteer.version
+
+
+def preload():
+    """Build the configured gazetteer for the default model now (e.g. in the gunicorn master)."""
+    nlp = get_model() if DEFAULT_PATH else None
+    if nlp is not None:
+        get_gazetteer(nlp, DEFAULT_MODEL)
+
+
+def gazetteer_version():
+    """Identify the configured term list, so cached gazetteer results change with it."""
+    return _file_version(DEFAULT_PATH, DEFAULT_ATTR) if DEFAULT_PATH else None
+
+
+def _file_version(path, attr):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}:{attr}"
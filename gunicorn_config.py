@@ -1,2 +1,44 @@
+import logging
+import os
+
 bind = "0.0.0.0:8080"
 workers = 2
+
+# NLP_SERVE_MODE=pooled (see serving.py): threaded workers that hand page fetches
+# to a thread pool and NLP work to a process pool, instead of one request at a time
+if os.environ.get("NLP_SERVE_MODE") == "pooled":
+    worker_class = "gthread"
+    threads = int(os.environ.get("NLP_SERVE_THREADS", 32))
+
+# Shared on-disk tier for the result cache (see cache.py), so a result computed
+# in one worker is also served by the other.
+raw_env = ["NLP_CACHE_DIR=/tmp/nlp-toolkit-cache", "NLP_LOG_PROFILE=production"]
+
+# Import the app once in the master and load the spaCy model there (see
+# models.preload), so forked workers share it copy-on-write instead of each
+# loading its own copy.
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker is forked
+    import gazetteer
+    import metrics
+    import models
+    metrics.registry.reset()  # counters start from zero with each server start
+    gazetteer.preload()  # before models.preload(), whose gc.freeze() then covers it
+    models.preload()
+
+
+def post_worker_init(worker):
+    # Fork the pooled mode's NLP processes before the worker starts its request threads
+    import serving
+    serving.start()
+
+    # Startup report for sizing containers: per-worker memory, with shared pages split out
+    import models
+    report = models.memory_report()
+    logging.getLogger("gunicorn.error").info(
+        "Worker %s ready: rss=%s kB pss=%s kB shared=%s kB private=%s kB",
+        worker.pid, report.get('rss'), report.get('pss'), report.get('shared'), report.get('private'),
+    )
@@ -0,0 +1,190 @@
+"""
+HTML-to-text extraction engines for fetch_website_text.
+
+Every engine returns the same text as the original BeautifulSoup path: drop
+script/style/nav/header/footer, join the remaining strings with single spaces
+and collapse whitespace. <template> content is dropped too: BeautifulSoup's
+get_text() leaves it out, so the other engines skip it explicitly.
+
+Engines:
+  'bs4'     reference implementation: full BeautifulSoup tree with html.parser
+  'stream'  html.parser tokenizer that skips unwanted subtrees and never builds a tree
+  'lxml'    libxml2 parser (optional dependency); fastest on large pages, but
+            libxml2 repairs broken markup differently, so text from malformed
+            pages can differ from the reference
+
+The engine defaults to NLP_HTML_ENGINE (default 'stream'). Cleaned text is
+cached by page content in the shared result cache.
+"""
+import logging
+import os
+from html.parser import HTMLParser
+
+from cache import cached
+
+logger = logging.getLogger(__name__)
+
+SKIP_TAGS = ("script", "style", "nav", "header", "footer", "template")
+
+# Tags html.parser never pushes onto the open-element stack (mirrors
+# BeautifulSoup's HTMLTreeBuilder.empty_element_tags)
+VOID_TAGS = frozenset([
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem',
+    'meta', 'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame',
+    'image', 'isindex', 'nextid', 'spacer',
+])
+
+DEFAULT_ENGINE = os.environ.get("NLP_HTML_ENGINE", "stream")
+
+
+def clean_whitespace(text):
+    """Collapse the whitespace of extracted text the way fetch_website_text always has."""
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+
+def _decode(content):
+    """Decode page bytes with the same encoding detection BeautifulSoup uses."""
+    if isinstance(content, str):
+        return content
+    from bs4.dammit import UnicodeDammit
+    return UnicodeDammit(content, is_html=True).unicode_markup
+
+
+# ============================================================================
+# ENGINES
+# ============================================================================
+
+def _extract_bs4(content):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'html.parser')
+    for element in soup(SKIP_TAGS):
+        element.decompose()
+    return soup.get_text(separator=' ', strip=True)
+
+
+class _TextCollector(HTMLParser):
+    """
+    Tokenize with html.parser, tracking open elements the way BeautifulSoup's
+    tree builder does, and keep only strings outside skipped elements.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.strings = []
+        self._open = []
+        self._skipping = 0
+        self._buffer = []
+
+    def _flush(self):
+        # Adjacent data events form one string, as in a BeautifulSoup NavigableString
+        if self._buffer:
+            if not self._skipping:
+                string = ''.join(self._buffer).strip()
+                if string:
+                    self.strings.append(string)
+            self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush()
+        if tag in VOID_TAGS:
+            return
+        self._open.append(tag)
+        if tag in SKIP_TAGS:
+            self._skipping += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self._flush()
+
+    def handle_endtag(self, tag):
+        self._flush()
+        if tag not in self._open:
+            return  # stray end tag: ignored, as BeautifulSoup does
+        while self._open:
+            name = self._open.pop()
+            if name in SKIP_TAGS:
+                self._skipping -= 1
+            if name == tag:
+                break
+
+    def handle_data(self, data):
+        self._buffer.append(data)
+
+    def handle_comment(self, data):
+        self._flush()
+
+    def handle_decl(self, decl):
+        self._flush()
+
+    def handle_pi(self, data):
+        self._flush()
+
+    def unknown_decl(self, data):
+        self._flush()
+        if data.startswith('CDATA[') and not self._skipping:
+            string = data[len('CDATA['):].strip()
+            if string:
+                self.strings.append(string)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _extract_stream(content):
+    collector = _TextCollector()
+    collector.feed(_decode(content))
+    collector.close()
+    return ' '.join(collector.strings)
+
+
+def _extract_lxml(content):
+    import lxml.html
+    from lxml import etree
+
+    root = lxml.html.fromstring(_decode(content))
+
+    # Walk text and tails in document order, skipping the text inside skipped
+    # elements and comments/PIs but keeping their tails as strings of their own
+    # (etree.strip_elements would glue a tail onto the text before it)
+    strings = []
+    skipping = 0
+    for event, element in etree.iterwalk(root, events=('start', 'end', 'comment', 'pi')):
+        if event == 'start':
+            if element.tag in SKIP_TAGS:
+                skipping += 1
+            elif not skipping and element.text:
+                strings.append(element.text)
+            continue
+        if event == 'end' and element.tag in SKIP_TAGS:
+            skipping -= 1
+        if not skipping and element.tail and element is not root:
+            strings.append(element.tail)
+
+    strings = (value.strip() for value in strings)
+    return ' '.join(value for value in strings if value)
+
+
+ENGINES = {
+    'bs4': _extract_bs4,
+    'stream': _extract_stream,
+    'lxml': _extract_lxml,
+}
+
+
+@cached('html_text')
+def extract_text(content, engine=DEFAULT_ENGINE):
+    """Extract the visible text from an HTML document (bytes or str)."""
+    extractor = ENGINES.get(engine)
+    if extractor is None:
+        raise ValueError(f"Unknown HTML extraction engine: {engine}")
+
+    try:
+        text = extractor(content)
+    except ImportError as e:
+        logger.error("HTML engine %r unavailable (%s); falling back to bs4", engine, e)
+        text = _extract_bs4(content)
+
+    return clean_whitespace(text)
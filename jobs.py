@@ -0,0 +1,195 @@
+"""
+Background job queue for heavy analyses (/semantic, /wordcloud, /web).
+
+Submitting returns a job id straight away. A bounded pool of worker threads in
+the submitting process runs the matching text_utils function, so a long input
+no longer holds a gunicorn worker for the whole pipeline run. Job state is kept
+in a SQLite file, so /jobs/<id> can be answered by any gunicorn worker, not just
+the one that accepted the job.
+
+Backpressure: each process accepts at most NLP_JOBS_WORKERS running plus
+NLP_JOBS_MAX_QUEUE waiting jobs; further submissions raise QueueFullError
+(HTTP 429) until a slot frees up.
+
+Configuration (environment variables):
+  NLP_JOBS_WORKERS     worker threads per process (default 2)
+  NLP_JOBS_MAX_QUEUE   jobs waiting for a worker per process (default 16)
+  NLP_JOBS_DIR         directory for the shared job store (default: <tmp>/nlp-toolkit-jobs)
+  NLP_JOBS_TTL         seconds finished jobs are kept (default 3600)
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models import select_model
+from text_utils import (extract_dependencies, extract_named_entities_chunked, fetch_website_text, generate_wordcloud,
+                        record_entity_source)
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+# ============================================================================
+# JOB TASKS (JSON-serializable wrappers around text_utils)
+# ============================================================================
+
+def _semantic_job(text, model=None, lang=None):
+    dependencies, dep_html = extract_dependencies(text, model=select_model(model, lang, text))
+    if dependencies is None:
+        raise RuntimeError("Unable to process the text for semantic parsing.")
+    return {'dependencies': dependencies, 'dep_html': dep_html}
+
+
+def _wordcloud_job(text, max_words=100, image_format='png'):
+    image = generate_wordcloud(text, max_words=max_words, image_format=image_format)
+    if image is None:
+        raise RuntimeError("Error generating word cloud.")
+    return {'image': image, 'image_format': image_format, 'word_count': len(text.split())}
+
+
+def _web_job(url, model=None, lang=None):
+    text = fetch_website_text(url)
+    if text is None:
+        raise RuntimeError("Error fetching or processing the URL.")
+    named_entities, displacy_html = extract_named_entities_chunked(text, model=select_model(model, lang, text))
+    if named_entities is None:
+        raise RuntimeError("Unable to process the page text.")
+    record_entity_source(text, url)
+    return {'named_entities': named_entities, 'displacy_html': displacy_html}
+
+
+JOB_TASKS = {
+    'semantic': _semantic_job,
+    'wordcloud': _wordcloud_job,
+    'web': _web_job,
+}
+
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+class JobQueue:
+    """Bounded thread pool plus a SQLite job store shared across processes."""
+
+    def __init__(self, tasks, workers=2, max_queue=16, db_dir=None, ttl=3600):
+        self.tasks = tasks
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.db_path = os.path.join(db_dir or os.path.join(tempfile.gettempdir(), "nlp-toolkit-jobs"), "jobs.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+        self._pool = None
+        self._pool_pid = None
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls, tasks):
+        """Build a queue configured from the NLP_JOBS_* environment variables."""
+        return cls(
+            tasks,
+            workers=int(os.environ.get("NLP_JOBS_WORKERS", 2)),
+            max_queue=int(os.environ.get("NLP_JOBS_MAX_QUEUE", 16)),
+            db_dir=os.environ.get("NLP_JOBS_DIR") or None,
+            ttl=int(os.environ.get("NLP_JOBS_TTL", 3600)),
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, task TEXT NOT NULL, status TEXT NOT NULL,"
+            " submitted REAL NOT NULL, started REAL, finished REAL, result TEXT, error TEXT)"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _executor(self):
+        """The worker pool for this process (threads don't survive a fork)."""
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="nlp-job")
+                self._pool_pid = os.getpid()
+                self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+            return self._pool
+
+    def _update(self, job_id, **fields):
+        conn = self._connection()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def submit(self, task, **params):
+        """
+        Queue task(**params) and return its job id.
+        Raises ValueError for an unknown task and QueueFullError when at capacity.
+        """
+        if task not in self.tasks:
+            raise ValueError(f"Unknown job task: {task}")
+
+        executor = self._executor()
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError(f"Job queue is full ({self.workers} running, {self.max_queue} waiting)")
+
+        try:
+            job_id = uuid.uuid4().hex
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (time.time() - self.ttl,))
+                conn.execute(
+                    "INSERT INTO jobs (id, task, status, submitted) VALUES (?, ?, 'queued', ?)",
+                    (job_id, task, time.time()),
+                )
+            executor.submit(self._run, job_id, task, params)
+        except Exception:
+            self._slots.release()
+            raise
+
+        logger.debug("Queued job %s (%s)", job_id, task)
+        return job_id
+
+    def _run(self, job_id, task, params):
+        try:
+            self._update(job_id, status='running', started=time.time())
+            result = self.tasks[task](**params)
+            self._update(job_id, status='finished', finished=time.time(), result=json.dumps(result))
+            logger.debug("Job %s (%s) finished", job_id, task)
+        except Exception as e:
+            logger.error("Job %s (%s) failed: %s", job_id, task, e)
+            try:
+                self._update(job_id, status='failed', finished=time.time(), error=str(e))
+            except sqlite3.Error as db_error:
+                logger.error("Could not record failure of job %s: %s", job_id, db_error)
+        finally:
+            self._slots.release()
+
+    def get(self, job_id):
+        """Return the job's status dict (with its result once finished), or None if unknown."""
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+
+job_queue = JobQueue.from_env(JOB_TASKS)
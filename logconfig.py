@@ -0,0 +1,152 @@
+"""
+Logging setup, applied by app.create_app(); importing a module never configures logging.
+
+Hot-path log calls use %-style arguments, so nothing is formatted unless the
+record is emitted, and wrap input texts and result lists in preview(), which
+renders at most PREVIEW_CHARS characters of them. High-volume debug events
+pass extra=SAMPLED; SamplingFilter keeps only a fraction of those.
+
+Profiles:
+  development  DEBUG, plain text lines, every sampled event kept, 200-char previews
+  production   INFO, one JSON object per line, 1% of sampled events kept, 80-char previews
+
+Configuration (environment variables):
+  NLP_LOG_PROFILE         'development' (default) or 'production'
+  NLP_LOG_LEVEL           overrides the profile's level (e.g. DEBUG)
+  NLP_LOG_SAMPLE_RATE     overrides the fraction of sampled events kept (0-1)
+  NLP_LOG_PREVIEW_CHARS   overrides the preview size
+"""
+import json
+import logging
+import os
+import threading
+
+PROFILES = {
+    'development': {'level': 'DEBUG', 'json': False, 'sample_rate': 1.0, 'preview_chars': 200},
+    'production': {'level': 'INFO', 'json': True, 'sample_rate': 0.01, 'preview_chars': 80},
+}
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Pass as extra= on high-volume debug calls so SamplingFilter can thin them out
+SAMPLED = {'sampled': True}
+
+# Set by configure_logging(); read when a preview is formatted
+PREVIEW_CHARS = PROFILES['development']['preview_chars']
+
+
+class Preview:
+    """A log argument that renders a capped repr of value, and only when the record is emitted."""
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        limit = self.limit or PREVIEW_CHARS
+        value = self.value
+        if isinstance(value, (str, bytes)):
+            if len(value) <= limit:
+                return repr(value)
+            return f"{value[:limit]!r}... ({len(value)} chars)"
+
+        if isinstance(value, (list, tuple)):
+            # repr items one by one until the budget is spent, not the whole list
+            parts = []
+            used = 0
+            for item in value:
+                part = repr(item)
+                if used + len(part) > limit:
+                    return f"[{', '.join(parts)}, ...] ({len(value)} items)"
+                parts.append(part)
+                used += len(part) + 2
+            return repr(value)
+
+        text = repr(value)
+        return text if len(text) <= limit else f"{text[:limit]}..."
+
+    __repr__ = __str__
+
+
+def preview(value, limit=None):
+    """Wrap a log argument so at most limit (default PREVIEW_CHARS) characters of it are logged."""
+    return Preview(value, limit)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep records logged with extra=SAMPLED at the given rate: the first one from
+    each call site, then every 1/rate-th. Other records always pass.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.every = 0 if rate <= 0 else max(1, round(1 / rate))
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        if self.every == 0:
+            return False
+        if self.every == 1:
+            return True
+
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(site, 0)
+            self._counts[site] = count + 1
+        if count % self.every:
+            return False
+        record.sample_every = self.every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        if getattr(record, 'sample_every', None):
+            entry['sample_every'] = record.sample_every
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(profile=None):
+    """
+    Install the root handler for the given profile (default NLP_LOG_PROFILE),
+    replacing one installed by an earlier call. Returns the profile name.
+    """
+    global PREVIEW_CHARS
+
+    name = profile or os.environ.get("NLP_LOG_PROFILE", "development")
+    if name not in PROFILES:
+        raise ValueError(f"Unknown logging profile: {name}")
+    settings = PROFILES[name]
+
+    level = os.environ.get("NLP_LOG_LEVEL") or settings['level']
+    sample_rate = float(os.environ.get("NLP_LOG_SAMPLE_RATE", settings['sample_rate']))
+    PREVIEW_CHARS = int(os.environ.get("NLP_LOG_PREVIEW_CHARS", settings['preview_chars']))
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if settings['json'] else logging.Formatter(TEXT_FORMAT))
+    handler.addFilter(SamplingFilter(sample_rate))
+    handler.nlp_toolkit = True
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if getattr(h, 'nlp_toolkit', False)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    return name
@@ -0,0 +1,330 @@
+"""
+Request, stage and spaCy component metrics, exposed on /metrics in the
+Prometheus text format.
+
+Each process keeps its counters and histograms in memory and writes a snapshot
+of them to a SQLite file at most every NLP_METRICS_FLUSH_INTERVAL seconds (and
+whenever it answers /metrics). A scrape sums the snapshots of every process, so
+whichever gunicorn worker answers reports the whole server; other workers'
+numbers can lag by up to the flush interval.
+
+Snapshots are keyed by process id and start time, so a new process that gets
+an old one's pid doesn't overwrite its numbers. A forked process starts from
+zero rather than from a copy of its parent's values. When a scrape finds a
+process gone, its last snapshot is folded into one retained total and its row
+deleted, so the table stays small and the counters never go backwards.
+
+Instrumented code wraps its work in `with stage(name, size=len(text))`, which
+records the stage's duration, the size of its input, and, while a request
+trace is active (see start_trace), the stage timings of the current request.
+
+Configuration (environment variables):
+  NLP_METRICS_DIR              directory for the shared store (default: <tmp>/nlp-toolkit-metrics)
+  NLP_METRICS_FLUSH_INTERVAL   seconds between snapshot writes per process (default 5)
+  NLP_PROFILE_DIR              enables per-request profiles (X-NLP-Profile header) written here
+"""
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Default Prometheus latency buckets (seconds) and input size buckets (characters/bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'nlp_http_requests_total': ('counter', 'HTTP requests by endpoint, method and status.', None),
+    'nlp_http_request_seconds': ('histogram', 'HTTP request latency by endpoint.', LATENCY_BUCKETS),
+    'nlp_http_request_bytes': ('histogram', 'HTTP request body size by endpoint.', SIZE_BUCKETS),
+    'nlp_stage_seconds': ('histogram', 'Time spent in each processing stage.', LATENCY_BUCKETS),
+    'nlp_stage_input_size': ('histogram', 'Input size (characters, or bytes for pages) per stage.', SIZE_BUCKETS),
+    'nlp_stage_errors_total': ('counter', 'Stages that raised an exception.', None),
+    'nlp_spacy_component_seconds': ('histogram', 'Time spent in each spaCy pipeline component.', LATENCY_BUCKETS),
+}
+
+
+class MetricsRegistry:
+    """In-process counters and histograms plus the shared SQLite snapshot store."""
+
+    def __init__(self, store_dir=None, flush_interval=5.0):
+        self.db_path = os.path.join(store_dir or os.path.join(tempfile.gettempdir(), "nlp-toolkit-metrics"),
+                                    "metrics.sqlite3")
+        self.flush_interval = flush_interval
+        self._values = {}  # (name, labels) -> float for counters, [bucket counts..., sum, count] for histograms
+        self._pid = os.getpid()
+        self._started = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_flush = 0.0
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        """Build a registry configured from the NLP_METRICS_* environment variables."""
+        return cls(
+            store_dir=os.environ.get("NLP_METRICS_DIR") or None,
+            flush_interval=float(os.environ.get("NLP_METRICS_FLUSH_INTERVAL", 5)),
+        )
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+
+    def _own_values(self):
+        # Called with the lock held. After a fork the values are the parent's, which
+        # the parent reports itself: the child starts from zero, as a process of its own.
+        if self._pid != os.getpid():
+            self._values = {}
+            self._pid = os.getpid()
+            self._started = time.time()
+            self._last_flush = 0.0
+        return self._values
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            values = self._own_values()
+            values[key] = values.get(key, 0) + amount
+        self._maybe_flush()
+
+    def observe(self, name, value, count=1, **labels):
+        """Add count observations of value to a histogram."""
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            values = self._own_values()
+            series = values.get(key)
+            if series is None:
+                series = values[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += count
+                    break
+            series[-2] += value * count
+            series[-1] += count
+        self._maybe_flush()
+
+    # ------------------------------------------------------------------
+    # Shared store
+    # ------------------------------------------------------------------
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # pid 0 holds the retained total of processes that are gone
+        conn.execute("CREATE TABLE IF NOT EXISTS process_snapshots ("
+                     " pid INTEGER NOT NULL, started REAL NOT NULL, updated REAL NOT NULL, data TEXT NOT NULL,"
+                     " PRIMARY KEY (pid, started))")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _snapshot(self):
+        with self._lock:
+            values = self._own_values()
+            return self._pid, self._started, [[name, list(labels), value] for (name, labels), value in values.items()]
+
+    def _maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this process's snapshot to the shared store."""
+        self._last_flush = time.monotonic()
+        try:
+            pid, started, snapshot = self._snapshot()
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO process_snapshots (pid, started, updated, data) VALUES (?, ?, ?, ?)",
+                    (pid, started, time.time(), json.dumps(snapshot)),
+                )
+        except sqlite3.Error as e:
+            logger.error("Metrics flush failed: %s", e)
+
+    def reset(self):
+        """Forget this process's values and every stored snapshot (e.g. when the server starts)."""
+        with self._lock:
+            self._own_values().clear()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM process_snapshots")
+        except sqlite3.Error as e:
+            logger.error("Metrics reset failed: %s", e)
+
+    def collect(self):
+        """Sum the snapshots of every process: {(name, labels): value}."""
+        self.flush()
+        conn = self._connection()
+        try:
+            self._retire(conn)
+        except sqlite3.Error as e:
+            logger.error("Metrics snapshot pruning failed: %s", e)
+        totals = {}
+        for (data,) in conn.execute("SELECT data FROM process_snapshots"):
+            _add_snapshot(totals, json.loads(data))
+        return totals
+
+    def _retire(self, conn):
+        """Fold the snapshots of processes that are gone into the retained total (pid 0)."""
+        rows = conn.execute("SELECT pid, started FROM process_snapshots WHERE pid != 0").fetchall()
+        gone = [(pid, started) for pid, started in rows if not _alive(pid)]
+        if not gone:
+            return
+
+        # One scraper at a time, so a snapshot is never folded in twice
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            retained = {}
+            row = conn.execute("SELECT data FROM process_snapshots WHERE pid = 0").fetchone()
+            if row:
+                _add_snapshot(retained, json.loads(row[0]))
+            folded = 0
+            for pid, started in gone:
+                row = conn.execute("SELECT data FROM process_snapshots WHERE pid = ? AND started = ?",
+                                   (pid, started)).fetchone()
+                if row is None:
+                    continue  # folded by another scraper already
+                _add_snapshot(retained, json.loads(row[0]))
+                conn.execute("DELETE FROM process_snapshots WHERE pid = ? AND started = ?", (pid, started))
+                folded += 1
+            data = [[name, list(labels), value] for (name, labels), value in retained.items()]
+            conn.execute("INSERT OR REPLACE INTO process_snapshots (pid, started, updated, data) VALUES (0, 0, ?, ?)",
+                         (time.time(), json.dumps(data)))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        logger.debug("Metrics: folded the snapshots of %d exited processes", folded)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        totals = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            series = sorted((labels, value) for (metric, labels), value in totals.items() if metric == name)
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in series:
+                if kind == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _add_snapshot(totals, snapshot):
+    for name, labels, value in snapshot:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        if isinstance(value, list):
+            current = totals.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                current[i] += v
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # someone else's process
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Shared instance used by text_utils and app
+registry = MetricsRegistry.from_env()
+
+
+# ============================================================================
+# STAGE TIMING AND REQUEST TRACES
+# ============================================================================
+
+_trace = threading.local()
+
+
+def start_trace():
+    """Start collecting (stage, seconds) pairs for the current thread's request."""
+    _trace.stages = []
+
+
+def end_trace():
+    """Stop collecting and return the stages recorded since start_trace()."""
+    stages = getattr(_trace, 'stages', None) or []
+    _trace.stages = None
+    return stages
+
+
+@contextmanager
+def stage(name, size=None):
+    """Time a processing stage; size (if given) goes to the input size histogram."""
+    if size is not None:
+        registry.observe('nlp_stage_input_size', size, stage=name)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc('nlp_stage_errors_total', stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe('nlp_stage_seconds', elapsed, stage=name)
+        stages = getattr(_trace, 'stages', None)
+        if stages is not None:
+            stages.append((name, elapsed))
+
+
+def observe_component(name, seconds, docs=1):
+    """
+    Record the time one spaCy pipeline component took on one Doc, or on a
+    batch of docs Docs (nlp.pipe), counted as that time spread evenly over them.
+    """
+    registry.observe('nlp_spacy_component_seconds', seconds / docs, count=docs, component=name)
+    stages = getattr(_trace, 'stages', None)
+    if stages is not None:
+        stages.append((f"spacy.{name}", seconds))
+
+
+def server_timing(stages):
+    """Format stage timings as a Server-Timing header value (durations in ms, repeated stages summed)."""
+    totals = {}
+    for name, seconds in stages:
+        totals[name] = totals.get(name, 0) + seconds
+    return ", ".join(f"{name.replace('.', '-')};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+PROFILE_DIR = os.environ.get("NLP_PROFILE_DIR") or None
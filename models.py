@@ -0,0 +1,263 @@
+"""
+spaCy model pool.
+
+Several pipelines (languages, sizes) can be served side by side. Requests are
+routed to one by `model` name or `lang` code (see select_model), optionally by
+the detected language of their text. Models are loaded lazily on first use, so importing the app (dev server, CLI
+tools, tests) is fast. Under gunicorn, gunicorn_config.py sets preload_app and
+calls preload() in the master, which loads the models and warms the heavy
+imports once, then freezes the garbage collector's view of those objects
+(gc.freeze) so forked workers share the pages copy-on-write instead of
+dirtying them on their first collection.
+
+When the loaded models outgrow NLP_MODEL_MEMORY_MB, the least recently used
+ones are unloaded (the default model stays, as its pages are shared).
+
+Configuration (environment variables):
+  NLP_MODEL             default spaCy pipeline (default en_core_web_sm)
+  NLP_LANG_MODELS       pipeline per language, e.g. "en=en_core_web_sm,de=de_core_news_md"
+  NLP_MODELS            further pipelines requests may name, e.g. "en_core_web_lg"
+  NLP_MODEL_MEMORY_MB   per-process budget for loaded pipelines (default 0: unlimited)
+  NLP_DETECT_LANGUAGE   1 to route requests without model/lang by detected language
+                        (langdetect if installed, otherwise by writing system)
+"""
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from importlib import import_module, metadata
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.environ.get("NLP_MODEL", "en_core_web_sm")
+
+
+def _parse_language_models(value):
+    """'en=en_core_web_sm,de=de_core_news_sm' -> {'en': 'en_core_web_sm', 'de': 'de_core_news_sm'}"""
+    mapping = {}
+    for item in value.split(","):
+        lang, _, name = item.partition("=")
+        if lang.strip() and name.strip():
+            mapping[lang.strip()] = name.strip()
+    return mapping
+
+
+# Pipeline used for each language code (routing by `lang`)
+LANGUAGE_MODELS = _parse_language_models(os.environ.get("NLP_LANG_MODELS", "")) or {"en": DEFAULT_MODEL}
+
+# Pipelines a request may ask for by name (routing by `model`). Requests can't
+# make the server spacy.load() arbitrary names or paths.
+ALLOWED_MODELS = frozenset(
+    [name.strip() for name in os.environ.get("NLP_MODELS", "").split(",") if name.strip()]
+    + [DEFAULT_MODEL, *LANGUAGE_MODELS.values()]
+)
+
+# Memory the loaded pipelines may use per process (by their measured load cost)
+# before the least recently used one is unloaded. 0 means no limit.
+MEMORY_BUDGET_MB = int(os.environ.get("NLP_MODEL_MEMORY_MB", 0))
+
+# Route requests without `model` or `lang` by the detected language of their text
+DETECT_LANGUAGE = os.environ.get("NLP_DETECT_LANGUAGE", "0") == "1"
+
+# Modules the request handlers import lazily; preload() imports them in the master
+WARM_IMPORTS = ("spacy", "spacy.displacy", "wordcloud", "requests", "bs4", "fetcher", "html_extract")
+
+_models = OrderedDict()  # name -> loaded Language, least recently used first
+_failed = set()  # names that couldn't be loaded; not retried
+_load_times = {}
+_sizes = {}  # name -> kB the process grew by when loading it
+_lock = threading.Lock()
+
+
+def _rss_kb():
+    return memory_report().get('rss')
+
+
+def _evict(keep):
+    """Unload least recently used models until the pool fits the budget. Caller holds the lock."""
+    if not MEMORY_BUDGET_MB:
+        return
+    budget_kb = MEMORY_BUDGET_MB * 1024
+    for name in list(_models):
+        if sum(_sizes.get(loaded, 0) for loaded in _models) <= budget_kb:
+            break
+        if name in (keep, DEFAULT_MODEL):
+            continue  # the default model is shared copy-on-write with the other workers
+        del _models[name]
+        logger.info("Unloaded spaCy model %s (%s kB) to stay within %d MB", name, _sizes.get(name), MEMORY_BUDGET_MB)
+    gc.collect()
+
+
+def get_model(name=None):
+    """
+    Return the named spaCy pipeline (default DEFAULT_MODEL), loading it on
+    first use and evicting least recently used ones beyond the memory budget.
+    Returns None if it can't be loaded.
+    """
+    name = name or DEFAULT_MODEL
+    nlp = _models.get(name)
+    if nlp is not None:
+        with _lock:
+            if name in _models:
+                _models.move_to_end(name)
+        return nlp
+    if name in _failed:
+        return None
+
+    with _lock:
+        if name not in _models and name not in _failed:
+            start = time.perf_counter()
+            rss_before = _rss_kb()
+            try:
+                import spacy
+
+                logger.debug("Loading spaCy model %s...", name)
+                _models[name] = spacy.load(name)
+                logger.debug("spaCy model %s loaded successfully.", name)
+            except Exception as e:
+                logger.error("Error loading spaCy model %s: %s", name, e)
+                _failed.add(name)  # Don't retry on every request
+            _load_times[name] = time.perf_counter() - start
+            if name in _models and rss_before is not None:
+                _sizes[name] = max(0, _rss_kb() - rss_before)
+            _evict(keep=name)
+        return _models.get(name)
+
+
+def model_version(name=None):
+    """Identify a model (name + installed package version) without loading it."""
+    name = name or DEFAULT_MODEL
+    try:
+        return f"{name}-{metadata.version(name)}"
+    except metadata.PackageNotFoundError:
+        nlp = _models.get(name)
+        if nlp is None:
+            return name
+        return f"{name}-{nlp.meta.get('version')}"
+
+
+def pool_stats():
+    """Routing configuration and the models loaded in this process (least recently used first)."""
+    return {
+        'default': DEFAULT_MODEL,
+        'languages': LANGUAGE_MODELS,
+        'allowed': sorted(ALLOWED_MODELS),
+        'memory_budget_mb': MEMORY_BUDGET_MB,
+        'detect_language': DETECT_LANGUAGE,
+        'loaded': [{'name': name, 'load_s': _load_times.get(name), 'size_kb': _sizes.get(name)} for name in _models],
+        'failed': sorted(_failed),
+    }
+
+
+# ============================================================================
+# ROUTING
+# ============================================================================
+
+# Language of each romanization script, for detection without langdetect
+_SCRIPT_LANGUAGES = {
+    'Chinese': 'zh',
+    'Japanese': 'ja',
+    'Korean': 'ko',
+    'Cyrillic': 'ru',
+    'Arabic': 'ar',
+    'Greek': 'el',
+}
+
+
+def detect_language(text, sample_chars=2000):
+    """
+    Best-guess ISO 639-1 code of text, or None. Uses langdetect when it is
+    installed; otherwise the writing system decides (Latin script -> None).
+    Only the first sample_chars characters are looked at.
+    """
+    sample = text[:sample_chars]
+    try:
+        from langdetect import DetectorFactory, LangDetectException, detect
+    except ImportError:
+        from romanization import detect_script
+        return _SCRIPT_LANGUAGES.get(detect_script(sample))
+
+    DetectorFactory.seed = 0  # deterministic results
+    try:
+        return detect(sample).split("-")[0]
+    except LangDetectException:
+        return None
+
+
+def select_model(model=None, lang=None, text=None):
+    """
+    Pick the pipeline for a request: an explicit `model` (must be in
+    ALLOWED_MODELS), else the model for `lang` ('auto' detects it from text),
+    else, with NLP_DETECT_LANGUAGE=1, the model for the detected language,
+    else DEFAULT_MODEL. Raises ValueError for an unknown model or language.
+    """
+    if model:
+        if not isinstance(model, str) or model not in ALLOWED_MODELS:
+            raise ValueError(f"Unknown model: {model}")
+        return model
+
+    if lang == "auto" or (not lang and DETECT_LANGUAGE and text):
+        detected = detect_language(text or "")
+        logger.debug("Detected language: %s", detected)
+        # Fall back to the default model for languages without a pipeline
+        return LANGUAGE_MODELS.get(detected, DEFAULT_MODEL)
+
+    if lang:
+        if not isinstance(lang, str) or lang not in LANGUAGE_MODELS:
+            raise ValueError(f"No model for language: {lang}")
+        return LANGUAGE_MODELS[lang]
+
+    return DEFAULT_MODEL
+
+
+def preload(names=(DEFAULT_MODEL,), warm_imports=True, freeze=True):
+    """
+    Load models (and the lazily imported modules) now, e.g. in the gunicorn
+    master before it forks. With freeze=True everything allocated so far is
+    moved out of the garbage collector's generations so that collections in
+    the workers don't write to, and so un-share, those pages.
+    """
+    start = time.perf_counter()
+    if warm_imports:
+        for module in WARM_IMPORTS:
+            try:
+                import_module(module)
+            except ImportError as e:
+                logger.warning("Could not preload %s: %s", module, e)
+
+    for name in names:
+        get_model(name)
+
+    if freeze:
+        gc.collect()
+        gc.freeze()
+
+    logger.info("Preloaded %s in %.2fs", ', '.join(names), time.perf_counter() - start)
+
+
+def memory_report():
+    """
+    Memory of the current process in kB: rss, pss (RSS with shared pages split
+    between the processes sharing them), shared and private. Linux only;
+    returns {} elsewhere.
+    """
+    fields = {
+        'Rss': 'rss',
+        'Pss': 'pss',
+        'Shared_Clean': 'shared',
+        'Shared_Dirty': 'shared',
+        'Private_Clean': 'private',
+        'Private_Dirty': 'private',
+    }
+    report = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    report[fields[key]] = report.get(fields[key], 0) + int(value.split()[0])
+    except OSError:
+        pass
+    return report
@@ -0,0 +1,105 @@
+"""
+POS visualization renderer (the color-coded word/tag view on /pos).
+
+Everything that depends only on the tag is built once at import: the
+stylesheet (one CSS class per POS tag instead of an inline style per token)
+and the HTML fragment that closes each token's box. Rendering a Doc is then a
+single pass that collects the (text, pos, tag) tuples, the grouped words and
+the token HTML together.
+
+render_tokens() renders one Doc's token boxes without the DOC_OPEN /
+DOC_CLOSE wrapper, so text_utils.iter_pos_html can send a long document as a
+chunked response, one piece per chunk Doc inside a single wrapper.
+"""
+from html import escape
+
+# Color mapping for different POS categories
+POS_COLORS = {
+    'NOUN': '#3498db',      # Blue
+    'PROPN': '#2980b9',     # Dark Blue
+    'VERB': '#e74c3c',      # Red
+    'ADJ': '#2ecc71',       # Green
+    'ADV': '#f39c12',       # Orange
+    'PRON': '#9b59b6',      # Purple
+    'DET': '#1abc9c',       # Teal
+    'ADP': '#34495e',       # Dark Gray
+    'CONJ': '#e67e22',      # Dark Orange
+    'CCONJ': '#e67e22',     # Dark Orange
+    'SCONJ': '#d35400',     # Darker Orange
+    'AUX': '#c0392b',       # Dark Red
+    'NUM': '#16a085',       # Dark Teal
+    'PART': '#7f8c8d',      # Gray
+    'INTJ': '#8e44ad',      # Dark Purple
+    'PUNCT': '#95a5a6',     # Light Gray
+    'SYM': '#7f8c8d',       # Gray
+    'X': '#bdc3c7'          # Very Light Gray
+}
+
+DEFAULT_COLOR = '#95a5a6'
+
+
+def _color_rule(selector, color):
+    return f'{selector}{{color:{color};background-color:{color}22;border:1px solid {color};}}'
+
+
+# .pos-doc wraps the document, .pos-tok is one word box, .pos-w the word and
+# .pos-t the tag label; .pos-t without a tag class gets the default color.
+STYLESHEET = (
+    '<style>'
+    '.pos-doc{font-family:Arial,Helvetica,sans-serif;line-height:2.5;padding:10px;}'
+    '.pos-tok{display:inline-block;margin:8px 4px;text-align:center;vertical-align:top;}'
+    '.pos-w{font-size:16px;font-weight:500;margin-bottom:4px;}'
+    '.pos-t{font-size:11px;font-weight:600;padding:2px 6px;border-radius:3px;}'
+    + _color_rule('.pos-t', DEFAULT_COLOR)
+    + ''.join(_color_rule(f'.pos-{pos}', color) for pos, color in POS_COLORS.items())
+    + '</style>'
+)
+
+DOC_OPEN = STYLESHEET + '<div class="pos-doc">'
+DOC_CLOSE = '</div>'
+TOKEN_OPEN = '<span class="pos-tok"><div class="pos-w">'
+
+# Everything after the word, per tag: '</div><div class="pos-t pos-NOUN">NOUN</div></span>'
+_TAG_CLOSE = {pos: f'</div><div class="pos-t pos-{pos}">{pos}</div></span>' for pos in POS_COLORS}
+
+
+def _tag_close(pos):
+    fragment = _TAG_CLOSE.get(pos)
+    if fragment is None:
+        fragment = f'</div><div class="pos-t">{escape(pos)}</div></span>'
+    return fragment
+
+
+def render(doc, visualize=True):
+    """Build the POS view of a processed Doc in one pass: (pos_tags, html, grouped_tags)."""
+    pos_tags = []
+    grouped_tags = {}
+    parts = [DOC_OPEN] if visualize else None
+
+    for token in doc:
+        text = token.text
+        pos = token.pos_
+        pos_tags.append((text, pos, token.tag_))
+
+        words = grouped_tags.get(pos)
+        if words is None:
+            words = grouped_tags[pos] = []
+        words.append(text)
+
+        if visualize:
+            parts.append(TOKEN_OPEN)
+            parts.append(escape(text))
+            parts.append(_tag_close(pos))
+
+    html = None
+    if visualize:
+        parts.append(DOC_CLOSE)
+        html = ''.join(parts)
+
+    return pos_tags, html, grouped_tags
+
+
+def render_tokens(doc):
+    """The token boxes of a Doc, without the DOC_OPEN / DOC_CLOSE wrapper (one piece of text_utils.iter_pos_html)."""
+    return ''.join(TOKEN_OPEN + escape(token.text) + _tag_close(token.pos_) for token in doc)
+
@@ -0,0 +1,338 @@
+"""
+Romanization engine behind text_utils.romanize_text.
+
+- Script detection runs on compiled regexes instead of a per-character Python
+  loop, and stops as soon as the outcome can no longer change.
+- Each backend (pypinyin, pykakasi, korean_romanizer, transliterate) is
+  imported and set up once per process and reused across calls.
+- Mixed-script text is segmented into script runs; the runs of each script
+  go to their backend in one batched call and the output is reassembled in
+  order (see segment_scripts and romanize).
+- romanize_many() romanizes a batch of texts with one backend call per script
+  for the whole batch; romanize() is a batch of one.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+
+from logconfig import SAMPLED, preview
+
+logger = logging.getLogger(__name__)
+
+# Scripts in detection priority order: when a text contains several, the first wins.
+# (name, character class, method label, backend library)
+SCRIPTS = [
+    ('Chinese', '\u4e00-\u9fff', 'Pinyin (Chinese)', 'pypinyin'),  # CJK Unified Ideographs
+    ('Japanese', '\u3040-\u30ff', 'Romaji (Japanese)', 'pykakasi'),  # Hiragana + Katakana
+    ('Korean', '\uac00-\ud7af', 'Revised Romanization (Korean)', 'korean_romanizer'),  # Hangul syllables
+    ('Cyrillic', '\u0400-\u04ff', 'Transliteration (Cyrillic)', 'transliterate'),
+    ('Arabic', '\u0600-\u06ff', 'Transliteration (Arabic)', 'transliterate'),
+    ('Greek', '\u0370-\u03ff', 'Transliteration (Greek)', 'transliterate'),
+]
+
+SCRIPT_INFO = {name: (method, library) for name, _, method, library in SCRIPTS}
+
+# transliterate language pack used for each script it handles
+TRANSLIT_LANGUAGES = {
+    'Cyrillic': 'ru',  # Russian
+    'Arabic': 'ar',
+    'Greek': 'el',
+}
+
+
+def _script_pattern(scripts):
+    return re.compile('[' + ''.join(char_class for _, char_class, _, _ in scripts) + ']')
+
+
+# _PATTERNS[rank] matches a character of any script ranked higher than (i.e. before)
+# SCRIPTS[rank]; _PATTERNS[len(SCRIPTS)] matches a character of any supported script.
+_PATTERNS = [_script_pattern(SCRIPTS[:rank]) if rank else None for rank in range(len(SCRIPTS) + 1)]
+_RANGES = [(ord(char_class[0]), ord(char_class[2])) for _, char_class, _, _ in SCRIPTS]
+
+
+def _rank_of(char):
+    """Priority rank of the script a matched character belongs to."""
+    code_point = ord(char)
+    for rank, (low, high) in enumerate(_RANGES):
+        if low <= code_point <= high:
+            return rank
+    raise ValueError(f"Character outside the supported scripts: {char!r}")
+
+
+def detect_script(text):
+    """
+    Return the highest-priority script present in text (see SCRIPTS), or None
+    for Latin/unrecognized text.
+
+    The first scan stops at the first non-Latin character. After that only a
+    higher-priority script can change the answer, so the rest of the text is
+    searched for those alone, and the search stops once Chinese (the top
+    priority) is found.
+    """
+    match = _PATTERNS[len(SCRIPTS)].search(text)
+    if match is None:
+        return None
+
+    rank = _rank_of(match.group())
+    while rank > 0:
+        match = _PATTERNS[rank].search(text, match.end())
+        if match is None:
+            break
+        rank = _rank_of(match.group())
+    return SCRIPTS[rank][0]
+
+
+# ============================================================================
+# SEGMENTATION (script runs)
+# ============================================================================
+
+_RUNS = re.compile('|'.join(f'(?P<{name}>[{char_class}]+)' for name, char_class, _, _ in SCRIPTS))
+
+# In-sentence Japanese punctuation (comma, middle dot, brackets) between a Han run and
+# kana doesn't end the Japanese context; sentence ends (。！？) do.
+_CJK_PUNCTUATION = re.compile('[\u3001\u30fb\u300c-\u300f\u3008-\u300b\u3010\u3011\uff08\uff09]*')
+
+
+def segment_scripts(text):
+    """
+    Split text into (script, run) pieces in order. script is None for runs
+    that need no romanization (Latin, digits, spaces, punctuation...).
+
+    Han characters next to kana are kanji and go to the Japanese backend
+    along with that kana; other Han runs are Chinese.
+    """
+    runs = [[match.lastgroup, match.start(), match.end()] for match in _RUNS.finditer(text)]
+
+    def touches_kana(a, b):
+        # True if runs a and b (a before b) are kana + Han with only CJK punctuation between them
+        return (a[0] == 'Japanese' or b[0] == 'Japanese') and \
+            _CJK_PUNCTUATION.fullmatch(text, a[2], b[1]) is not None
+
+    for i, run in enumerate(runs):
+        if run[0] != 'Chinese':
+            continue
+        if (i > 0 and runs[i - 1][0] == 'Japanese' and touches_kana(runs[i - 1], run)) or \
+                (i + 1 < len(runs) and runs[i + 1][0] == 'Japanese' and touches_kana(run, runs[i + 1])):
+            run[0] = 'Japanese'
+
+    segments = []
+    position = 0
+    for script, start, end in runs:
+        if start > position:
+            segments.append((None, text[position:start]))
+        if segments and segments[-1][0] == script and start == position:
+            segments[-1] = (script, segments[-1][1] + text[start:end])
+        else:
+            segments.append((script, text[start:end]))
+        position = end
+    if position < len(text):
+        segments.append((None, text[position:]))
+    return segments
+
+
+# ============================================================================
+# BACKENDS (created once per process)
+# ============================================================================
+
+# Joins the runs of one script into a single backend call. Every backend passes it
+# through untouched as its own token, and it stops cross-run effects such as
+# Korean consonant assimilation.
+RUN_SEPARATOR = '\u241e'
+
+
+def _group_items(items, is_separator):
+    """Split a backend's token list into one group per run."""
+    groups = [[]]
+    for item in items:
+        if is_separator(item):
+            groups.append([])
+        else:
+            groups[-1].append(item)
+    return groups
+
+
+@lru_cache(maxsize=None)
+def get_backend(script):
+    """
+    Return a callable romanizing a list of runs of the given script in one
+    backend call and returning one string per run. The backend library is
+    imported and initialized on first use only; ImportError propagates (and is
+    retried on the next call) if it isn't installed.
+    """
+    if script == 'Chinese':
+        from pypinyin import lazy_pinyin, Style
+
+        def romanize_chinese(runs):
+            items = lazy_pinyin(RUN_SEPARATOR.join(runs), style=Style.TONE)
+            return [' '.join(group) for group in _group_items(items, lambda item: item == RUN_SEPARATOR)]
+
+        return romanize_chinese
+
+    if script == 'Japanese':
+        import pykakasi
+
+        kks = pykakasi.kakasi()
+        lock = threading.Lock()  # one converter instance shared by the job threads
+
+        def romanize_japanese(runs):
+            with lock:
+                items = kks.convert(RUN_SEPARATOR.join(runs))
+            groups = _group_items(items, lambda item: item['orig'] == RUN_SEPARATOR)
+            return [' '.join(item['hepburn'] for item in group) for group in groups]
+
+        return romanize_japanese
+
+    if script == 'Korean':
+        from korean_romanizer.romanizer import Romanizer
+
+        return lambda runs: Romanizer(RUN_SEPARATOR.join(runs)).romanize().split(RUN_SEPARATOR)
+
+    if script in TRANSLIT_LANGUAGES:
+        from transliterate import translit
+
+        lang_code = TRANSLIT_LANGUAGES[script]
+        return lambda runs: translit(RUN_SEPARATOR.join(runs), lang_code, reversed=True).split(RUN_SEPARATOR)
+
+    raise ValueError(f"No romanization backend for script: {script}")
+
+
+def romanize_runs(script, runs):
+    """Romanize all runs of one script with a single backend call (per-run fallback if the output doesn't split cleanly)."""
+    backend = get_backend(script)
+    romanized = backend(runs)
+    if len(romanized) != len(runs):
+        logger.warning("%s backend merged run boundaries; romanizing %d runs one by one", script, len(runs))
+        romanized = [backend([run])[0] for run in runs]
+    return romanized
+
+
+def _separated(left, right):
+    """Whether the end of left and the start of right are already apart (whitespace or punctuation between)."""
+    for char in (left[-1], right[0]):
+        if char.isspace() or unicodedata.category(char).startswith('P'):
+            return True
+    return False
+
+
+def _join_runs(output, converted):
+    """
+    Join the runs of output back into one string. Scripts like Chinese and
+    Japanese don't put spaces between words, so a romanized run is separated
+    from a neighbouring run with a space unless whitespace or punctuation
+    already separates them ('日本語とEnglish' -> 'nihongo to English').
+    """
+    parts = []
+    for index, run in enumerate(output):
+        if parts and run and parts[-1] and (index in converted or index - 1 in converted):
+            if not _separated(parts[-1], run):
+                parts.append(' ')
+        parts.append(run)
+    return ''.join(parts)
+
+
+# ============================================================================
+# PUBLIC API
+# ============================================================================
+
+def romanize(text):
+    """
+    Romanize text segment by segment: each script run goes to its own backend,
+    with all runs of one script sent in a single call, and the output is
+    reassembled in the original order. Unconverted text passes through as is.
+
+    Returns a dict with 'original', 'romanized', 'method' and 'detected_script'
+    ('Mixed (...)' when several scripts are present). A missing backend library
+    or a backend error is reported in the dict rather than raised; in mixed text
+    the runs of the failed script are left unconverted.
+    """
+    return romanize_many([text])[0]
+
+
+def romanize_many(texts):
+    """
+    Romanize a batch of texts like romanize(), with the runs of each script
+    from every text sent to its backend in a single call. Returns a list of
+    result dicts aligned with texts; a backend failure is reported in the
+    result of every text containing that script.
+    """
+    segmented = []  # (segments, scripts) per text
+    batch = {}  # script -> [(text index, segment index)] over the whole batch
+    for position, text in enumerate(texts):
+        segments = segment_scripts(text)
+        runs_by_script = {}
+        for index, (script, run) in enumerate(segments):
+            if script is not None:
+                runs_by_script.setdefault(script, []).append(index)
+
+        # Report scripts in detection priority order
+        scripts = [name for name, _, _, _ in SCRIPTS if name in runs_by_script]
+        logger.debug("Script segmentation: %d segments, scripts: %s", len(segments), scripts or 'Latin/Unknown')
+        segmented.append((segments, scripts))
+        for script in scripts:
+            batch.setdefault(script, []).extend((position, index) for index in runs_by_script[script])
+
+    outputs = [[run for _, run in segments] for segments, _ in segmented]
+    converted = [set() for _ in texts]
+    failures = {}  # script -> (message, missing library or None)
+    for script, _, _, library in SCRIPTS:
+        places = batch.get(script)
+        if not places:
+            continue
+        try:
+            romanized = romanize_runs(script, [outputs[position][index] for position, index in places])
+            for (position, index), run in zip(places, romanized):
+                outputs[position][index] = run
+                converted[position].add(index)
+        except ImportError as e:
+            logger.error("%s not installed: %s", library, e)
+            failures[script] = (f"{library} library not installed", f'missing {library}')
+        except Exception as e:
+            logger.error("Error romanizing %s: %s", script, e)
+            failures[script] = (str(e), None)
+
+    return [_result(text, scripts, output, done, failures)
+            for text, (_, scripts), output, done in zip(texts, segmented, outputs, converted)]
+
+
+def _result(text, scripts, output, converted, failures):
+    """The romanize() result dict for one text, given its converted runs and the batch's failed scripts."""
+    results = {
+        'original': text,
+        'romanized': None,
+        'method': None,
+        'detected_script': None
+    }
+
+    # If no special script detected
+    if not scripts:
+        results['romanized'] = text
+        results['method'] = 'No romanization needed (Latin script or unrecognized script)'
+        results['detected_script'] = 'Latin/Unknown'
+        return results
+
+    methods = [SCRIPT_INFO[script][0] for script in scripts if script not in failures]
+    failed = [(script,) + failures[script] for script in scripts if script in failures]
+
+    if len(scripts) == 1:
+        if failed:
+            # Same report as before segmentation existed
+            script, message, missing = failed[0]
+            results['romanized'] = f"ERROR: {message}"
+            results['method'] = f'Failed - {missing}' if missing else 'Failed'
+            results['detected_script'] = f'{script} (detection successful)'
+            return results
+        results['romanized'] = _join_runs(output, converted)
+        results['method'] = methods[0]
+        results['detected_script'] = scripts[0]
+        return results
+
+    results['romanized'] = _join_runs(output, converted)
+    results['method'] = ' + '.join(methods)
+    results['detected_script'] = f"Mixed ({', '.join(scripts)})"
+    if failed:
+        report = ', '.join(f"{script}: {missing or message}" for script, message, missing in failed)
+        results['method'] = f"Failed - {report}" + (f" (converted: {results['method']})" if methods else '')
+    logger.debug("Romanized mixed text: %s", preview(results['romanized']), extra=SAMPLED)
+    return results
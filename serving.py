@@ -0,0 +1,293 @@
+"""
+Serving mode and per-endpoint request limits (registered by app.create_app()).
+
+Modes (NLP_SERVE_MODE):
+  sync     (default) a request fetches pages and runs spaCy on its own worker thread
+  pooled   page fetches go to a thread pool and NLP work to a process pool, both
+           per gunicorn worker. gunicorn_config.py switches to threaded workers in
+           this mode, so a request waiting on a slow site holds one thread, not a
+           whole worker, and CPU-bound parses run in parallel, outside the GIL of
+           the threads serving requests. If an NLP process dies, run_nlp starts
+           a new NLP pool and retries the work once (503 if it fails again).
+
+Limits, per Flask endpoint (ENDPOINT_LIMITS, DEFAULT_LIMITS for the rest):
+  concurrency  requests an endpoint serves at once per gunicorn worker; further
+               requests get 503 with Retry-After instead of queueing
+  deadline     seconds a request may take. Routes hand work over through
+               run_fetch / run_nlp, which give up waiting at the deadline (504).
+               In pooled mode the work itself is cancelled: queued work is
+               dropped, and a parse still running in an NLP process is
+               interrupted. In sync mode the deadline is only checked between steps.
+  max_bytes    request body limit, checked against Content-Length before the
+               body is read or parsed (413)
+
+Configuration (environment variables):
+  NLP_SERVE_MODE         'sync' (default) or 'pooled'
+  NLP_SERVE_THREADS      request threads per gunicorn worker in pooled mode (default 32)
+  NLP_FETCH_THREADS      fetch threads per gunicorn worker in pooled mode (default 16)
+  NLP_NLP_PROCESSES      NLP processes per gunicorn worker in pooled mode (default 2)
+  NLP_ENDPOINT_LIMITS    JSON overrides, e.g. {"main.web": {"concurrency": 8, "deadline": 15}}
+"""
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import g, jsonify, request
+from werkzeug.exceptions import GatewayTimeout, RequestEntityTooLarge, ServiceUnavailable
+
+logger = logging.getLogger(__name__)
+
+MODE = os.environ.get("NLP_SERVE_MODE", "sync")
+FETCH_THREADS = int(os.environ.get("NLP_FETCH_THREADS", 16))
+NLP_PROCESSES = int(os.environ.get("NLP_NLP_PROCESSES", 2))
+
+_TEXT = {'concurrency': 4, 'deadline': 10.0, 'max_bytes': 1024 * 1024}
+
+DEFAULT_LIMITS = {'concurrency': 32, 'deadline': 30.0, 'max_bytes': 2 * 1024 * 1024}
+ENDPOINT_LIMITS = {
+    # A URL in, a fetch (mostly waiting) then chunked NER
+    'main.web': {'concurrency': 16, 'deadline': 20.0, 'max_bytes': 16 * 1024},
+    'main.ner': _TEXT,
+    'main.pos': _TEXT,
+    'main.semantic': _TEXT,
+    'main.analyze': _TEXT,
+    'main.wordcloud': _TEXT,
+    'api.ner': _TEXT,
+    'api.pos': _TEXT,
+    'api.deps': _TEXT,
+    'api.wordcloud': _TEXT,
+    'api.stats': _TEXT,
+    # One page of a displaCy view, from a stored Doc
+    'main.render_more': {'concurrency': 8, 'deadline': 10.0, 'max_bytes': 16 * 1024},
+    'main.pos_stream': {'concurrency': 2, 'deadline': 60.0, 'max_bytes': 16 * 1024 * 1024},
+    'main.batch': {'concurrency': 2, 'deadline': 120.0, 'max_bytes': 16 * 1024 * 1024},
+    'api.index_entities': {'concurrency': 2, 'deadline': 120.0, 'max_bytes': 16 * 1024 * 1024},
+}
+for _endpoint, _overrides in json.loads(os.environ.get("NLP_ENDPOINT_LIMITS") or "{}").items():
+    ENDPOINT_LIMITS[_endpoint] = dict(ENDPOINT_LIMITS.get(_endpoint, DEFAULT_LIMITS), **_overrides)
+
+
+class Overloaded(ServiceUnavailable):
+    """An endpoint is already serving its concurrency limit of requests."""
+
+
+class DeadlineExceeded(GatewayTimeout):
+    """A request ran past its endpoint's deadline."""
+
+
+class NLPUnavailable(ServiceUnavailable):
+    """The NLP process pool broke again after it was restarted."""
+
+
+def limits(endpoint):
+    """The limits that apply to a Flask endpoint."""
+    return ENDPOINT_LIMITS.get(endpoint, DEFAULT_LIMITS)
+
+
+# ============================================================================
+# REQUEST HOOKS
+# ============================================================================
+
+_slots = {}  # endpoint -> BoundedSemaphore
+_slots_lock = threading.Lock()
+
+
+def _slot(endpoint, concurrency):
+    with _slots_lock:
+        slot = _slots.get(endpoint)
+        if slot is None:
+            slot = _slots[endpoint] = threading.BoundedSemaphore(concurrency)
+        return slot
+
+
+def _enforce_limits():
+    endpoint_limits = limits(request.endpoint)
+
+    # Before anything touches request.form / get_json(), i.e. before the body is read
+    max_bytes = endpoint_limits.get('max_bytes')
+    if max_bytes:
+        if request.content_length is not None and request.content_length > max_bytes:
+            raise RequestEntityTooLarge(f"Request body is limited to {max_bytes} bytes.")
+        request.max_content_length = max_bytes  # bodies without a Content-Length
+
+    deadline = endpoint_limits.get('deadline')
+    g.deadline = time.time() + deadline if deadline else None
+
+    concurrency = endpoint_limits.get('concurrency')
+    if concurrency:
+        slot = _slot(request.endpoint, concurrency)
+        if not slot.acquire(blocking=False):
+            raise Overloaded(f"Too many concurrent requests for {request.path}; retry shortly.",
+                             retry_after=1)
+        g.serving_slot = slot
+
+
+def _release_slot(_exc=None):
+    slot = g.pop('serving_slot', None)
+    if slot is not None:
+        slot.release()
+
+
+def _limit_error(e):
+    response = jsonify({"error": e.description})
+    response.status_code = e.code
+    if isinstance(e, (Overloaded, NLPUnavailable)):
+        response.headers["Retry-After"] = "1"
+    return response
+
+
+def init_app(app):
+    """Register the limit hooks and error handlers on app."""
+    app.before_request(_enforce_limits)
+    app.teardown_request(_release_slot)
+    for error in (Overloaded, DeadlineExceeded, NLPUnavailable, RequestEntityTooLarge):
+        app.register_error_handler(error, _limit_error)
+
+
+# ============================================================================
+# HANDING WORK OVER
+# ============================================================================
+
+def remaining():
+    """Seconds left before the current request's deadline (None: no deadline)."""
+    deadline = g.get('deadline')
+    if deadline is None:
+        return None
+    left = deadline - time.time()
+    if left <= 0:
+        raise DeadlineExceeded(f"Request exceeded its {limits(request.endpoint)['deadline']:g}s deadline.")
+    return left
+
+
+def run_fetch(func, *args, **kwargs):
+    """Run network-bound func(*args, **kwargs) for the current request: in the fetch pool in pooled mode."""
+    remaining()
+    if MODE != 'pooled':
+        return func(*args, **kwargs)
+    return _wait(_pools()[0].submit(func, *args, **kwargs))
+
+
+def run_nlp(func, *args, **kwargs):
+    """
+    Run CPU-bound func(*args, **kwargs) for the current request: in the NLP
+    process pool in pooled mode, where it is interrupted at the deadline.
+    func, its arguments and its result must be picklable.
+    """
+    left = remaining()
+    if MODE != 'pooled':
+        return func(*args, **kwargs)
+    deadline = time.time() + left if left is not None else None
+    for attempt in range(2):
+        nlp_pool = _pools()[1]
+        try:
+            return _wait(nlp_pool.submit(_call_with_deadline, deadline, func, args, kwargs))
+        except BrokenProcessPool:
+            # An NLP process died (killed, out of memory): the pool takes no more
+            # work. Start a new one and retry once; the work itself may be what
+            # killed the process, so a second failure goes back to the client.
+            logger.error("NLP process pool broken (attempt %d), restarting it", attempt + 1)
+            _restart_nlp_pool(nlp_pool)
+    raise NLPUnavailable("The NLP workers failed on this request; retry shortly.", retry_after=1)
+
+
+def _wait(future):
+    deadline = g.get('deadline')
+    try:
+        return future.result(timeout=None if deadline is None else max(deadline - time.time(), 0))
+    except (FutureTimeout, _Interrupted):
+        # Not started yet: dropped from the queue. Running: the NLP process interrupts itself.
+        future.cancel()
+        raise DeadlineExceeded(f"Request exceeded its {limits(request.endpoint)['deadline']:g}s deadline.")
+
+
+# ============================================================================
+# POOLS
+# ============================================================================
+
+_fetch_pool = None
+_nlp_pool = None
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+class _Interrupted(BaseException):
+    # A BaseException, so the `except Exception` handlers in text_utils don't swallow it
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _Interrupted()
+
+
+def _init_nlp_process():
+    # Forked from a gunicorn worker: drop its signal handlers, keep our own alarm
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGQUIT, signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+    from models import get_model
+    get_model()
+
+
+def _call_with_deadline(deadline, func, args, kwargs):
+    """Runs in an NLP process: func(*args, **kwargs), interrupted by SIGALRM at the deadline."""
+    if deadline is not None:
+        left = deadline - time.time()
+        if left <= 0:
+            raise _Interrupted()
+        signal.setitimer(signal.ITIMER_REAL, left)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _noop():
+    return os.getpid()
+
+
+def _pools():
+    """This process's (fetch thread pool, NLP process pool), created on first use after a fork."""
+    global _fetch_pool, _nlp_pool, _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _fetch_pool = ThreadPoolExecutor(max_workers=FETCH_THREADS, thread_name_prefix="fetch")
+            _nlp_pool = _new_nlp_pool()
+            _pools_pid = os.getpid()
+        return _fetch_pool, _nlp_pool
+
+
+def _restart_nlp_pool(broken):
+    """Replace this process's NLP pool with a new one, unless another thread already replaced broken."""
+    global _nlp_pool
+    with _pools_lock:
+        if _nlp_pool is not broken:
+            return
+        _nlp_pool = _new_nlp_pool()
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _new_nlp_pool():
+    # fork: the NLP processes share the model already loaded in this process copy-on-write
+    return ProcessPoolExecutor(max_workers=NLP_PROCESSES, mp_context=multiprocessing.get_context("fork"),
+                               initializer=_init_nlp_process)
+
+
+def start():
+    """
+    Create this process's pools and fork the NLP processes now; gunicorn calls
+    this in each worker before it starts its request threads (forking a process
+    that is already running threads can copy a lock some thread holds).
+    """
+    if MODE != 'pooled':
+        return
+    _, nlp_pool = _pools()
+    pids = {future.result() for future in [nlp_pool.submit(_noop) for _ in range(NLP_PROCESSES)]}
+    logger.info("Serving mode pooled: %d fetch threads, NLP processes %s", FETCH_THREADS, sorted(pids))
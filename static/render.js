@@ -0,0 +1,27 @@
+// "Render more" buttons of the paged displaCy views (see displacy_render.py):
+// fetch the next page and put it in place of the button. The page fetched may
+// end with a button of its own.
+document.addEventListener('click', function (event) {
+    var button = event.target.closest('.render-more button');
+    if (!button) {
+        return;
+    }
+    var container = button.parentNode;
+    button.disabled = true;
+    button.textContent = 'Rendering...';
+
+    fetch(container.dataset.url)
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        })
+        .then(function (html) {
+            container.outerHTML = html;
+        })
+        .catch(function () {
+            button.disabled = false;
+            button.textContent = 'Could not render more; try again';
+        });
+});
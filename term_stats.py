@@ -0,0 +1,259 @@
+"""
+Term statistics: word, bigram and lemma counts, and TF-IDF against a reference corpus.
+
+Counts are taken from spaCy Docs the pipeline has already produced (text_utils
+passes the stored Doc of a text, see doc_store.py), so no second tokenization
+is needed. Per Doc, the token attributes are read as one NumPy array
+(Doc.to_array) and counted with np.unique over their string hashes; strings are
+only looked up for the distinct terms. Many Docs' counts merge into one
+TermCounts (Counters keyed by string, so counts from other processes and
+pipelines merge too), which is how the word cloud, /api/v1/stats and the
+reference corpus are built.
+
+What is counted (the stopword-filtered "content" tokens):
+  unigrams   lowercase forms of alphabetic, non-stopword tokens of 2+ characters
+  bigrams    two such tokens next to each other ("machine learning")
+  lemmas     their lemmas (lowercased; the lowercase form if the pipeline has no lemmatizer)
+  document_frequency  number of documents each unigram and bigram occurs in
+
+TF-IDF scores a text's unigrams against the document frequencies of a
+reference corpus (smoothed idf = ln((1 + N) / (1 + df)) + 1, as scikit-learn
+does). Build one with `python cli.py term-reference INPUT... -o reference.json`.
+
+Configuration (environment variables):
+  NLP_TERM_REFERENCE     reference corpus file for TF-IDF (default: none, no TF-IDF)
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_PATH = os.environ.get("NLP_TERM_REFERENCE") or None
+
+# Minimum length of a counted token, in characters
+MIN_LENGTH = 2
+
+
+class TermCounts:
+    """Term counts over one or more documents; merge with += (or merge())."""
+
+    KINDS = ('unigrams', 'bigrams', 'lemmas')
+
+    # from_docs converts hashes to strings and merges once per this many Docs
+    FLUSH_DOCS = 256
+
+    def __init__(self):
+        self.unigrams = Counter()
+        self.bigrams = Counter()
+        self.lemmas = Counter()
+        self.document_frequency = Counter()
+        self.documents = 0
+        self.tokens = 0          # alphabetic tokens, stopwords included
+        self.content_tokens = 0  # the counted ones
+
+    @classmethod
+    def from_docs(cls, docs):
+        """Count an iterable of Docs from one pipeline (e.g. a stream from nlp.pipe)."""
+        counts = cls()
+        batch = []
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= cls.FLUSH_DOCS:
+                counts.merge(_count_docs(batch))
+                batch = []
+        if batch:
+            counts.merge(_count_docs(batch))
+        return counts
+
+    def merge(self, other):
+        """Add other's counts to these; returns self."""
+        self.unigrams.update(other.unigrams)
+        self.bigrams.update(other.bigrams)
+        self.lemmas.update(other.lemmas)
+        self.document_frequency.update(other.document_frequency)
+        self.documents += other.documents
+        self.tokens += other.tokens
+        self.content_tokens += other.content_tokens
+        return self
+
+    __iadd__ = merge
+
+    def as_document(self):
+        """Count what was merged from the pieces (e.g. chunks) of one text as one document; returns self."""
+        self.documents = 1
+        self.document_frequency = Counter(dict.fromkeys(list(self.unigrams) + list(self.bigrams), 1))
+        return self
+
+    def prune(self, min_df):
+        """Drop the terms found in fewer than min_df documents (keeps a reference corpus file small)."""
+        rare = {term for term, df in self.document_frequency.items() if df < min_df}
+        for counter in (self.unigrams, self.bigrams, self.document_frequency):
+            for term in rare.intersection(counter):
+                del counter[term]
+
+    def top(self, kind='unigrams', n=20):
+        """The n most frequent terms of a kind, as [{'term', 'count'}]."""
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown term kind: {kind}. Expected one of: {', '.join(self.KINDS)}.")
+        return [{'term': term, 'count': count} for term, count in getattr(self, kind).most_common(n)]
+
+    def tfidf(self, reference, n=20):
+        """
+        The n unigrams with the highest TF-IDF against a reference TermCounts,
+        as [{'term', 'score', 'count', 'df'}]. tf is a term's share of the
+        content tokens here.
+        """
+        import numpy as np
+
+        if not self.unigrams or not self.content_tokens:
+            return []
+        terms = list(self.unigrams)
+        counts = np.fromiter((self.unigrams[term] for term in terms), dtype=np.float64, count=len(terms))
+        df = np.fromiter((reference.document_frequency.get(term, 0) for term in terms), dtype=np.float64,
+                         count=len(terms))
+        scores = counts / self.content_tokens * (np.log((1 + reference.documents) / (1 + df)) + 1)
+
+        best = np.argsort(-scores, kind='stable')[:n]
+        return [{'term': terms[i], 'score': round(float(scores[i]), 6), 'count': int(counts[i]), 'df': int(df[i])}
+                for i in best]
+
+    def summary(self, n=20, reference=None):
+        """JSON-ready overview: totals, the top n terms of each kind and (with a reference) TF-IDF."""
+        result = {
+            'documents': self.documents,
+            'tokens': self.tokens,
+            'content_tokens': self.content_tokens,
+            'types': len(self.unigrams),
+        }
+        for kind in self.KINDS:
+            result[kind] = self.top(kind, n)
+        result['tfidf'] = self.tfidf(reference, n) if reference is not None else None
+        return result
+
+    def to_dict(self):
+        data = {kind: dict(getattr(self, kind)) for kind in self.KINDS}
+        data['document_frequency'] = dict(self.document_frequency)
+        data['documents'] = self.documents
+        data['tokens'] = self.tokens
+        data['content_tokens'] = self.content_tokens
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        counts = cls()
+        for kind in cls.KINDS + ('document_frequency',):
+            getattr(counts, kind).update(data.get(kind, {}))
+        counts.documents = data.get('documents', 0)
+        counts.tokens = data.get('tokens', 0)
+        counts.content_tokens = data.get('content_tokens', 0)
+        return counts
+
+    def save(self, path):
+        """Write the counts as JSON (atomically, so a reader never sees half a file)."""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def _count_docs(docs):
+    """Count a list of Docs that share one Vocab: one np.unique per kind over all their tokens."""
+    import numpy as np
+    from spacy.attrs import IS_ALPHA, IS_STOP, LEMMA, LENGTH, LOWER
+
+    counts = TermCounts()
+    counts.documents = len(docs)
+    if not docs:
+        return counts
+
+    lowers, lemmas, pairs, doc_terms, doc_pairs = [], [], [], [], []
+    for doc in docs:
+        if not len(doc):
+            continue
+        array = doc.to_array([LOWER, LEMMA, IS_ALPHA, IS_STOP, LENGTH])
+        alpha = array[:, 2] == 1
+        keep = alpha & (array[:, 3] == 0) & (array[:, 4] >= MIN_LENGTH)
+        counts.tokens += int(alpha.sum())
+
+        lower = array[keep, 0]
+        lemma = array[keep, 1]
+        lowers.append(lower)
+        lemmas.append(np.where(lemma == 0, lower, lemma))  # no lemmatizer in the pipeline
+        doc_terms.append(np.unique(lower))
+
+        # Adjacent content tokens (both kept, nothing dropped in between)
+        adjacent = keep[:-1] & keep[1:]
+        doc_bigrams = np.stack([array[:-1, 0][adjacent], array[1:, 0][adjacent]], axis=1)
+        pairs.append(doc_bigrams)
+        doc_pairs.append(np.unique(doc_bigrams, axis=0))
+
+    if not lowers:
+        return counts
+    strings = docs[0].vocab.strings
+
+    def unigram_counts(arrays, lowercase=False):
+        keys, freqs = np.unique(np.concatenate(arrays), return_counts=True)
+        counter = Counter()
+        for key, freq in zip(keys.tolist(), freqs.tolist()):
+            term = strings[key]
+            counter[term.lower() if lowercase else term] += freq
+        return counter
+
+    def bigram_counts(arrays):
+        rows = np.concatenate(arrays)
+        if not len(rows):
+            return Counter()
+        keys, freqs = np.unique(rows, axis=0, return_counts=True)
+        return Counter({f"{strings[a]} {strings[b]}": freq for (a, b), freq in zip(keys.tolist(), freqs.tolist())})
+
+    counts.unigrams = unigram_counts(lowers)
+    counts.lemmas = unigram_counts(lemmas, lowercase=True)
+    counts.bigrams = bigram_counts(pairs)
+    counts.document_frequency = unigram_counts(doc_terms) + bigram_counts(doc_pairs)
+    counts.content_tokens = sum(len(lower) for lower in lowers)
+    return counts
+
+
+# ============================================================================
+# REFERENCE CORPUS
+# ============================================================================
+
+_reference = None
+_reference_loaded = None  # reference_version() of the loaded file
+_reference_lock = threading.Lock()
+
+
+def reference():
+    """The NLP_TERM_REFERENCE corpus (reloaded when the file changes), or None if none is configured."""
+    global _reference, _reference_loaded
+    if REFERENCE_PATH is None:
+        return None
+    version = reference_version()
+    with _reference_lock:
+        if _reference_loaded != version:
+            _reference = TermCounts.load(REFERENCE_PATH)
+            _reference_loaded = version
+            logger.info("Loaded term reference %s: %d documents, %d terms",
+                        REFERENCE_PATH, _reference.documents, len(_reference.document_frequency))
+        return _reference
+
+
+def reference_version():
+    """Identifies the reference corpus, so cached TF-IDF results are invalidated when it changes."""
+    if REFERENCE_PATH is None:
+        return "none"
+    try:
+        stat = os.stat(REFERENCE_PATH)
+    except OSError:
+        return "missing"
+    return hashlib.sha256(f"{REFERENCE_PATH}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+
@@ -0,0 +1,205 @@
+"""Fetcher and PageCache against a local http.server."""
+import email.utils
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from fetcher import Fetcher, PageCache, PageTooLarge
+
+ETAG = '"v1"'
+LAST_MODIFIED = email.utils.formatdate(1_700_000_000, usegmt=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Each path is one server behaviour; the server counts the requests per path."""
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.request_headers.setdefault(self.path, []).append(dict(self.headers))
+
+        if self.path == '/fresh':
+            self._send(200, b'fresh page', {'Cache-Control': 'max-age=60'})
+        elif self.path == '/plain':
+            self._send(200, b'plain page', {})
+        elif self.path == '/etag':
+            if self.headers.get('If-None-Match') == ETAG:
+                self._send(304, None, {'ETag': ETAG, 'Cache-Control': 'no-cache'})
+            else:
+                self._send(200, b'etag page', {'ETag': ETAG, 'Cache-Control': 'no-cache'})
+        elif self.path == '/last-modified':
+            if self.headers.get('If-Modified-Since') == LAST_MODIFIED:
+                self._send(304, None, {'Last-Modified': LAST_MODIFIED, 'Cache-Control': 'no-cache'})
+            else:
+                self._send(200, b'dated page', {'Last-Modified': LAST_MODIFIED, 'Cache-Control': 'no-cache'})
+        elif self.path == '/no-store':
+            self._send(200, b'secret page', {'Cache-Control': 'no-store'})
+        elif self.path == '/large':
+            self._send(200, b'x' * 4096, {})
+        elif self.path == '/large-unsized':
+            # No Content-Length: the size is only known while reading the body
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(b'x' * 4096)
+        elif self.path == '/error':
+            self._send(500, b'broken', {})
+        elif self.path == '/slow':
+            time.sleep(1.0)
+            self._send(200, b'slow page', {})
+        elif self.path.startswith('/concurrent/'):
+            with server.lock:
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+            time.sleep(0.2)
+            with server.lock:
+                server.active -= 1
+            self._send(200, self.path.encode(), {'Cache-Control': 'no-store'})
+        else:
+            self._send(404, b'not found', {})
+
+    def _send(self, status, body, headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body is not None:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.hits = {}
+    httpd.request_headers = {}
+    httpd.active = 0
+    httpd.max_active = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def fetcher(tmp_path):
+    return Fetcher(cache_dir=str(tmp_path / 'pages'), timeout=5)
+
+
+def test_fresh_page_is_served_from_cache(server, fetcher):
+    first = fetcher.fetch(server.url + '/fresh')
+    second = fetcher.fetch(server.url + '/fresh')
+
+    assert first.content == second.content == b'fresh page'
+    assert not first.from_cache
+    assert second.from_cache
+    assert server.hits['/fresh'] == 1
+
+
+def test_default_ttl_applies_without_cache_headers(server, tmp_path):
+    fresh = Fetcher(cache_dir=str(tmp_path / 'fresh'), default_ttl=60, timeout=5)
+    assert fresh.fetch(server.url + '/plain').from_cache is False
+    assert fresh.fetch(server.url + '/plain').from_cache is True
+    assert server.hits['/plain'] == 1
+
+    expired = Fetcher(cache_dir=str(tmp_path / 'expired'), default_ttl=0, timeout=5)
+    expired.fetch(server.url + '/plain')
+    second = expired.fetch(server.url + '/plain')  # stale, nothing to revalidate with
+    assert second.from_cache is False
+    assert second.content == b'plain page'
+    assert server.hits['/plain'] == 3
+
+
+def test_etag_revalidation(server, fetcher):
+    first = fetcher.fetch(server.url + '/etag')
+    second = fetcher.fetch(server.url + '/etag')
+
+    assert not first.from_cache
+    assert second.from_cache
+    assert second.content == b'etag page'
+    assert server.hits['/etag'] == 2
+    assert server.request_headers['/etag'][1].get('If-None-Match') == ETAG
+
+
+def test_last_modified_revalidation(server, fetcher):
+    fetcher.fetch(server.url + '/last-modified')
+    second = fetcher.fetch(server.url + '/last-modified')
+
+    assert second.from_cache
+    assert second.content == b'dated page'
+    assert server.request_headers['/last-modified'][1].get('If-Modified-Since') == LAST_MODIFIED
+
+
+def test_no_store_is_not_cached(server, fetcher):
+    url = server.url + '/no-store'
+    assert fetcher.fetch(url).content == b'secret page'
+    assert fetcher.fetch(url).from_cache is False
+
+    assert server.hits['/no-store'] == 2
+    assert fetcher.cache.get(url) is None
+
+
+def test_http_error_raises(server, fetcher):
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch(server.url + '/error')
+    assert fetcher.cache.get(server.url + '/error') is None
+
+
+def test_timeout_raises(server, tmp_path):
+    fetcher = Fetcher(cache_dir=str(tmp_path / 'pages'), timeout=0.2)
+    with pytest.raises(requests.Timeout):
+        fetcher.fetch(server.url + '/slow')
+
+
+@pytest.mark.parametrize('path', ['/large', '/large-unsized'])
+def test_page_over_max_bytes_raises(server, tmp_path, path):
+    fetcher = Fetcher(cache_dir=str(tmp_path / 'pages'), timeout=5, max_bytes=1024)
+    with pytest.raises(PageTooLarge):
+        fetcher.fetch(server.url + path)
+    assert fetcher.cache.get(server.url + path) is None
+
+    assert fetcher.fetch_many([server.url + path, server.url + '/plain'])[0] is None
+    assert Fetcher(cache_dir=str(tmp_path / 'big'), timeout=5, max_bytes=4096).fetch(server.url + path).content == b'x' * 4096
+
+
+def test_fetch_many_returns_none_for_failures(server, fetcher):
+    results = fetcher.fetch_many([server.url + '/fresh', server.url + '/error', 'http://127.0.0.1:1/refused'])
+
+    assert results[0].content == b'fresh page'
+    assert results[1] is None
+    assert results[2] is None
+
+
+def test_fetch_many_limits_requests_per_host(server, tmp_path):
+    fetcher = Fetcher(cache_dir=str(tmp_path / 'pages'), per_host_limit=2, timeout=5)
+    urls = [f"{server.url}/concurrent/{i}" for i in range(8)]
+
+    results = fetcher.fetch_many(urls, max_workers=8)
+
+    assert [result.content for result in results] == [f"/concurrent/{i}".encode() for i in range(8)]
+    assert server.max_active == 2
+
+
+def test_page_cache_prunes_oldest_pages(tmp_path):
+    cache = PageCache(str(tmp_path), max_bytes=10)
+    cache.put('http://a/', {'expires': 0}, b'123456')
+    time.sleep(0.01)
+    cache.put('http://b/', {'expires': 0}, b'123456')
+
+    cache.prune()
+
+    assert cache.get('http://a/') is None
+    assert cache.get('http://b/')[1] == b'123456'
@@ -0,0 +1,71 @@
+"""The stream and lxml engines against the bs4 reference."""
+import glob
+import os
+
+import pytest
+
+import html_extract
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'fixtures', 'pages')
+PAGES = sorted(glob.glob(os.path.join(FIXTURES, '*.html')))
+
+SNIPPETS = [
+    b'<p>before<template><div>hidden <b>text</b></div>tail</template>after</p>',
+    b'<div>a<script>var x = "<p>no</p>";</script>b<style>p {}</style>c</div>',
+    b'<header>menu</header><main><nav><a>link</a></nav>body &amp; soul</main><footer>foot</footer>',
+    b'<p>unclosed <b>bold <i>italic</p> after',
+    b'<p>x<!-- comment -->y<?pi target?>z</p>',
+]
+
+# libxml2 reads a CDATA section in HTML as a comment
+STREAM_ONLY_SNIPPETS = [
+    b'<p>x<![CDATA[cdata]]>z</p>',
+]
+
+
+def reference(content):
+    return html_extract.clean_whitespace(html_extract._extract_bs4(content))
+
+
+def engine_text(engine, content):
+    return html_extract.clean_whitespace(html_extract.ENGINES[engine](content))
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('path', PAGES, ids=os.path.basename)
+@pytest.mark.parametrize('engine', ['stream', 'lxml'])
+def test_fixture_pages_match_bs4(engine, path):
+    if engine == 'lxml':
+        pytest.importorskip('lxml')
+    content = read(path)
+    assert engine_text(engine, content) == reference(content)
+
+
+@pytest.mark.parametrize('content', SNIPPETS)
+@pytest.mark.parametrize('engine', ['stream', 'lxml'])
+def test_snippets_match_bs4(engine, content):
+    if engine == 'lxml':
+        pytest.importorskip('lxml')
+    assert engine_text(engine, content) == reference(content)
+
+
+@pytest.mark.parametrize('content', STREAM_ONLY_SNIPPETS)
+def test_stream_snippets_match_bs4(content):
+    assert engine_text('stream', content) == reference(content)
+
+
+def test_template_content_is_dropped():
+    assert engine_text('stream', SNIPPETS[0]) == 'before after'
+
+
+def test_fixtures_exist():
+    assert PAGES
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        html_extract.extract_text.__wrapped__(b'<p>x</p>', engine='regex')
@@ -1,68 +1,659 @@
-import spacy
+import re
 import logging
-from spacy import displacy
-from html import escape
-from wordcloud import WordCloud
-import matplotlib
-matplotlib.use('Agg')  # Use non-GUI backend
-import matplotlib.pyplot as plt
+import time
 import base64
 from io import BytesIO
-import requests
-from bs4 import BeautifulSoup
+from random import Random
+from cache import cached
+import displacy_render
+import doc_store
+import entity_index
+from gazetteer import gazetteer_version, get_gazetteer, resolve_ner_mode
+from logconfig import SAMPLED, preview
+from html_extract import extract_text
+from metrics import observe_component, stage
+from models import get_model, model_version
+import pos_render
+from romanization import romanize
+import term_stats
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+# Logging is configured by app.create_app() (see logconfig.py), not on import
+logger = logging.getLogger(__name__)
 
-# Try to load the spaCy model for NER and POS
-try:
-    logging.debug("Loading spaCy model...")
-    nlp = spacy.load("en_core_web_sm")
-    logging.debug("spaCy model loaded successfully.")
-except Exception as e:
-    logging.error(f"Error loading spaCy model: {e}")
-    nlp = None  # If spaCy model fails to load, set nlp to None.
+# spaCy, displaCy, wordcloud and requests are imported inside the functions that
+# use them, and the spaCy model is loaded on first use (see models.py), so
+# importing this module is cheap. Under gunicorn they are preloaded in the master.
+#
+# Every spaCy-backed function takes model=None: the name of the pipeline to use
+# (routed per request by models.select_model); None means models.DEFAULT_MODEL.
+
+
+def __getattr__(name):
+    # Backwards-compatible `text_utils.nlp`: the default model, loaded on first access
+    if name == 'nlp':
+        return get_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _model_version(model=None, ner_mode=None, **_options):
+    """Identify the model a result comes from so cached results are invalidated when it changes."""
+    if resolve_ner_mode(ner_mode) == 'statistical':
+        return model_version(model)
+    # Gazetteer results also change with the term list
+    return f"{model_version(model)}+{gazetteer_version()}"
+
+
+# spaCy components each task needs. Anything else in the pipeline is disabled
+# for that call. Components that listen to a shared tok2vec pull it in
+# automatically (see _disabled_components).
+TASK_COMPONENTS = {
+    'ner': ('ner',),
+    # Most non-English pipelines set coarse POS with a morphologizer instead
+    'pos': ('tagger', 'morphologizer', 'attribute_ruler'),
+    # displaCy's dependency view labels every token with its POS, so the
+    # tagger stays on for the parse as well.
+    'deps': ('parser', 'tagger', 'morphologizer', 'attribute_ruler'),
+    # Term statistics count lemmas; rule-based lemmatizers look at the POS
+    'terms': ('lemmatizer', 'tagger', 'morphologizer', 'attribute_ruler'),
+}
+
+
+def _disabled_components(nlp, tasks):
+    """Return the pipeline components that none of the given tasks need."""
+    needed = set()
+    for task in tasks:
+        needed.update(TASK_COMPONENTS[task])
+
+    # Pull in shared embedding layers (e.g. tok2vec) that a needed component listens to
+    for name, component in nlp.pipeline:
+        listeners = getattr(component, 'listening_components', None) or []
+        if needed.intersection(listeners):
+            needed.add(name)
+
+    return [name for name in nlp.pipe_names if name not in needed]
+
+
+def _ner_setup(nlp, ner_mode=None, model=None):
+    """
+    The (tasks, gazetteer) an NER call runs in the given mode (see gazetteer.py):
+    statistical runs the ner component, gazetteer only the gazetteer, and
+    hybrid the gazetteer followed by the ner component.
+    """
+    mode = resolve_ner_mode(ner_mode)
+    if mode == 'statistical':
+        return ('ner',), None
+    gazetteer = get_gazetteer(nlp, model_name=model)
+    return (('ner',) if mode == 'hybrid' else ()), gazetteer
+
+
+def _run_pipeline(nlp, text, tasks, gazetteer=None, enable=()):
+    """
+    Process text with only the components the given tasks need (plus any
+    named in enable). Runs the components one by one (as nlp(text) does) so
+    each can be timed. A gazetteer, if given, sets the Doc's entities before
+    any component runs.
+    """
+    disabled = set(_disabled_components(nlp, tasks)) - set(enable)
+    with stage('spacy', size=len(text)):
+        start = time.perf_counter()
+        doc = nlp.make_doc(text)
+        observe_component('tokenizer', time.perf_counter() - start)
+        if gazetteer is not None:
+            start = time.perf_counter()
+            gazetteer.annotate(doc)
+            observe_component('gazetteer', time.perf_counter() - start)
+        for name, component in nlp.pipeline:
+            if name in disabled:
+                continue
+            start = time.perf_counter()
+            doc = component(doc)
+            observe_component(name, time.perf_counter() - start)
+    return doc
+
+
+def _pipe(nlp, texts, tasks, batch_size=64, as_tuples=False, gazetteer=None):
+    """
+    nlp.pipe(texts) with only the components the given tasks need, running
+    the components batch by batch so each can be timed, as _run_pipeline does
+    for one text (a batch's time is spread over its Docs). With as_tuples,
+    texts are (text, context) pairs and (doc, context) pairs are yielded. A
+    gazetteer, if given, sets each Doc's entities before any component runs.
+    """
+    from spacy.util import minibatch
+
+    disabled = set(_disabled_components(nlp, tasks))
+    components = [(name, component) for name, component in nlp.pipeline if name not in disabled]
+    for batch in minibatch(texts, size=batch_size):
+        contexts = None
+        if as_tuples:
+            batch, contexts = zip(*batch)
+        start = time.perf_counter()
+        docs = [nlp.make_doc(text) for text in batch]
+        observe_component('tokenizer', time.perf_counter() - start, docs=len(docs))
+        if gazetteer is not None:
+            start = time.perf_counter()
+            for doc in docs:
+                gazetteer.annotate(doc)
+            observe_component('gazetteer', time.perf_counter() - start, docs=len(docs))
+        for name, component in components:
+            start = time.perf_counter()
+            if hasattr(component, 'pipe'):
+                docs = list(component.pipe(docs, batch_size=batch_size))
+            else:
+                docs = [component(doc) for doc in docs]
+            observe_component(name, time.perf_counter() - start, docs=len(docs))
+        if as_tuples:
+            yield from zip(docs, contexts)
+        else:
+            yield from docs
+
+
+def _processed_doc(nlp, text, tasks, model=None):
+    """
+    A Doc of text processed with (at least) the components the given tasks
+    need: the stored one if the doc store has it (see doc_store.py), otherwise
+    a fresh parse, which is then stored. A re-parse also runs the components
+    the previously stored Doc had, so a text's stored Doc only gains annotations.
+    """
+    if not doc_store.ENABLED:
+        return _run_pipeline(nlp, text, tasks)
+
+    store = doc_store.doc_store
+    version = model_version(model)
+    disabled = _disabled_components(nlp, tasks)
+    needed = [name for name in nlp.pipe_names if name not in disabled]
+    with stage('doc_store', size=len(text)):
+        doc = store.get(text, nlp.vocab, version, needed)
+    if doc is not None:
+        return doc
+
+    stored = store.components(text, version).intersection(nlp.pipe_names)
+    doc = _run_pipeline(nlp, text, tasks, enable=stored)
+    with stage('doc_store'):
+        store.put(text, doc, version, stored.union(needed))
+    return doc
+
+
+# ============================================================================
+# DOC VIEWS (shared by the single-task extractors and analyze_text)
+# ============================================================================
+
+def _dependency_visualization(doc, model=None):
+    """
+    The first page of the dep view of doc, a Doc from _processed_doc (so in
+    the doc store already, for the later pages), see displacy_render.
+    """
+    key = doc_store.DocStore.make_key(doc.text, model_version(model))
+    with stage('displacy'):
+        return displacy_render.render(doc, key, model=model, continuable=doc_store.ENABLED)
+
+
+def _entity_visualization(text, ents, version, model=None):
+    """
+    The first page of the ent view of text with (start, end, label) entities,
+    see displacy_render. The text and entities are kept in the doc store
+    under version, so the later pages can be rendered, if there are any.
+    """
+    key = doc_store.DocStore.make_key(text, version)
+    continuable = doc_store.ENABLED
+    with stage('displacy'):
+        if continuable and len(displacy_render.entity_page_ranges(text, ents)) > 1:
+            if not doc_store.doc_store.has(key):
+                doc_store.doc_store.put_entities(text, ents, version)
+        return displacy_render.render_entities(text, ents, key, model=model, continuable=continuable)
+
+
+def render_page(key, view, page=0, model=None):
+    """
+    A further page of a displaCy view (see displacy_render), for the "Render
+    more" continuation. Returns None if the view's source is no longer in the
+    doc store or the page doesn't exist.
+    """
+    html = displacy_render.cached_page(key, view, page, model)
+    if html is not None:
+        return html
+
+    try:
+        if view == 'ent':
+            source = doc_store.doc_store.load_entities(key)
+            if source is None:
+                return None
+            with stage('displacy'):
+                return displacy_render.render_entities(*source, key, page, model=model)
+
+        nlp = get_model(model)
+        if nlp is None:
+            logger.error("spaCy model is not loaded.")
+            raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+        doc = doc_store.doc_store.load(key, nlp.vocab)
+        if doc is None:
+            return None
+        with stage('displacy'):
+            return displacy_render.render(doc, key, page, model=model)
+    except IndexError:
+        return None
+
+
+def _entities_from_doc(doc, visualize=True, model=None, ner_mode=None):
+    """Build the NER view of a processed Doc: (entities, displacy_html). See _entity_visualization."""
+    # Extract named entities (entity text and their labels)
+    entities = [(ent.text, ent.label_) for ent in doc.ents]
+
+    # Generate the displacy HTML for the named entities
+    html = None
+    if visualize:
+        html = _entity_visualization(*displacy_render.entity_source(doc), _entities_version(model, ner_mode), model)
+
+    return entities, html
+
+
+def _pos_tags_from_doc(doc, visualize=False):
+    """Build the POS view of a processed Doc: (pos_tags, html, grouped_tags). See pos_render."""
+    with stage('pos_render'):
+        return pos_render.render(doc, visualize=visualize)
+
+
+def _dependencies_from_doc(doc, visualize=True, model=None):
+    """Build the dependency view of a processed Doc (from _processed_doc): (dependencies, displacy_html)."""
+    # Extract dependency information: (token, dependency_label, head_token)
+    dependencies = [(token.text, token.dep_, token.head.text) for token in doc]
+
+    # Generate the displacy HTML for dependency visualization
+    html = None
+    if visualize:
+        html = _dependency_visualization(doc, model)
+
+    return dependencies, html
+
+
+def _doc_entity_spans(doc):
+    """(start, end, label, text) for each entity of a processed Doc."""
+    return [(ent.start_char, ent.end_char, ent.label_, ent.text) for ent in doc.ents]
+
+
+def _index_entities(text, spans):
+    """Record a processed document's entities in the entity index (see entity_index.py)."""
+    if not entity_index.ENABLED:
+        return
+    try:
+        with stage('entity_index'):
+            entity_index.entity_index.add_document(text, spans)
+    except Exception as e:
+        # The index is a by-product; never fail the request over it
+        logger.error("Could not index entities: %s", e)
+
+
+def record_entity_source(text, source):
+    """Tag an indexed document with where it came from (e.g. the URL of a fetched page)."""
+    if not entity_index.ENABLED:
+        return
+    try:
+        entity_index.entity_index.set_source(text, source)
+    except Exception as e:
+        logger.error("Could not record entity source: %s", e)
+
+
+# ============================================================================
+# COMPACT RECORDS (JSON API: character offsets, no HTML unless asked for)
+# ============================================================================
+
+def _pos_records(doc):
+    """One {text, pos, tag, start, end} dict per token."""
+    return [
+        {'text': token.text, 'pos': token.pos_, 'tag': token.tag_,
+         'start': token.idx, 'end': token.idx + len(token.text)}
+        for token in doc
+    ]
+
+
+def _dependency_records(doc):
+    """One {i, text, dep, head, start, end} dict per token; head is the head token's index."""
+    return [
+        {'i': token.i, 'text': token.text, 'dep': token.dep_, 'head': token.head.i,
+         'start': token.idx, 'end': token.idx + len(token.text)}
+        for token in doc
+    ]
+
+
+@cached('records', version=_model_version)
+def extract_records(text, task, visualize=False, model=None, ner_mode=None):
+    """
+    Run one task ('ner', 'pos' or 'deps') and return a compact, JSON-ready dict:
+      - ner:  {'entities': [{text, label, start, end}, ...]}
+      - pos:  {'tokens': [{text, pos, tag, start, end}, ...]}
+      - deps: {'tokens': [{i, text, dep, head, start, end}, ...]}
+    Offsets are character offsets into text. An 'html' visualization is only
+    rendered and included when visualize=True. ner_mode picks the NER mode
+    (see gazetteer.py). Returns None on error.
+    """
+    logger.debug("Extracting %s records for text of length: %d", task, len(text))
+
+    try:
+        if task == 'ner':
+            # Chunked, so long inputs never build one huge Doc
+            with stage('spacy_chunked', size=len(text)):
+                spans = list(iter_entity_spans(text, model=model, ner_mode=ner_mode))
+            _index_entities(text, spans)
+            result = {'entities': [
+                {'text': ent_text, 'label': label, 'start': start, 'end': end}
+                for start, end, label, ent_text in spans
+            ]}
+            if visualize:
+                result['html'] = _entities_html(text, spans, model, ner_mode)
+            return result
+
+        if task not in ('pos', 'deps'):
+            raise ValueError(f"Unknown task: {task}")
+
+        nlp = get_model(model)
+        if nlp is None:
+            logger.error("spaCy model is not loaded.")
+            raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+
+        doc = _processed_doc(nlp, text, (task,), model)
+        if task == 'pos':
+            result = {'tokens': _pos_records(doc)}
+            if visualize:
+                result['html'] = _pos_tags_from_doc(doc, visualize=True)[1]
+        else:
+            result = {'tokens': _dependency_records(doc)}
+            if visualize:
+                result['html'] = _dependencies_from_doc(doc, visualize=True, model=model)[1]
+        return result
+
+    except Exception as e:
+        logger.error("Error in extract_records: %s", e)
+        return None
+
+
+# ============================================================================
+# COMBINED ANALYSIS (one pipeline run, every view)
+# ============================================================================
+
+def analyze_text(text, visualize=False, model=None):
+    """
+    Run the spaCy pipeline once and build the NER, POS and dependency views
+    from that single Doc.
+
+    Returns a dict with the same shapes the single-task extractors return:
+      - entities, ent_html
+      - pos_tags, pos_html, grouped_tags
+      - dependencies, dep_html
+    The *_html values are None unless visualize=True. Returns None on error.
+    """
+    logger.debug("Starting combined analysis...")
+
+    try:
+        nlp = get_model(model)
+        if nlp is None:
+            logger.error("spaCy model is not loaded.")
+            raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+
+        logger.debug("Processing text for combined analysis: %s", preview(text), extra=SAMPLED)
+        doc = _processed_doc(nlp, text, ('ner', 'pos', 'deps'), model)
+
+        entities, ent_html = _entities_from_doc(doc, visualize=visualize, model=model)
+        _index_entities(text, _doc_entity_spans(doc))
+        pos_tags, pos_html, grouped_tags = _pos_tags_from_doc(doc, visualize=visualize)
+        dependencies, dep_html = _dependencies_from_doc(doc, visualize=visualize, model=model)
+
+        logger.debug("Combined analysis completed.")
+        return {
+            'entities': entities,
+            'ent_html': ent_html,
+            'pos_tags': pos_tags,
+            'pos_html': pos_html,
+            'grouped_tags': grouped_tags,
+            'dependencies': dependencies,
+            'dep_html': dep_html,
+        }
+
+    except Exception as e:
+        logger.error("Error in analyze_text: %s", e)
+        return None
+
+
+# ============================================================================
+# BATCH ANALYSIS (nlp.pipe over many texts)
+# ============================================================================
+
+def _doc_results(doc, tasks):
+    """Collect the requested task results for one processed Doc (no HTML)."""
+    result = {}
+    if 'ner' in tasks:
+        result['entities'], _ = _entities_from_doc(doc, visualize=False)
+        _index_entities(doc.text, _doc_entity_spans(doc))
+    if 'pos' in tasks:
+        result['pos_tags'], _, _ = _pos_tags_from_doc(doc)
+    if 'deps' in tasks:
+        result['dependencies'], _ = _dependencies_from_doc(doc, visualize=False)
+    return result
+
+
+def iter_analyze_batch(texts, tasks=('ner', 'pos', 'deps'), batch_size=64, n_process=1, model=None):
+    """
+    Stream texts through nlp.pipe and yield one result dict per text, in order.
+
+    Only the components the requested tasks need are run. texts may be any
+    iterable (e.g. a generator reading a file), so memory stays bounded by
+    batch_size rather than corpus size. With n_process > 1, spaCy's own
+    worker processes run the pipeline, and its components aren't timed.
+    """
+    nlp = get_model(model)
+    if nlp is None:
+        logger.error("spaCy model is not loaded.")
+        raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+
+    unknown = [task for task in tasks if task not in TASK_COMPONENTS]
+    if unknown:
+        raise ValueError(f"Unknown task(s): {', '.join(unknown)}")
+
+    if n_process > 1:
+        docs = nlp.pipe(
+            texts,
+            disable=_disabled_components(nlp, tasks),
+            batch_size=batch_size,
+            n_process=n_process,
+        )
+    else:
+        docs = _pipe(nlp, texts, tasks, batch_size=batch_size)
+    for doc in docs:
+        yield _doc_results(doc, tasks)
+
+
+def analyze_batch(texts, tasks=('ner', 'pos', 'deps'), batch_size=64, n_process=1, model=None):
+    """
+    Analyze many texts in one nlp.pipe run.
+
+    Returns a list with one dict per input text containing the requested
+    'entities', 'pos_tags' and/or 'dependencies', or None on error.
+    """
+    logger.debug("Starting batch analysis (tasks=%s, batch_size=%d, n_process=%d)...", tasks, batch_size, n_process)
+
+    try:
+        with stage('spacy_batch'):
+            results = list(iter_analyze_batch(texts, tasks=tasks, batch_size=batch_size, n_process=n_process, model=model))
+        logger.debug("Batch analysis completed for %d texts.", len(results))
+        return results
+
+    except Exception as e:
+        logger.error("Error in analyze_batch: %s", e)
+        return None
 
 
 # ============================================================================
 # NAMED ENTITY RECOGNITION (NER)
 # ============================================================================
 
-def extract_named_entities(text):
-    """Extract named entities from the text using spaCy and generate displacy visualization."""
-    logging.debug("Starting NER extraction...")
+@cached('ner', version=_model_version)
+def extract_named_entities(text, model=None, ner_mode=None):
+    """
+    Extract named entities from the text using spaCy and generate displacy visualization.
+    ner_mode is 'statistical', 'gazetteer' or 'hybrid' (see gazetteer.py).
+    """
+    logger.debug("Starting NER extraction...")
     
     try:
         # Check if spaCy model is loaded
+        nlp = get_model(model)
         if nlp is None:
-            logging.error("spaCy model is not loaded.")
+            logger.error("spaCy model is not loaded.")
             raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
         
-        logging.debug(f"Processing text for NER: {text!r}")
-        doc = nlp(text)  # Process the text
+        logger.debug("Processing text for NER: %s", preview(text), extra=SAMPLED)
+        tasks, gazetteer = _ner_setup(nlp, ner_mode, model)
+        if gazetteer is None:
+            doc = _processed_doc(nlp, text, tasks, model)  # Process the text (or reuse its stored Doc)
+        else:
+            doc = _run_pipeline(nlp, text, tasks, gazetteer=gazetteer)
         
-        # Extract named entities (entity text and their labels)
-        entities = [(ent.text, ent.label_) for ent in doc.ents]
-        
-        # Generate the displacy HTML for the named entities
-        html = displacy.render(doc, style="ent", page=True)
+        entities, html = _entities_from_doc(doc, model=model, ner_mode=ner_mode)
+        _index_entities(text, _doc_entity_spans(doc))
 
-        logging.debug(f"Named entities extracted: {entities}")
-        logging.debug("Displacy visualization generated for NER.")
+        logger.debug("Named entities extracted: %s", preview(entities), extra=SAMPLED)
+        logger.debug("Displacy visualization generated for NER.")
 
         return entities, html
 
     except Exception as e:
         # Handle errors gracefully
-        logging.error(f"Error in extract_named_entities: {e}")
+        logger.error("Error in extract_named_entities: %s", e)
         return None, None
 
 
+# ============================================================================
+# LONG DOCUMENTS (chunked NER)
+# ============================================================================
+
+# Long inputs are cut into chunks of at most this many characters before NER,
+# so no single Doc grows with the page and spaCy's max_length is never hit.
+CHUNK_MAX_CHARS = 10000
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _last_break(window, min_cut):
+    """Return the cut position in window: paragraph > sentence > whitespace > hard cut."""
+    for pattern, lowest in ((_PARAGRAPH_BREAK, min_cut), (_SENTENCE_END, min_cut), (_WHITESPACE, 1)):
+        cut = 0
+        for match in pattern.finditer(window, lowest):
+            cut = match.end()
+        if cut:
+            return cut
+    return len(window)
+
+
+def _entities_version(model=None, ner_mode=None):
+    # Doc store version of the entity sources _entity_visualization keeps for paging, apart from parsed Docs
+    return f"{_model_version(model=model, ner_mode=ner_mode)}+ents"
+
+
+def _entities_html(text, spans, model=None, ner_mode=None):
+    """
+    The entity view of text from (start, end, label, text) spans, e.g. stitched
+    from chunks: drawn from the text and the offsets, without a Doc of the text.
+    """
+    ents = [(start, end, label) for start, end, label, _ in spans]
+    return _entity_visualization(text, ents, _entities_version(model, ner_mode), model)
+
+
+def iter_text_chunks(text, max_chars=CHUNK_MAX_CHARS):
+    """
+    Yield (offset, chunk) pieces of text, each at most max_chars long.
+
+    Chunks end at a paragraph break if there is one in the second half of the
+    window, otherwise at a sentence end, otherwise at whitespace. Text with no
+    whitespace at all is hard-cut. The separators stay at the end of the chunk,
+    so offset + a position in the chunk is the position in text.
+    """
+    start = 0
+    length = len(text)
+    while start < length:
+        if length - start <= max_chars:
+            yield start, text[start:]
+            return
+        window = text[start:start + max_chars]
+        cut = _last_break(window, max_chars // 2)
+        yield start, window[:cut]
+        start += cut
+
+
+def iter_entity_spans(text, max_chars=CHUNK_MAX_CHARS, batch_size=4, model=None, ner_mode=None):
+    """
+    Stream text through the NER pipeline chunk by chunk.
+
+    Yields (start, end, label, entity_text) with character offsets in the
+    coordinates of the full text. Only batch_size chunk Docs are alive at once.
+    ner_mode picks the NER mode (see gazetteer.py).
+    """
+    nlp = get_model(model)
+    if nlp is None:
+        logger.error("spaCy model is not loaded.")
+        raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+
+    tasks, gazetteer = _ner_setup(nlp, ner_mode, model)
+    chunks = ((chunk, offset) for offset, chunk in iter_text_chunks(text, max_chars))
+    docs = _pipe(nlp, chunks, tasks, batch_size=batch_size, as_tuples=True, gazetteer=gazetteer)
+    for doc, offset in docs:
+        for ent in doc.ents:
+            yield offset + ent.start_char, offset + ent.end_char, ent.label_, ent.text
+
+
+@cached('ner_chunked', version=_model_version)
+def extract_named_entities_chunked(text, max_chars=CHUNK_MAX_CHARS, model=None, ner_mode=None):
+    """
+    Extract named entities from text of any length, chunking it at paragraph
+    or sentence boundaries. Returns (entities, html) like extract_named_entities.
+    """
+    logger.debug("Starting chunked NER extraction for text of length: %d", len(text))
+
+    try:
+        with stage('spacy_chunked', size=len(text)):
+            spans = list(iter_entity_spans(text, max_chars=max_chars, model=model, ner_mode=ner_mode))
+        entities = [(ent_text, label) for _, _, label, ent_text in spans]
+        _index_entities(text, spans)
+
+        # Render from the stitched offsets; the full text is never tokenized as a whole
+        html = _entities_html(text, spans, model, ner_mode)
+
+        logger.debug("Chunked NER found %d entities.", len(entities))
+        return entities, html
+
+    except Exception as e:
+        logger.error("Error in extract_named_entities_chunked: %s", e)
+        return None, None
+
+
+def index_texts(texts, sources=None, model=None, ner_mode=None):
+    """
+    Add documents to the entity index, running NER only on those not indexed
+    yet. sources (optional, aligned with texts) are e.g. the pages' URLs.
+    Returns the document ids, aligned with texts.
+    """
+    index = entity_index.entity_index
+    sources = sources or [None] * len(texts)
+    ids = []
+    for text, source in zip(texts, sources):
+        doc_id = index.document_id(text)
+        if doc_id is None:
+            with stage('spacy_chunked', size=len(text)):
+                spans = list(iter_entity_spans(text, model=model, ner_mode=ner_mode))
+            doc_id = index.add_document(text, spans, source=source)
+        elif source:
+            index.set_source(text, source)
+        ids.append(doc_id)
+    logger.debug("Indexed %d texts", len(ids))
+    return ids
+
+
 # ============================================================================
 # PART-OF-SPEECH (POS) TAGGING
 # ============================================================================
 
-def extract_pos_tags(text, visualize=False):
+@cached('pos', version=_model_version)
+def extract_pos_tags(text, visualize=False, model=None):
     """
     Perform POS tagging on the given text.
 
@@ -71,152 +662,273 @@ def extract_pos_tags(text, visualize=False):
       - html: HTML string with color-coded POS tags under each word
       - grouped_tags: dictionary grouping words by POS category
     """
-    logging.debug("Starting POS tagging...")
+    logger.debug("Starting POS tagging...")
     try:
+        nlp = get_model(model)
         if nlp is None:
-            logging.error("spaCy model is not loaded.")
+            logger.error("spaCy model is not loaded.")
             raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
         
-        logging.debug(f"Processing text for POS tagging: {text!r}")
-        doc = nlp(text)
-
-        # Create a list of token-level POS information
-        pos_tags = [(token.text, token.pos_, token.tag_) for token in doc]
-        logging.debug(f"POS tags extracted: {pos_tags}")
-
-        # Color mapping for different POS categories
-        pos_colors = {
-            'NOUN': '#3498db',      # Blue
-            'PROPN': '#2980b9',     # Dark Blue
-            'VERB': '#e74c3c',      # Red
-            'ADJ': '#2ecc71',       # Green
-            'ADV': '#f39c12',       # Orange
-            'PRON': '#9b59b6',      # Purple
-            'DET': '#1abc9c',       # Teal
-            'ADP': '#34495e',       # Dark Gray
-            'CONJ': '#e67e22',      # Dark Orange
-            'CCONJ': '#e67e22',     # Dark Orange
-            'SCONJ': '#d35400',     # Darker Orange
-            'AUX': '#c0392b',       # Dark Red
-            'NUM': '#16a085',       # Dark Teal
-            'PART': '#7f8c8d',      # Gray
-            'INTJ': '#8e44ad',      # Dark Purple
-            'PUNCT': '#95a5a6',     # Light Gray
-            'SYM': '#7f8c8d',       # Gray
-            'X': '#bdc3c7'          # Very Light Gray
-        }
+        logger.debug("Processing text for POS tagging: %s", preview(text), extra=SAMPLED)
+        doc = _processed_doc(nlp, text, ('pos',), model)
 
-        html = None
-        grouped_tags = {}
-        
-        if visualize:
-            # Create inline word display with tags underneath
-            token_spans = []
-            for token in doc:
-                t = escape(token.text)
-                pos = escape(token.pos_)
-                color = pos_colors.get(token.pos_, '#95a5a6')
-                
-                token_spans.append(
-                    f'<span style="display:inline-block;margin:8px 4px;text-align:center;vertical-align:top;">'
-                    f'<div style="font-size:16px;font-weight:500;margin-bottom:4px;">{t}</div>'
-                    f'<div style="font-size:11px;font-weight:600;color:{color};'
-                    f'background-color:{color}22;padding:2px 6px;border-radius:3px;'
-                    f'border:1px solid {color};">{pos}</div>'
-                    f'</span>'
-                )
-            
-            html = '<div style="font-family:Arial,Helvetica,sans-serif;line-height:2.5;padding:10px;">' + ''.join(token_spans) + '</div>'
-        
-        # Group words by POS type
-        for token in doc:
-            pos_type = token.pos_
-            if pos_type not in grouped_tags:
-                grouped_tags[pos_type] = []
-            grouped_tags[pos_type].append(token.text)
-
-        logging.debug("POS tagging completed.")
+        pos_tags, html, grouped_tags = _pos_tags_from_doc(doc, visualize=visualize)
+        logger.debug("POS tags extracted: %s", preview(pos_tags), extra=SAMPLED)
+
+        logger.debug("POS tagging completed.")
         return pos_tags, html, grouped_tags
 
     except Exception as e:
-        logging.error(f"Error in extract_pos_tags: {e}")
+        logger.error("Error in extract_pos_tags: %s", e)
         return None, None, None
 
 
+def pos_html_chunks(chunks, model=None):
+    """
+    The POS token HTML of each of chunks (consecutive pieces of one text, see
+    iter_text_chunks), tagged in one nlp.pipe run. A list, so it can be
+    returned from an NLP process (serving.run_nlp).
+    """
+    nlp = get_model(model)
+    if nlp is None:
+        raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+    docs = _pipe(nlp, chunks, ('pos',), batch_size=len(chunks) or 1)
+    return [pos_render.render_tokens(doc) for doc in docs]
+
+
+def iter_pos_html(text, max_chars=CHUNK_MAX_CHARS, batch_size=4, model=None, run=None):
+    """
+    Yield the POS visualization of text incrementally: the text is tagged
+    chunk by chunk (see iter_text_chunks), batch_size chunks at a time, and
+    each chunk's HTML is yielded as soon as it is ready, for a chunked response
+    on long documents. run(func, *args, **kwargs) runs the tagging of a batch
+    (e.g. serving.run_nlp; default: in this thread).
+    """
+    nlp = get_model(model)
+    if nlp is None:
+        logger.error("spaCy model is not loaded.")
+        raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+    if run is None:
+        run = _run_here
+
+    def pieces():
+        yield pos_render.DOC_OPEN
+        batch = []
+        for _, chunk in iter_text_chunks(text, max_chars):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield from run(pos_html_chunks, batch, model=model)
+                batch = []
+        if batch:
+            yield from run(pos_html_chunks, batch, model=model)
+        yield pos_render.DOC_CLOSE
+
+    return pieces()
+
+
+def _run_here(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
 # ============================================================================
 # SEMANTIC PARSING / DEPENDENCY PARSING
 # ============================================================================
 
-def extract_dependencies(text):
+@cached('deps', version=_model_version)
+def extract_dependencies(text, model=None):
     """Extract dependency parse information from text using spaCy."""
-    logging.debug("Starting dependency parsing...")
+    logger.debug("Starting dependency parsing...")
     
     try:
+        nlp = get_model(model)
         if nlp is None:
-            logging.error("spaCy model is not loaded.")
+            logger.error("spaCy model is not loaded.")
             raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
         
-        logging.debug(f"Processing text for dependency parsing: {text!r}")
-        doc = nlp(text)
-        
-        # Extract dependency information: (token, dependency_label, head_token)
-        dependencies = [(token.text, token.dep_, token.head.text) for token in doc]
+        logger.debug("Processing text for dependency parsing: %s", preview(text), extra=SAMPLED)
+        doc = _processed_doc(nlp, text, ('deps',), model)
         
-        # Generate the displacy HTML for dependency visualization
-        html = displacy.render(doc, style="dep", page=True)
+        dependencies, html = _dependencies_from_doc(doc)
         
-        logging.debug(f"Dependencies extracted: {dependencies}")
-        logging.debug("Displacy dependency visualization generated.")
+        logger.debug("Dependencies extracted: %s", preview(dependencies), extra=SAMPLED)
+        logger.debug("Displacy dependency visualization generated.")
         
         return dependencies, html
         
     except Exception as e:
-        logging.error(f"Error in extract_dependencies: {e}")
+        logger.error("Error in extract_dependencies: %s", e)
         return None, None
 
 
+# ============================================================================
+# TERM STATISTICS
+# ============================================================================
+
+def _term_stats_version(**options):
+    # TF-IDF results also change with the reference corpus
+    return f"{_model_version(**options)}+{term_stats.reference_version()}"
+
+
+def _term_tasks(nlp):
+    # Without a lemmatizer there are no lemmas to tag for: the tokenizer is enough
+    return ('terms',) if 'lemmatizer' in nlp.pipe_names else ()
+
+
+def term_counts(texts, model=None, batch_size=64):
+    """
+    Merged term_stats.TermCounts of many texts, streamed through nlp.pipe
+    (the doc store is bypassed, so a large corpus doesn't flush it).
+    """
+    nlp = get_model(model)
+    if nlp is None:
+        logger.error("spaCy model is not loaded.")
+        raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+
+    docs = _pipe(nlp, texts, _term_tasks(nlp), batch_size=batch_size)
+    with stage('term_counts'):
+        return term_stats.TermCounts.from_docs(docs)
+
+
+def _text_term_counts(text, model=None, batch_size=4):
+    """
+    TermCounts of one text: counted from its stored Doc (see _processed_doc)
+    if it fits in one chunk, otherwise chunk by chunk (see iter_text_chunks),
+    so a long text never becomes one Doc and nlp.max_length doesn't apply.
+    """
+    nlp = get_model(model)
+    if nlp is None:
+        logger.error("spaCy model is not loaded.")
+        raise ValueError("spaCy model is not loaded. Please ensure the model is correctly installed.")
+
+    if len(text) <= CHUNK_MAX_CHARS:
+        doc = _processed_doc(nlp, text, _term_tasks(nlp), model)
+        with stage('term_counts', size=len(text)):
+            return term_stats.TermCounts.from_docs([doc])
+
+    chunks = (chunk for _, chunk in iter_text_chunks(text))
+    with stage('term_counts', size=len(text)):
+        counts = term_stats.TermCounts.from_docs(_pipe(nlp, chunks, _term_tasks(nlp), batch_size=batch_size))
+    return counts.as_document()
+
+
+@cached('term_stats', version=_term_stats_version)
+def compute_term_stats(text, top=20, model=None):
+    """
+    Term statistics of text (see term_stats.TermCounts.summary): token totals,
+    the top unigrams, bigrams and lemmas, and TF-IDF against the reference
+    corpus if one is configured. Returns None on error.
+    """
+    logger.debug("Computing term statistics...")
+
+    try:
+        counts = _text_term_counts(text, model)
+        return counts.summary(top, reference=term_stats.reference())
+
+    except Exception as e:
+        logger.error("Error in compute_term_stats: %s", e)
+        return None
+
+
+def compute_term_stats_many(texts, top=20, model=None):
+    """Term statistics of several texts counted as one corpus (document_frequency per text). None on error."""
+    logger.debug("Computing term statistics for %d texts...", len(texts))
+
+    try:
+        return term_counts(texts, model).summary(top, reference=term_stats.reference())
+
+    except Exception as e:
+        logger.error("Error in compute_term_stats_many: %s", e)
+        return None
+
+
 # ============================================================================
 # WORD CLOUD GENERATION
 # ============================================================================
 
-def generate_wordcloud(text, max_words=100, background_color='white'):
-    """Generate a word cloud from text and return as base64 encoded image."""
-    logging.debug("Starting word cloud generation...")
+# Output formats generate_wordcloud can encode: format name -> (Pillow format, MIME type)
+WORDCLOUD_FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+
+def _viridis_color_func(word, font_size, position, orientation, random_state=None, **kwargs):
+    """
+    Same colors as WordCloud(colormap='viridis'), but looks the colormap up in
+    matplotlib's registry instead of going through matplotlib.pyplot, whose
+    import WordCloud would otherwise pay on first render.
+    """
+    from matplotlib import colormaps
+
+    if random_state is None:
+        random_state = Random()
+    r, g, b, _ = (max(0.0, 255 * c) for c in colormaps['viridis'](random_state.uniform(0, 1)))
+    return "rgb({:.0f}, {:.0f}, {:.0f})".format(r, g, b)
+
+
+# Bigrams drawn as one phrase once they occur this often (WordCloud's collocations)
+WORDCLOUD_BIGRAM_MIN_COUNT = 2
+
+
+@cached('wordfreq', version=_model_version)
+def compute_word_frequencies(text, model=None):
+    """
+    Word frequencies to draw: the lemma counts of text's content words plus
+    its recurring bigrams, from the same term counts as compute_term_stats
+    (see _text_term_counts). Cached, so re-rendering the same text
+    with other display options doesn't count it again.
+    """
+    counts = _text_term_counts(text, model)
+    with stage('word_frequencies', size=len(text)):
+        frequencies = dict(counts.lemmas)
+        frequencies.update((bigram, count) for bigram, count in counts.bigrams.items()
+                           if count >= WORDCLOUD_BIGRAM_MIN_COUNT)
+        return frequencies
+
+
+def generate_wordcloud(text, max_words=100, background_color='white', width=800, height=400, image_format='png',
+                       model=None):
+    """Generate a word cloud from text and return it as a base64 encoded PNG or WebP image."""
+    logger.debug("Starting word cloud generation...")
     
     try:
         if not text or len(text.strip()) == 0:
-            logging.error("Empty text provided for word cloud")
+            logger.error("Empty text provided for word cloud")
+            return None
+
+        if image_format not in WORDCLOUD_FORMATS:
+            logger.error("Unsupported word cloud format: %s", image_format)
             return None
         
-        logging.debug(f"Generating word cloud for text of length: {len(text)}")
+        logger.debug("Generating word cloud for text of length: %d", len(text))
+
+        frequencies = compute_word_frequencies(text, model=model)
+        if not frequencies:
+            logger.error("No words left to draw after tokenization")
+            return None
         
         # Create word cloud
-        wordcloud = WordCloud(
-            width=800, 
-            height=400,
-            background_color=background_color,
-            max_words=max_words,
-            colormap='viridis'  # Nice color scheme
-        ).generate(text)
-        
-        # Create matplotlib figure
-        fig, ax = plt.subplots(figsize=(10, 5))
-        ax.imshow(wordcloud, interpolation='bilinear')
-        ax.axis('off')
-        plt.tight_layout(pad=0)
-        
-        # Convert to base64 for HTML embedding
-        buffer = BytesIO()
-        plt.savefig(buffer, format='png', bbox_inches='tight')
-        buffer.seek(0)
-        image_base64 = base64.b64encode(buffer.read()).decode()
-        plt.close(fig)
-        
-        logging.debug("Word cloud generated successfully")
+        from wordcloud import WordCloud
+        with stage('wordcloud_layout'):
+            wordcloud = WordCloud(
+                width=width, 
+                height=height,
+                background_color=background_color,
+                max_words=max_words,
+                color_func=_viridis_color_func  # Nice color scheme
+            ).generate_from_frequencies(frequencies)
+        
+        # Encode the rendered PIL image directly and convert to base64 for HTML embedding
+        with stage('image_encode'):
+            buffer = BytesIO()
+            wordcloud.to_image().save(buffer, format=WORDCLOUD_FORMATS[image_format][0])
+            image_base64 = base64.b64encode(buffer.getvalue()).decode()
+        
+        logger.debug("Word cloud generated successfully")
         return image_base64
         
     except Exception as e:
-        logging.error(f"Error generating word cloud: {e}")
+        logger.error("Error generating word cloud: %s", e)
         return None
 
 
@@ -225,207 +937,87 @@ def generate_wordcloud(text, max_words=100, background_color='white'):
 # ============================================================================
 
 def fetch_website_text(url):
-    """Fetch and extract text content from a URL."""
-    logging.debug(f"Fetching content from URL: {url}")
+    """
+    Fetch and extract text content from a URL; returns None if it can't be fetched or parsed.
+    Raises fetcher.PageTooLarge for a page over the fetcher's size limit so callers can say so.
+    """
+    import requests
+    from fetcher import PageTooLarge, default_fetcher
+
+    logger.debug("Fetching content from URL: %s", url)
     
     try:
-        # Add headers to mimic a browser request
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Fetch the webpage
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # Raise an error for bad status codes
-        
-        # Parse HTML content
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style", "nav", "header", "footer"]):
-            script.decompose()
-        
-        # Get text
-        text = soup.get_text(separator=' ', strip=True)
-        
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
+        # Fetch the webpage through the pooled session and page cache
+        with stage('fetch'):
+            page = default_fetcher().fetch(url)
+
+        # Strip markup (engine chosen by NLP_HTML_ENGINE; cleaned text is cached per page)
+        with stage('html_extract', size=len(page.content)):
+            text = extract_text(page.content)
         
-        logging.debug(f"Successfully fetched {len(text)} characters from URL")
+        logger.debug("Successfully fetched %d characters from URL (cached: %s)", len(text), page.from_cache)
         return text
         
+    except PageTooLarge as e:
+        logger.error("Not fetching URL: %s", e)
+        raise
     except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching URL: {e}")
+        logger.error("Error fetching URL: %s", e)
         return None
     except Exception as e:
-        logging.error(f"Error processing webpage: {e}")
+        logger.error("Error processing webpage: %s", e)
         return None
 
 
+def fetch_websites_text(urls, max_workers=8):
+    """
+    Fetch many URLs concurrently and extract their text.
+    Returns a list aligned with urls; failed URLs map to None.
+    """
+    from fetcher import default_fetcher
+
+    logger.debug("Fetching content from %d URLs", len(urls))
+
+    texts = []
+    for url, page in zip(urls, default_fetcher().fetch_many(urls, max_workers=max_workers)):
+        if page is None:
+            texts.append(None)
+            continue
+        try:
+            texts.append(extract_text(page.content))
+        except Exception as e:
+            logger.error("Error processing webpage %s: %s", url, e)
+            texts.append(None)
+    return texts
+
+
 # ============================================================================
 # ROMANIZATION
 # ============================================================================
 
+def _romanization_succeeded(result):
+    """Only cache romanizations that didn't fail (missing backend, backend error)."""
+    return result is not None and not result['method'].startswith(('Failed', 'Error'))
+
+
+@cached('romanize', should_cache=_romanization_succeeded)
 def romanize_text(text):
     """
     Romanize text from various scripts to Latin script.
     Supports Chinese (Pinyin), Japanese (Romaji), Korean, Cyrillic, Arabic, Greek, etc.
     """
-    logging.debug(f"Starting romanization for text: {text[:100]}...")
+    logger.debug("Starting romanization for text: %s", preview(text), extra=SAMPLED)
     
     try:
-        results = {
-            'original': text,
-            'romanized': None,
-            'method': None,
-            'detected_script': None
-        }
-        
-        # Detect script type - check each character
-        has_chinese = False
-        has_japanese = False
-        has_korean = False
-        has_cyrillic = False
-        has_arabic = False
-        has_greek = False
-        
-        for char in text:
-            code_point = ord(char)
-            if 0x4E00 <= code_point <= 0x9FFF:  # CJK Unified Ideographs
-                has_chinese = True
-            elif (0x3040 <= code_point <= 0x309F) or (0x30A0 <= code_point <= 0x30FF):  # Hiragana or Katakana
-                has_japanese = True
-            elif 0xAC00 <= code_point <= 0xD7AF:  # Hangul
-                has_korean = True
-            elif 0x0400 <= code_point <= 0x04FF:  # Cyrillic
-                has_cyrillic = True
-            elif 0x0600 <= code_point <= 0x06FF:  # Arabic
-                has_arabic = True
-            elif 0x0370 <= code_point <= 0x03FF:  # Greek
-                has_greek = True
-        
-        logging.debug(f"Script detection - Chinese: {has_chinese}, Japanese: {has_japanese}, Korean: {has_korean}")
-        
-        # Chinese (Pinyin)
-        if has_chinese:
-            try:
-                from pypinyin import lazy_pinyin, Style
-                romanized = ' '.join(lazy_pinyin(text, style=Style.TONE))
-                results['romanized'] = romanized
-                results['method'] = 'Pinyin (Chinese)'
-                results['detected_script'] = 'Chinese'
-                logging.debug(f"Romanized Chinese: {romanized[:100]}")
-                return results
-            except ImportError as e:
-                logging.error(f"pypinyin not installed: {e}")
-                results['romanized'] = "ERROR: pypinyin library not installed"
-                results['method'] = 'Failed - missing pypinyin'
-                results['detected_script'] = 'Chinese (detection successful)'
-                return results
-            except Exception as e:
-                logging.error(f"Error romanizing Chinese: {e}")
-                results['romanized'] = f"ERROR: {str(e)}"
-                results['method'] = 'Failed'
-                results['detected_script'] = 'Chinese (detection successful)'
-                return results
-        
-        # Japanese (Romaji)
-        if has_japanese:
-            try:
-                import pykakasi
-                kks = pykakasi.kakasi()
-                result = kks.convert(text)
-                romanized = ' '.join([item['hepburn'] for item in result])
-                results['romanized'] = romanized
-                results['method'] = 'Romaji (Japanese)'
-                results['detected_script'] = 'Japanese'
-                logging.debug(f"Romanized Japanese: {romanized[:100]}")
-                return results
-            except ImportError as e:
-                logging.error(f"pykakasi not installed: {e}")
-                results['romanized'] = "ERROR: pykakasi library not installed"
-                results['method'] = 'Failed - missing pykakasi'
-                results['detected_script'] = 'Japanese (detection successful)'
-                return results
-            except Exception as e:
-                logging.error(f"Error romanizing Japanese: {e}")
-                results['romanized'] = f"ERROR: {str(e)}"
-                results['method'] = 'Failed'
-                results['detected_script'] = 'Japanese (detection successful)'
-                return results
-        
-        # Korean (Revised Romanization)
-        if has_korean:
-            try:
-                from korean_romanizer.romanizer import Romanizer
-                r = Romanizer(text)
-                romanized = r.romanize()
-                results['romanized'] = romanized
-                results['method'] = 'Revised Romanization (Korean)'
-                results['detected_script'] = 'Korean'
-                logging.debug(f"Romanized Korean: {romanized[:100]}")
-                return results
-            except ImportError as e:
-                logging.error(f"korean_romanizer not installed: {e}")
-                results['romanized'] = "ERROR: korean_romanizer library not installed"
-                results['method'] = 'Failed - missing korean_romanizer'
-                results['detected_script'] = 'Korean (detection successful)'
-                return results
-            except Exception as e:
-                logging.error(f"Error romanizing Korean: {e}")
-                results['romanized'] = f"ERROR: {str(e)}"
-                results['method'] = 'Failed'
-                results['detected_script'] = 'Korean (detection successful)'
-                return results
-        
-        # Cyrillic, Arabic, Greek - use transliterate library
-        if has_cyrillic or has_arabic or has_greek:
-            try:
-                from transliterate import translit
-                
-                if has_cyrillic:
-                    lang_code = 'ru'  # Russian
-                    script_name = 'Cyrillic'
-                elif has_arabic:
-                    lang_code = 'ar'  # Arabic
-                    script_name = 'Arabic'
-                elif has_greek:
-                    lang_code = 'el'  # Greek
-                    script_name = 'Greek'
-                
-                romanized = translit(text, lang_code, reversed=True)
-                results['romanized'] = romanized
-                results['method'] = f'Transliteration ({script_name})'
-                results['detected_script'] = script_name
-                logging.debug(f"Romanized {script_name}: {romanized[:100]}")
-                return results
-            except ImportError as e:
-                logging.error(f"transliterate not installed: {e}")
-                results['romanized'] = "ERROR: transliterate library not installed"
-                results['method'] = f'Failed - missing transliterate'
-                results['detected_script'] = f'{script_name} (detection successful)'
-                return results
-            except Exception as e:
-                logging.error(f"transliterate library error: {e}")
-                results['romanized'] = f"ERROR: {str(e)}"
-                results['method'] = 'Failed'
-                results['detected_script'] = script_name
-                return results
-        
-        # If no special script detected
-        results['romanized'] = text
-        results['method'] = 'No romanization needed (Latin script or unrecognized script)'
-        results['detected_script'] = 'Latin/Unknown'
-        
-        return results
+        with stage('romanize', size=len(text)):
+            return romanize(text)
         
     except Exception as e:
-        logging.error(f"Error in romanize_text: {e}")
+        logger.error("Error in romanize_text: %s", e)
         return {
             'original': text,
             'romanized': f"ERROR: {str(e)}",
             'method': 'Error occurred',
             'detected_script': 'Error'
         }
+